@@ -0,0 +1,155 @@
+# ---------------------------------------------------------------------------
+# asset_pipeline.py
+#
+# Step-by-step overview:
+# 1. Walks every catalogued stem (audio_clips/<theme>/*.wav) via the stem catalog
+# 2. Transcodes each unique stem (by content hash) to Ogg/Opus at several bitrates
+#    with ffmpeg, plus a WAV fallback copy
+# 3. Names outputs by content hash (audio_clips/_assets/<hash>.<bitrate>k.opus) so
+#    they can be served with long-lived cache headers; identical stems share files
+# 4. Writes audio_clips/_assets/manifest.json mapping "theme/stem.wav" to its variants
+#     - Stems whose hash and variant files are unchanged are skipped on rebuild
+# 5. Provides load_manifest()/stem_sources() so mix_and_transition can hand the
+#    frontend compressed sources instead of bare WAV filenames
+#
+# Usage:
+#   python asset_pipeline.py [--base-dir audio_clips] [--bitrates 64 96 160] [--workers 4]
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from stem_catalog import get_catalog
+
+ASSETS_DIRNAME = "_assets"
+MANIFEST_FILENAME = "manifest.json"
+DEFAULT_BITRATES = (64, 96, 160)
+DEFAULT_BITRATE = 96
+MANIFEST_VERSION = 1
+_HASH_LEN = 16
+
+def _variant_specs(content_hash, bitrates, include_wav=True):
+    """
+    Returns [(relative src, format, bitrate)] for one stem, relative to the base dir.
+    """
+    name = content_hash[:_HASH_LEN]
+    specs = [(f"{ASSETS_DIRNAME}/{name}.{kbps}k.opus", "opus", kbps) for kbps in sorted(bitrates)]
+    if include_wav:
+        specs.append((f"{ASSETS_DIRNAME}/{name}.wav", "wav", None))
+    return specs
+
+def _transcode_opus(src_path, dst_path, kbps):
+    """
+    Encodes one WAV to Ogg/Opus at the given bitrate (needs the ffmpeg binary).
+    Writes to a temporary name first so a crash never leaves a truncated asset.
+    """
+    import ffmpeg
+    tmp_path = dst_path + ".tmp"
+    (
+        ffmpeg
+        .input(src_path)
+        .output(tmp_path, format="ogg", acodec="libopus", audio_bitrate=f"{kbps}k")
+        .run(quiet=True, overwrite_output=True)
+    )
+    os.replace(tmp_path, dst_path)
+
+def _build_variant(src_path, dst_path, fmt, kbps):
+    if fmt == "opus":
+        _transcode_opus(src_path, dst_path, kbps)
+    else:
+        tmp_path = dst_path + ".tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    return dst_path
+
+def build_assets(base_dir="audio_clips", bitrates=DEFAULT_BITRATES, include_wav=True, workers=4):
+    """
+    Builds (or incrementally updates) compressed stem variants and the manifest.
+    Returns counts of built and skipped variant files.
+    """
+    catalog = get_catalog(base_dir, max_age=0)
+    assets_dir = os.path.join(catalog.base_dir, ASSETS_DIRNAME)
+    os.makedirs(assets_dir, exist_ok=True)
+
+    stems = {}
+    jobs = {}
+    skipped = 0
+    for theme in catalog.themes():
+        for record in catalog.stems(theme):
+            variants = []
+            for src, fmt, kbps in _variant_specs(record.content_hash, bitrates, include_wav):
+                dst_path = os.path.join(catalog.base_dir, src)
+                variants.append({"src": src, "format": fmt, "bitrate": kbps})
+                if os.path.exists(dst_path):
+                    skipped += 1
+                elif dst_path not in jobs:
+                    # Identical content in several themes is encoded once
+                    jobs[dst_path] = (os.path.join(catalog.base_dir, record.path), dst_path, fmt, kbps)
+            stems[record.path] = {"hash": record.content_hash, "variants": variants}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda job: _build_variant(*job), jobs.values()))
+
+    for entry in stems.values():
+        for variant in entry["variants"]:
+            variant["bytes"] = os.path.getsize(os.path.join(catalog.base_dir, variant["src"]))
+    manifest = {"version": MANIFEST_VERSION, "stems": stems}
+    manifest_path = os.path.join(assets_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return {"built": len(jobs), "skipped": skipped, "stems": len(stems)}
+
+_manifest_cache = {}
+
+def load_manifest(base_dir="audio_clips"):
+    """
+    Returns the asset manifest for base_dir (re-read only when the file changes), or None.
+    """
+    path = os.path.join(os.path.normpath(base_dir), ASSETS_DIRNAME, MANIFEST_FILENAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+def stem_sources(manifest, filename, bitrate=DEFAULT_BITRATE):
+    """
+    Returns the ordered source list for one stem ("theme/stem.wav"): the Opus variant
+    closest to the requested bitrate, then the WAV fallback. Falls back to [filename]
+    if the stem is not in the manifest.
+    """
+    entry = (manifest or {}).get("stems", {}).get(filename)
+    if not entry:
+        return [filename]
+    opus = [v for v in entry["variants"] if v["format"] == "opus"]
+    sources = []
+    if opus:
+        sources.append(min(opus, key=lambda v: abs(v["bitrate"] - bitrate))["src"])
+    sources += [v["src"] for v in entry["variants"] if v["format"] == "wav"]
+    return sources or [filename]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build compressed, content-hashed stem assets.")
+    parser.add_argument("--base-dir", default="audio_clips", help="Stem root directory")
+    parser.add_argument("--bitrates", type=int, nargs="+", default=list(DEFAULT_BITRATES),
+                        help="Opus bitrates in kbps")
+    parser.add_argument("--no-wav", action="store_true", help="Skip the WAV fallback copies")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel ffmpeg processes")
+    args = parser.parse_args(argv)
+    result = build_assets(args.base_dir, args.bitrates, not args.no_wav, args.workers)
+    print(json.dumps(result))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# ---------------------------------------------------------------------------
+# batch_runner.py
+#
+# Step-by-step overview:
+# 1. Reads a JSONL stream of schemas.Event records (one per line)
+# 2. Maps each event to a target theme with stems (boss flag -> bosscombat, or combat
+#    if bosscombat has no stems; else event.state)
+# 3. Resolves the next intent for each theme change through the LLM advisor
+#    or the deterministic local planner (plan_local_intent)
+# 4. Renders each transition with stem_renderer on a process pool, through the shared
+#    rendered-transition cache (render_cache) so repeated transitions are not re-rendered
+#     - At most max_inflight renders are queued (backpressure on the event reader)
+#     - Results are written in event order
+#     - Invalid intents, stems missing from the catalog and failed renders are
+#       recorded per event in the summary instead of aborting the batch
+# 5. Writes SessionLogEntry records (JSONL) and a throughput/latency summary (JSON)
+#
+# Usage:
+#   python batch_runner.py events.jsonl --out renders/ --workers 4 [--advisor llm]
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pydantic import ValidationError
+from schemas import Event, MusicalIntent, SessionLogEntry, local_now
+from llm_advisor import plan_local_intent
+from intensity_engine import event_theme
+from stem_renderer import render_transition
+from render_cache import DEFAULT_CACHE_DIR, RenderCache
+from stem_catalog import get_catalog
+
+def read_events(path):
+    """
+    Lazily yields validated Event objects from a JSONL file (blank lines are skipped).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield Event.model_validate_json(line)
+
+def stem_dicts_from_intent(intent, theme):
+    """
+    Converts an LLM-format intent (activestems/targetgains/fadedurations) to mixer stem dicts.
+    """
+    return [
+        {
+            "filename": f"{theme}/{stem_name}.wav",
+            "targetgain": intent.get("targetgains", {}).get(stem_name, 0.8),
+            "fadeduration": intent.get("fadedurations", {}).get(stem_name, 2.0),
+        }
+        for stem_name in intent.get("activestems", [])
+    ]
+
+def musical_intent_from_dict(intent, theme):
+    """
+    Builds a MusicalIntent from an LLM-format intent dict, stamping the current time
+    if the intent carries no usable timestamp.
+    """
+    timestamp = intent.get("timestamp")
+    try:
+        timestamp = datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        timestamp = local_now()
+    return MusicalIntent(
+        theme=theme,
+        active_stems=list(intent.get("activestems", [])),
+        target_gains=dict(intent.get("targetgains", {})),
+        fade_durations=dict(intent.get("fadedurations", {})),
+        timestamp=timestamp,
+    )
+
+def _render_job(job):
+    """
+    Process-pool worker: renders one transition to WAV and reports its timing.
+    """
+    index, current_stems, next_stems, base_dir, output_path, cache_dir = job
+    started = time.perf_counter()
+    cache = RenderCache(cache_dir) if cache_dir else None
+    render_transition(current_stems, next_stems, base_dir=base_dir, output_path=output_path, cache=cache)
+    return {"index": index, "path": output_path, "bytes": os.path.getsize(output_path),
+            "render_seconds": time.perf_counter() - started}
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "max": max(values) if values else None,
+    }
+
+def run_batch(events, out_dir,
+              base_dir="audio_clips",
+              advisor=None,
+              workers=None,
+              max_inflight=None,
+              start_theme=None,
+              cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Runs an event stream end to end and returns the summary dict.
+    - advisor: None for the local planner, or an object with recommend_sync()/recommend()
+      returning {"next_intent": ...} (e.g. AsyncLLMAdvisor)
+    - workers/max_inflight: process pool size and the render backlog bound
+    - cache_dir: shared RenderCache directory (None disables the cache)
+    Writes <out_dir>/session_log.jsonl, <out_dir>/summary.json and one WAV per transition.
+    Events whose intent cannot be resolved or validated, or has no playable stems, and
+    transitions whose render fails, are listed in summary["errors"] (the current theme
+    keeps playing); intent stems with no file in the catalog are dropped before rendering
+    and listed in summary["dropped_stems"].
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or workers * 2
+    intent_latencies, render_latencies, errors, dropped_stems = [], [], [], []
+    history = []
+    rendered = 0
+    rendered_bytes = 0
+    n_events = 0
+    current_theme, current_stems = start_theme, []
+    started = time.perf_counter()
+
+    def collect(job):
+        nonlocal rendered, rendered_bytes
+        index, theme, future = job
+        try:
+            result = future.result()
+        except Exception as e:
+            errors.append({"index": index, "theme": theme, "error": f"render failed: {e}"})
+            return
+        rendered += 1
+        rendered_bytes += result["bytes"]
+        render_latencies.append(result["render_seconds"])
+
+    log_path = os.path.join(out_dir, "session_log.jsonl")
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(log_path, "w", encoding="utf-8") as log:
+        pending = deque()
+        for index, event in enumerate(events):
+            n_events += 1
+            try:
+                theme = event_theme(event, base_dir)
+            except FileNotFoundError as e:
+                errors.append({"index": index, "theme": event.state, "error": str(e)})
+                continue
+            if theme == current_theme and history:
+                intent = history[-1]["intent"]
+                musical_intent = musical_intent_from_dict(intent, theme)  # Validated when first resolved
+            else:
+                t0 = time.perf_counter()
+                try:
+                    if advisor is None:
+                        intent = plan_local_intent(theme, base_dir)
+                    else:
+                        recommend = getattr(advisor, "recommend_sync", advisor.recommend)
+                        intent = recommend(history, current_stems, theme).get("next_intent", {})
+                except FileNotFoundError as e:
+                    errors.append({"index": index, "theme": theme, "error": str(e)})
+                    continue
+                intent_latencies.append(time.perf_counter() - t0)
+                try:
+                    musical_intent = musical_intent_from_dict(intent, theme)
+                except ValidationError as e:
+                    errors.append({"index": index, "theme": theme, "error": f"invalid intent: {e}"})
+                    continue
+                # Hallucinated stems have no file to render
+                available = {record.path for record in get_catalog(base_dir).stems(theme)}
+                next_stems = stem_dicts_from_intent(intent, theme)
+                missing = [stem["filename"] for stem in next_stems if stem["filename"] not in available]
+                if missing:
+                    dropped_stems.append({"index": index, "theme": theme, "stems": missing})
+                    next_stems = [stem for stem in next_stems if stem["filename"] in available]
+                if not next_stems:
+                    # An empty (or entirely hallucinated) intent would leave nothing playing
+                    # and silently skip every later render; keep the current theme instead
+                    errors.append({"index": index, "theme": theme, "error": "intent has no playable stems"})
+                    continue
+                if current_stems:
+                    # Backpressure: wait for the oldest render before queueing more
+                    while len(pending) >= max_inflight:
+                        collect(pending.popleft())
+                    output_path = os.path.join(out_dir, f"{index:06d}_{current_theme}_to_{theme}.wav")
+                    pending.append((index, theme, pool.submit(
+                        _render_job, (index, current_stems, next_stems, base_dir, output_path, cache_dir)
+                    )))
+                history.append({
+                    "timestamp": time.time(),
+                    "from_theme": current_theme,
+                    "from_stem_dicts": current_stems,
+                    "to_theme": theme,
+                    "to_stem_dicts": next_stems,
+                    "intent": intent,
+                })
+                current_theme, current_stems = theme, next_stems
+            entry = SessionLogEntry(event=event, intent=musical_intent)
+            log.write(entry.model_dump_json() + "\n")
+        while pending:
+            collect(pending.popleft())
+
+    wall = time.perf_counter() - started
+    summary = {
+        "events": n_events,
+        "transitions": len(history),
+        "rendered": rendered,
+        "rendered_bytes": rendered_bytes,
+        "errors": errors,
+        "dropped_stems": dropped_stems,
+        "wall_seconds": wall,
+        "events_per_second": n_events / wall if wall > 0 else None,
+        "renders_per_second": rendered / wall if wall > 0 else None,
+        "intent_latency": latency_summary(intent_latencies),
+        "render_latency": latency_summary(render_latencies),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render transitions for a JSONL stream of game events.")
+    parser.add_argument("events", help="JSONL file with one schemas.Event per line")
+    parser.add_argument("--out", default="batch_renders", help="Output directory")
+    parser.add_argument("--base-dir", default="audio_clips", help="Stem root directory")
+    parser.add_argument("--advisor", choices=["local", "llm"], default="local",
+                        help="Resolve intents with the local planner or the LLM advisor")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes")
+    parser.add_argument("--max-inflight", type=int, default=None, help="Max queued renders")
+    parser.add_argument("--start-theme", default=None, help="Theme playing before the first event")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Rendered-transition cache directory ('' to disable)")
+    args = parser.parse_args(argv)
+
+    advisor = None
+    if args.advisor == "llm":
+        from llm_advisor import AsyncLLMAdvisor
+        advisor = AsyncLLMAdvisor(base_dir=args.base_dir)
+    summary = run_batch(read_events(args.events), args.out,
+                        base_dir=args.base_dir,
+                        advisor=advisor,
+                        workers=args.workers,
+                        max_inflight=args.max_inflight,
+                        start_theme=args.start_theme,
+                        cache_dir=args.cache_dir or None)
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    return 0 if not summary["errors"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# ---------------------------------------------------------------------------
+# beat_scheduler.py
+#
+# Step-by-step overview:
+# 1. Picks the outgoing theme's reference grid: the analyzed current stem with the
+#    most downbeats (usually the drums), from the precomputed stem_analysis index
+# 2. Finds the next bar (or phrase = every N bars) boundary after the playback position
+#    by binary search (np.searchsorted) over that grid; no audio is touched
+# 3. Snaps every stem's fade duration to a whole number of bars
+# 4. Returns a schedule with sample-accurate integers shared by the server renderer
+#    (render_transition(position_frames=..., start_offset=...)) and the browser mixer
+#    (MyComponent.tsx)
+#     - Without analysis data the schedule degrades to "start now, fades unchanged"
+#     - fade_on_grid() checks that a schedule's fades start on the reference grid
+# ---------------------------------------------------------------------------
+
+import numpy as np
+from stem_analysis import get_analysis
+
+DEFAULT_SAMPLE_RATE = 44100
+BOUNDARIES = ("beat", "bar", "phrase")
+
+def _reference_grid(current_stems, base_dir, kind):
+    """
+    Returns (grid, filename) for the current stem with the densest grid of this kind.
+    """
+    analysis = get_analysis(base_dir)
+    best, best_file = None, None
+    for stem in current_stems:
+        grid = analysis.beat_grid(stem["filename"], kind)
+        if grid is not None and (best is None or len(grid) > len(best)):
+            best, best_file = grid, stem["filename"]
+    return best, best_file
+
+def next_boundary(grid, position, min_lead=0.0):
+    """
+    First grid time >= position + min_lead (binary search), or None if the grid ends first.
+    """
+    idx = int(np.searchsorted(grid, position + min_lead, side="left"))
+    return float(grid[idx]) if idx < len(grid) else None
+
+def snap_fade(fade_duration, bar_seconds, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Rounds a fade to a whole number of bars (at least one), in whole samples.
+    Returns (fade samples, fade seconds); the fade is kept unsnapped if bar_seconds is
+    not a positive length (degenerate downbeat grid).
+    """
+    if not bar_seconds or not np.isfinite(bar_seconds) or bar_seconds <= 0:
+        samples = int(round(float(fade_duration) * sample_rate))
+        return samples, samples / float(sample_rate)
+    bars = max(1, int(round(float(fade_duration) / bar_seconds)))
+    samples = int(round(bars * bar_seconds * sample_rate))
+    return samples, samples / float(sample_rate)
+
+def schedule_transition(current_stems, next_stems,
+                        base_dir="audio_clips",
+                        position=0.0,
+                        boundary="bar",
+                        bars_per_phrase=4,
+                        min_lead=0.0,
+                        sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Aligns a crossfade to the outgoing stems' musical grid.
+    - position: current playback position of the outgoing stems, in seconds
+    - boundary: "beat", "bar" or "phrase" (bars_per_phrase bars)
+    - min_lead: never start sooner than this many seconds from position
+    Returns {"start_offset": samples from position until the fades begin,
+             "start_time": the same in seconds, "position_frames": position in samples
+             (position_frames + start_offset is the boundary's frame), "boundary", "bar_seconds",
+             "reference": stem whose grid was used, "sample_rate",
+             "current_stems"/"next_stems": copies with bar-snapped fadedurations,
+             "fade_samples": [per stem, current then next]}.
+    """
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"Unknown boundary {boundary!r}; expected one of {BOUNDARIES}")
+    position_frames = int(round(float(position) * sample_rate))
+    schedule = {
+        "start_offset": 0,
+        "start_time": 0.0,
+        "position_frames": position_frames,
+        "boundary": None,
+        "bar_seconds": None,
+        "reference": None,
+        "sample_rate": sample_rate,
+        "current_stems": [dict(stem) for stem in current_stems],
+        "next_stems": [dict(stem) for stem in next_stems],
+    }
+    stems = schedule["current_stems"] + schedule["next_stems"]
+    schedule["fade_samples"] = [int(round(float(s["fadeduration"]) * sample_rate)) for s in stems]
+
+    downbeats, reference = _reference_grid(current_stems, base_dir, "downbeats")
+    if downbeats is None or len(downbeats) < 2:
+        return schedule  # No analysis for the outgoing stems: start now, fades as given
+    bar_seconds = float(np.median(np.diff(downbeats)))
+    if boundary == "beat":
+        grid = get_analysis(base_dir).beat_grid(reference, "beats")
+        if grid is None:
+            return schedule  # Downbeats but no beat grid: start now, fades as given
+    elif boundary == "phrase":
+        grid = downbeats[::bars_per_phrase]
+    else:
+        grid = downbeats
+    start = next_boundary(grid, position, min_lead)
+    if start is None:
+        return schedule  # Past the last boundary of the outgoing stems: start now
+
+    # Both counted in whole frames of the outgoing stems, so they add up to the boundary
+    schedule["start_offset"] = int(round(start * sample_rate)) - position_frames
+    schedule["start_time"] = schedule["start_offset"] / float(sample_rate)
+    schedule["boundary"] = boundary
+    schedule["bar_seconds"] = bar_seconds
+    schedule["reference"] = reference
+    for i, stem in enumerate(stems):
+        schedule["fade_samples"][i], stem["fadeduration"] = snap_fade(
+            stem["fadeduration"], bar_seconds, sample_rate
+        )
+    return schedule
+
+def fade_on_grid(schedule, base_dir="audio_clips"):
+    """
+    True if the schedule's fades start exactly on a frame of its reference grid
+    (position_frames + start_offset, in the reference stem's frames); also True for an
+    unscheduled ("start now") schedule, which has no grid to land on.
+    """
+    if schedule.get("boundary") is None:
+        return True
+    kind = "beats" if schedule["boundary"] == "beat" else "downbeats"
+    grid = get_analysis(base_dir).beat_grid(schedule["reference"], kind)
+    if grid is None:
+        return False
+    frames = np.round(np.asarray(grid, dtype=np.float64) * schedule["sample_rate"]).astype(np.int64)
+    return bool(np.any(frames == schedule["position_frames"] + schedule["start_offset"]))
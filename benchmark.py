@@ -0,0 +1,232 @@
+# ---------------------------------------------------------------------------
+# benchmark.py
+#
+# Step-by-step overview:
+# 1. Generates a synthetic stem tree (themes x stems x seconds of 16-bit WAV) and a
+#    matching theme config in a temporary directory, so results do not depend on
+#    the bundled audio_clips/
+# 2. Stubs the LLM with StubTransport: a canned intent + explanation after a
+#    configurable delay (no network, no API key)
+# 3. Times the transition pipeline stage by stage:
+#     - folder_intent: generate_mix_intent_from_folder (catalog + analysis lookup)
+#     - theme_resolve: get_theme_key/resolve_theme, first call (memo miss) and repeat
+#     - build_prompt: LLMAdvisor._build_prompt as the session history grows
+#     - parse_response / extract_json: both parsers on increasingly large responses
+#     - click_to_intent: folder scan + advisor.recommend_sync, uncached and cached
+# 4. Writes machine-readable JSON; --compare checks it against a saved baseline and
+#    exits 1 if any benchmark's p50 regressed by more than --threshold
+#
+# Usage:
+#   python benchmark.py --out baseline.json
+#   python benchmark.py --compare baseline.json --threshold 0.15
+#   python benchmark.py --themes 200 --stems 6 --seconds 2 --llm-delay 0.05
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+import numpy as np
+
+SAMPLE_RATE = 44100
+STEM_NAMES = ("drums", "bass", "strings", "pad", "synth", "chimes")
+HISTORY_SIZES = (0, 10, 100, 1000)
+RESPONSE_SIZES = (1 << 10, 64 << 10, 1 << 20)
+
+def write_synthetic_tree(root, themes=8, stems=4, seconds=5.0, seed=0):
+    """
+    Writes root/theme_XXX/<stem>.wav (stereo 16-bit tones with noise) and root/themes.json.
+    Returns the list of theme names.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"theme_{i:03d}" for i in range(themes)]
+    frames = int(seconds * SAMPLE_RATE)
+    t = np.arange(frames) / SAMPLE_RATE
+    for theme in names:
+        folder = os.path.join(root, theme)
+        os.makedirs(folder, exist_ok=True)
+        for j in range(stems):
+            stem = STEM_NAMES[j] if j < len(STEM_NAMES) else f"stem{j}"
+            tone = 0.3 * np.sin(2 * np.pi * rng.uniform(55, 880) * t) + 0.02 * rng.standard_normal(frames)
+            pcm = (np.clip(np.column_stack([tone, tone]), -1, 1) * 32767).astype("<i2")
+            with wave.open(os.path.join(folder, f"{stem}.wav"), "wb") as w:
+                w.setnchannels(2)
+                w.setsampwidth(2)
+                w.setframerate(SAMPLE_RATE)
+                w.writeframes(pcm.tobytes())
+    config = {"themes": [
+        {"name": name, "keywords": [f"zone{i:03d}"], "aliases": [f"area {i}", f"level {i}"]}
+        for i, name in enumerate(names)
+    ]}
+    with open(os.path.join(root, "themes.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return names
+
+def measure(func, repeat=20, warmup=2):
+    """
+    Calls func() warmup + repeat times; returns {"count", "p50", "p95", "max", "min", "mean"}
+    over the timed calls, in seconds.
+    """
+    from batch_runner import latency_summary
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    summary = latency_summary(times)
+    summary["min"] = min(times)
+    summary["mean"] = sum(times) / len(times)
+    return summary
+
+def synthetic_history(size, themes):
+    """
+    A session history of `size` transitions in the demo's entry format.
+    """
+    history = []
+    for i in range(size):
+        src, dst = themes[i % len(themes)], themes[(i + 1) % len(themes)]
+        history.append({
+            "timestamp": 1700000000.0 + i,
+            "from_theme": src,
+            "from_stem_dicts": [{"filename": f"{src}/{s}.wav", "targetgain": 0.8, "fadeduration": 2.0}
+                                for s in STEM_NAMES[:4]],
+            "to_theme": dst,
+            "to_stem_dicts": [{"filename": f"{dst}/{s}.wav", "targetgain": 0.7, "fadeduration": 1.5}
+                              for s in STEM_NAMES[:4]],
+            "Transition": f"{src} → {dst} | Crossfade over 1.5s",
+        })
+    return history
+
+def canned_response(intent, size):
+    """
+    The intent as a JSON block followed by explanation text, padded to about `size` characters.
+    """
+    head = json.dumps(intent, indent=2) + "\n"
+    sentence = "The drums fade in over two bars while the strings carry the melody. "
+    return head + sentence * max(1, (size - len(head)) // len(sentence))
+
+def run_benchmarks(themes=8, stems=4, seconds=5.0, llm_delay=0.0, repeat=20):
+    """
+    Builds the synthetic tree and runs every benchmark. Returns the results document.
+    """
+    with tempfile.TemporaryDirectory(prefix="stem_benchmark_") as root:
+        names = write_synthetic_tree(root, themes, stems, seconds)
+        from llm_advisor import (AsyncLLMAdvisor, StubTransport, generate_mix_intent_from_folder,
+                                 plan_local_intent, stem_dicts_from_mix_intent)
+        from json_stream import extract_llm_json_and_reasoning
+        from response_cache import ResponseCache
+        from theme_registry import ThemeRegistry, set_registry
+
+        # The app resolves and validates themes against the synthetic vocabulary for the
+        # duration of the run; the previous registry is restored even if a benchmark fails
+        config_path = os.path.join(root, "themes.json")
+        previous = set_registry(ThemeRegistry.from_config(config_path))
+        try:
+            results = {}
+            current, upcoming = names[0], names[1 % len(names)]
+            results["folder_intent"] = measure(lambda: generate_mix_intent_from_folder(current, base_dir=root), repeat)
+
+            # Theme resolution: a fresh registry per call measures the memo-miss path
+            registry = ThemeRegistry.from_config(config_path)
+            queries = [f"Zone{i % themes:03d}-Battle" for i in range(repeat)]
+            misses = iter(queries * 4)
+            results["theme_resolve_miss"] = measure(lambda: registry._resolve(next(misses)), repeat)
+            results["theme_resolve_fuzzy"] = measure(lambda: registry._resolve("thme_0O1"), repeat)
+            results["theme_resolve_memo"] = measure(lambda: registry.resolve("Zone001-Battle"), repeat)
+
+            intent = plan_local_intent(upcoming, root)
+            current_stems = stem_dicts_from_mix_intent(generate_mix_intent_from_folder(current, base_dir=root))
+            advisor = AsyncLLMAdvisor(transport=StubTransport(canned_response(intent, 2048), delay=llm_delay),
+                                      base_dir=root)
+            for size in HISTORY_SIZES:
+                history = synthetic_history(size, names)
+                results[f"build_prompt_history_{size}"] = measure(
+                    lambda: advisor._build_prompt(history, current_stems, upcoming, None), repeat)
+
+            for size in RESPONSE_SIZES:
+                response = canned_response(intent, size)
+                results[f"parse_response_{size // 1024}k"] = measure(lambda: advisor._parse_response(response), repeat)
+                results[f"extract_json_{size // 1024}k"] = measure(
+                    lambda: extract_llm_json_and_reasoning(response), repeat)
+
+            # Click-to-intent: what the Transition button waits for before mixing starts
+            history = synthetic_history(10, names)
+            def click(adv):
+                stems = stem_dicts_from_mix_intent(generate_mix_intent_from_folder(current, base_dir=root))
+                return adv.recommend_sync(history, stems, upcoming)
+            results["click_to_intent"] = measure(lambda: click(advisor), repeat)
+            cached = AsyncLLMAdvisor(transport=StubTransport(canned_response(intent, 2048), delay=llm_delay),
+                                     cache=ResponseCache(), base_dir=root)
+            results["click_to_intent_cached"] = measure(lambda: click(cached), repeat)
+        finally:
+            set_registry(previous)
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {"themes": themes, "stems": stems, "seconds": seconds,
+                       "llm_delay": llm_delay, "repeat": repeat},
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, threshold=0.10, metric="p50"):
+    """
+    Compares two results documents benchmark by benchmark.
+    Returns (rows, regressed): rows of {"name", "baseline", "current", "ratio", "status"}.
+    """
+    rows, regressed = [], False
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base.get(metric):
+            rows.append({"name": name, "baseline": None, "current": result[metric], "ratio": None, "status": "new"})
+            continue
+        ratio = result[metric] / base[metric]
+        status = "regressed" if ratio > 1 + threshold else "improved" if ratio < 1 - threshold else "ok"
+        regressed = regressed or status == "regressed"
+        rows.append({"name": name, "baseline": base[metric], "current": result[metric],
+                     "ratio": ratio, "status": status})
+    if current["meta"]["config"] != baseline["meta"].get("config"):
+        print("Warning: benchmark configs differ; ratios may not be comparable.", file=sys.stderr)
+    return rows, regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transition pipeline on synthetic stems.")
+    parser.add_argument("--themes", type=int, default=8, help="Synthetic theme folders")
+    parser.add_argument("--stems", type=int, default=4, help="Stems per theme")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each stem")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Simulated LLM latency in seconds")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per benchmark")
+    parser.add_argument("--out", help="Write the results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed p50 slowdown before a benchmark counts as regressed (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.themes, args.stems, args.seconds, args.llm_delay, args.repeat)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if not args.compare:
+        print(json.dumps(results, indent=2))
+        return 0
+    with open(args.compare, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows, regressed = compare(results, baseline, args.threshold)
+    print(f"{'benchmark':32} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}  status")
+    for row in rows:
+        base = "-" if row["baseline"] is None else f"{row['baseline'] * 1000:.3f}"
+        ratio = "-" if row["ratio"] is None else f"{row['ratio']:.2f}"
+        print(f"{row['name']:32} {base:>12} {row['current'] * 1000:>12.3f} {ratio:>7}  {row['status']}")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+# ---------------------------------------------------------------------------
+# columnar.py
+#
+# Step-by-step overview:
+# 1. Defines SessionColumns: session logs (SessionLogEntry = Event + MusicalIntent)
+#    stored as two NumPy structured arrays instead of lists of models/dicts
+#     - transitions: one row per entry (timestamp, theme, event state/intensity/flags,
+#       and the [stem_start, stem_start + stem_count) slice of the stem table)
+#     - stems: one row per active stem (transition index, stem, gain, fade)
+#     - theme, stem and flag names are dictionary-encoded (small integer codes)
+# 2. Bulk converters
+#     - from_records()/from_jsonl(): straight from JSON dicts (e.g. batch_runner's
+#       session_log.jsonl), without building a model per row
+#     - from_models()/from_mix_intents() and to_log_entries()/to_musical_intents()/
+#       to_mix_intents() for the existing Pydantic schemas
+# 3. validate(): schema checks for a whole batch as vectorized array comparisons
+# 4. Columnar scans for analysis (theme counts, per-stem gain statistics)
+# 5. Import/export: Arrow tables and Parquet (optional pyarrow), or .npz without it
+# ---------------------------------------------------------------------------
+
+import json
+import math
+from datetime import datetime, timezone
+import numpy as np
+from theme_registry import theme_names
+from schemas import Event, MixIntent, MusicalIntent, SessionLogEntry, StemIntent
+
+MAX_FLAGS = 64
+
+TRANSITION_DTYPE = np.dtype([
+    ("timestamp", "<f8"),       # epoch seconds (NaN if missing/unparseable)
+    ("theme", "<i2"),           # intent theme code
+    ("state", "<i2"),           # event state code, -1 without an event
+    ("intensity", "<i2"),       # event intensity, -1 without an event
+    ("flags", "<u8"),           # event flags as a bitmask over flag_names
+    ("stem_start", "<i8"),
+    ("stem_count", "<i4"),
+])
+STEM_DTYPE = np.dtype([
+    ("transition", "<i8"),
+    ("stem", "<i4"),
+    ("gain", "<f8"),            # NaN if the intent has no gain for this active stem
+    ("fade", "<f8"),
+])
+
+class Vocabulary:
+    """
+    Dictionary encoding: maps names to dense integer codes in first-seen order.
+    """
+    def __init__(self, names=()):
+        self.names = []
+        self._codes = {}
+        for name in names:
+            self.code(name)
+
+    def code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def __len__(self):
+        return len(self.names)
+
+def _epoch(value):
+    """
+    Converts a datetime, ISO-8601 string or number to epoch seconds (NaN on failure).
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return math.nan
+
+def _number(value):
+    """
+    Converts a gain/fade to float (NaN if it is not a number, so validate() flags the row).
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _intensity(value):
+    """
+    Converts an event intensity to int (-1, i.e. out of range, if it is not a whole number
+    or does not fit the int16 column).
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return -1
+    return int(number) if number.is_integer() and -1 <= number <= 32767 else -1
+
+class SessionColumns:
+    """
+    Columnar batch of session log entries. Build with one of the from_* constructors.
+    """
+    def __init__(self, transitions, stems, themes, stem_names, flag_names):
+        self.transitions = transitions
+        self.stems = stems
+        self.themes = list(themes)
+        self.stem_names = list(stem_names)
+        self.flag_names = list(flag_names)
+
+    def __len__(self):
+        return len(self.transitions)
+
+    # ----------------------------- constructors -----------------------------
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds columns from SessionLogEntry-shaped dicts ({"event": {...} or None,
+        "intent": {theme, active_stems, target_gains, fade_durations, timestamp}}).
+        One pass over the records; no model objects are created and nothing is
+        validated here (see validate()): values that do not parse become NaN gains/fades
+        or an out-of-range intensity, which validate() reports per row.
+        """
+        themes = Vocabulary(theme_names())
+        stem_names = Vocabulary()
+        flag_names = Vocabulary()
+        rows = []
+        stem_transition, stem_code, stem_gain, stem_fade = [], [], [], []
+        for index, record in enumerate(records):
+            intent = record.get("intent") or {}
+            event = record.get("event")
+            names = list(intent.get("active_stems") or [])
+            gains = intent.get("target_gains") or {}
+            fades = intent.get("fade_durations") or {}
+            flags = 0
+            if event:
+                for flag in event.get("flags") or ():
+                    bit = flag_names.code(flag)
+                    if bit >= MAX_FLAGS:
+                        raise ValueError(f"More than {MAX_FLAGS} distinct event flags")
+                    flags |= 1 << bit
+            rows.append((
+                _epoch(intent.get("timestamp")),
+                themes.code(intent.get("theme")),
+                themes.code(event["state"]) if event else -1,
+                _intensity(event.get("intensity")) if event else -1,
+                flags,
+                len(stem_code),
+                len(names),
+            ))
+            stem_transition.extend([index] * len(names))
+            stem_code.extend(stem_names.code(name) for name in names)
+            stem_gain.extend(_number(gains.get(name)) for name in names)
+            stem_fade.extend(_number(fades.get(name)) for name in names)
+        transitions = np.array(rows, dtype=TRANSITION_DTYPE)
+        stems = np.empty(len(stem_code), dtype=STEM_DTYPE)
+        stems["transition"] = stem_transition
+        stems["stem"] = stem_code
+        stems["gain"] = np.asarray(stem_gain, dtype=np.float64)
+        stems["fade"] = np.asarray(stem_fade, dtype=np.float64)
+        return cls(transitions, stems, themes.names, stem_names.names, flag_names.names)
+
+    @classmethod
+    def from_jsonl(cls, path):
+        """
+        Reads a session_log.jsonl file (one SessionLogEntry JSON object per line).
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_records(json.loads(line) for line in f if line.strip())
+
+    @classmethod
+    def from_models(cls, entries):
+        """
+        Builds columns from SessionLogEntry models (attribute access, no model_dump).
+        """
+        def records():
+            for entry in entries:
+                event, intent = entry.event, entry.intent
+                yield {
+                    "event": {"state": event.state, "intensity": event.intensity, "flags": event.flags},
+                    "intent": {"theme": intent.theme, "active_stems": intent.active_stems,
+                               "target_gains": intent.target_gains,
+                               "fade_durations": intent.fade_durations,
+                               "timestamp": intent.timestamp},
+                }
+        return cls.from_records(records())
+
+    @classmethod
+    def from_mix_intents(cls, mix_intents, timestamp=None):
+        """
+        Builds columns from MixIntent models (no events; one transition per MixIntent).
+        """
+        def records():
+            for mix in mix_intents:
+                yield {
+                    "event": None,
+                    "intent": {"theme": mix.theme,
+                               "active_stems": [si.stem_name for si in mix.stem_intents],
+                               "target_gains": {si.stem_name: si.target_gain for si in mix.stem_intents},
+                               "fade_durations": {si.stem_name: si.fade_duration for si in mix.stem_intents},
+                               "timestamp": timestamp},
+                }
+        return cls.from_records(records())
+
+    # ----------------------------- validation -----------------------------
+
+    def validate(self):
+        """
+        Checks the whole batch against the schemas with array operations.
+        Returns (valid mask over transitions, {problem: number of failing transitions}).
+        Problems: unknown theme/state, intensity outside 0-100, missing timestamp, and
+        active stems without a finite gain or fade.
+        """
+        t = self.transitions
+        # Theme codes are seeded with the schemas' themes, so codes below this are valid
+        n_schema = len(theme_names())
+        has_event = t["state"] >= 0
+        problems = {
+            "theme": t["theme"] >= n_schema,
+            "state": has_event & (t["state"] >= n_schema),
+            "intensity": has_event & ((t["intensity"] < 0) | (t["intensity"] > 100)),
+            "timestamp": ~np.isfinite(t["timestamp"]),
+        }
+        for column in ("gain", "fade"):
+            bad_stem = ~np.isfinite(self.stems[column])
+            problems[column] = np.bincount(self.stems["transition"], weights=bad_stem,
+                                           minlength=len(t)) > 0
+        invalid = np.zeros(len(t), dtype=bool)
+        for mask in problems.values():
+            invalid |= mask
+        return ~invalid, {name: int(mask.sum()) for name, mask in problems.items() if mask.any()}
+
+    def select(self, mask):
+        """
+        Returns a new SessionColumns with only the transitions where mask is True.
+        """
+        keep = np.flatnonzero(mask)
+        transitions = self.transitions[keep].copy()
+        stem_mask = np.zeros(len(self.transitions), dtype=bool)
+        stem_mask[keep] = True
+        stems = self.stems[stem_mask[self.stems["transition"]]].copy()
+        # Renumber: transition i of the result owns a contiguous slice of the new stem table
+        new_index = np.cumsum(stem_mask) - 1
+        stems["transition"] = new_index[stems["transition"]]
+        transitions["stem_start"] = np.concatenate([[0], np.cumsum(transitions["stem_count"])[:-1]])
+        return SessionColumns(transitions, stems, self.themes, self.stem_names, self.flag_names)
+
+    # ----------------------------- back to models -----------------------------
+
+    def _stem_slice(self, row):
+        start = row["stem_start"]
+        return self.stems[start:start + row["stem_count"]]
+
+    def to_musical_intents(self):
+        """
+        Yields a MusicalIntent per transition (model_construct: call validate() first).
+        """
+        for row in self.transitions:
+            stems = self._stem_slice(row)
+            names = [self.stem_names[code] for code in stems["stem"]]
+            yield MusicalIntent.model_construct(
+                theme=self.themes[row["theme"]],
+                active_stems=names,
+                target_gains={name: float(g) for name, g in zip(names, stems["gain"]) if np.isfinite(g)},
+                fade_durations={name: float(f) for name, f in zip(names, stems["fade"]) if np.isfinite(f)},
+                timestamp=datetime.fromtimestamp(float(row["timestamp"]), tz=timezone.utc),
+            )
+
+    def to_log_entries(self):
+        """
+        Yields SessionLogEntry models; every transition must carry an event.
+        """
+        for row, intent in zip(self.transitions, self.to_musical_intents()):
+            if row["state"] < 0:
+                raise ValueError("Transition has no event; use to_musical_intents()")
+            flags = {name for bit, name in enumerate(self.flag_names) if int(row["flags"]) >> bit & 1}
+            event = Event.model_construct(state=self.themes[row["state"]],
+                                          intensity=int(row["intensity"]), flags=flags)
+            yield SessionLogEntry.model_construct(event=event, intent=intent)
+
+    def to_mix_intents(self, base_dir="audio_clips"):
+        """
+        Yields a MixIntent per transition, with stem file paths under base_dir/<theme>/.
+        """
+        for intent in self.to_musical_intents():
+            yield MixIntent.model_construct(theme=intent.theme, stem_intents=[
+                StemIntent.model_construct(
+                    stem_name=name,
+                    file_path=f"{base_dir}/{intent.theme}/{name}.wav",
+                    target_gain=intent.target_gains.get(name, math.nan),
+                    fade_duration=intent.fade_durations.get(name, math.nan),
+                )
+                for name in intent.active_stems
+            ])
+
+    # ----------------------------- columnar scans -----------------------------
+
+    def theme_counts(self):
+        """
+        Returns {theme: number of transitions into it}.
+        """
+        counts = np.bincount(self.transitions["theme"], minlength=len(self.themes))
+        return {name: int(c) for name, c in zip(self.themes, counts) if c}
+
+    def stem_gain_stats(self):
+        """
+        Returns {stem: {"count", "mean_gain", "mean_fade"}} over all transitions.
+        """
+        codes = self.stems["stem"]
+        n = len(self.stem_names)
+        gains = np.nan_to_num(self.stems["gain"])
+        fades = np.nan_to_num(self.stems["fade"])
+        counts = np.bincount(codes, minlength=n)
+        gain_sum = np.bincount(codes, weights=gains, minlength=n)
+        fade_sum = np.bincount(codes, weights=fades, minlength=n)
+        return {
+            name: {"count": int(counts[i]),
+                   "mean_gain": float(gain_sum[i] / counts[i]),
+                   "mean_fade": float(fade_sum[i] / counts[i])}
+            for i, name in enumerate(self.stem_names) if counts[i]
+        }
+
+    # ----------------------------- import / export -----------------------------
+
+    def to_arrow(self):
+        """
+        Returns a pyarrow Table with one row per transition: dictionary-encoded theme/
+        state, nullable event fields, and list columns for stems/gains/fades that reuse
+        the stem table as-is (offsets from stem_start/stem_count).
+        """
+        import pyarrow as pa
+        t = self.transitions
+        offsets = pa.array(np.append(t["stem_start"], len(self.stems)).astype(np.int32))
+        themes = pa.array(self.themes, type=pa.string())
+        has_event = t["state"] >= 0
+        state_codes = pa.array(t["state"].astype(np.int16), mask=~has_event)
+        columns = {
+            "timestamp": pa.array(t["timestamp"]),
+            "theme": pa.DictionaryArray.from_arrays(pa.array(t["theme"]), themes),
+            "state": pa.DictionaryArray.from_arrays(state_codes, themes),
+            "intensity": pa.array(t["intensity"], mask=~has_event),
+            "flags": pa.array(t["flags"]),
+            "stems": pa.ListArray.from_arrays(offsets, pa.DictionaryArray.from_arrays(
+                pa.array(self.stems["stem"]), pa.array(self.stem_names, type=pa.string()))),
+            "gains": pa.ListArray.from_arrays(offsets, pa.array(self.stems["gain"])),
+            "fades": pa.ListArray.from_arrays(offsets, pa.array(self.stems["fade"])),
+        }
+        metadata = {"flag_names": json.dumps(self.flag_names)}
+        return pa.table(columns, metadata=metadata)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """
+        Inverse of to_arrow() (also accepts tables read back from Parquet).
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        def codes_and_names(column):
+            if isinstance(column, pa.ChunkedArray):
+                column = column.combine_chunks()
+            if not pa.types.is_dictionary(column.type):
+                column = column.dictionary_encode()
+            return column.indices, column.dictionary.to_pylist()
+
+        themes = Vocabulary(theme_names())
+        n = table.num_rows
+        transitions = np.empty(n, dtype=TRANSITION_DTYPE)
+        transitions["timestamp"] = table.column("timestamp").to_numpy()
+        for name in ("theme", "state"):
+            indices, names = codes_and_names(table.column(name))
+            remap = np.array([themes.code(x) for x in names] or [0], dtype=np.int16)
+            idx = pc.fill_null(indices, -1).to_numpy(zero_copy_only=False).astype(np.int64)
+            transitions[name] = np.where(idx >= 0, remap[np.maximum(idx, 0)], -1)
+        transitions["intensity"] = pc.fill_null(table.column("intensity"), -1).to_numpy()
+        transitions["flags"] = table.column("flags").to_numpy()
+        stems_column = table.column("stems").combine_chunks()
+        lengths = pc.list_value_length(stems_column).to_numpy(zero_copy_only=False).astype(np.int64)
+        transitions["stem_count"] = lengths
+        transitions["stem_start"] = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        stem_indices, stem_names = codes_and_names(stems_column.flatten())
+        stems = np.empty(int(lengths.sum()), dtype=STEM_DTYPE)
+        stems["transition"] = np.repeat(np.arange(n), lengths)
+        stems["stem"] = stem_indices.to_numpy(zero_copy_only=False)
+        stems["gain"] = table.column("gains").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+        stems["fade"] = table.column("fades").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+        metadata = table.schema.metadata or {}
+        flag_names = json.loads(metadata.get(b"flag_names", b"[]"))
+        return cls(transitions, stems, themes.names, stem_names, flag_names)
+
+    def to_parquet(self, path):
+        """
+        Writes the columns to a Parquet file (requires pyarrow).
+        """
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
+        return path
+
+    @classmethod
+    def read_parquet(cls, path):
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
+
+    def save_npz(self, path):
+        """
+        Dependency-free export: the raw structured arrays plus the dictionaries.
+        """
+        np.savez(path, transitions=self.transitions, stems=self.stems,
+                 vocab=np.array(json.dumps([self.themes, self.stem_names, self.flag_names])))
+        return path
+
+    @classmethod
+    def load_npz(cls, path):
+        with np.load(path) as data:
+            themes, stem_names, flag_names = json.loads(str(data["vocab"]))
+            return cls(data["transitions"], data["stems"], themes, stem_names, flag_names)
@@ -6,21 +6,33 @@
 # 2. Define theme/stem mappings and any utility functions for normalization/parsing
 # 3. Initialize Streamlit session state (persistent across reruns)
 # 4. Build UI for selecting current and next themes, and transition/play controls
-# 5. Handle transitions: generate current intent, call LLM for next intent, validate outputs, handle errors
+# 5. Handle transitions: generate current intent, stream the next intent from the LLM (mixing
+#    starts as soon as it arrives; the explanation fills in afterwards), validate outputs,
+#    handle errors, then align the crossfade to the next bar (beat_scheduler)
+#    The stem mixer component is kept across reruns and preloads each new mix's audio
 # 6. Show mixing details: Current and Next stems, with friendly icons and roles per stem
-# 7. Show transition history: full table of all transitions and stem/gain details
+# 7. Show transition history: paginated, filterable table from the persistent history store
 # 8. (Throughout) Provide clear error/status/warning messages where needed
+# 9. Time every stage of the transition (telemetry.py); optional latency debug panel
 # ---------------------------------------------------------------------------
 
 import streamlit as st
 import os
 import re
 import time
-import json
-from llm_advisor import LLMAdvisor, generate_mix_intent_from_folder
-from my_component.stem_mixer import mix_and_transition
+import uuid
+from llm_advisor import AsyncLLMAdvisor, generate_mix_intent_from_folder, stem_dicts_from_mix_intent
+from my_component.stem_mixer import mix_and_transition, record_mixer_report
+from render_cache import get_default_render_cache
+from stem_store import get_default_store
+from stem_catalog import get_catalog
+from response_cache import ResponseCache
+from prefetcher import TransitionPrefetcher
+from beat_scheduler import schedule_transition
+from history_store import HistoryStore
+from telemetry import get_telemetry
+from theme_registry import resolve_theme, theme_names
 from dotenv import load_dotenv
-import pandas as pd
 
 # Load any environment variables from .env file (for model/backend config)
 load_dotenv()
@@ -38,61 +50,45 @@ STEM_FRIENDLY = {
     "chimes": ("Chimes", "🔔", "Accent"),
 }
 
-# ----------------------------------------------------------------------------
-# THEME_KEYWORD_MAP: used to map messy theme names to a canonical internal key
-# ----------------------------------------------------------------------------
-THEME_KEYWORD_MAP = [
-    ("bosscombat", ["boss"]),
-    ("combat", ["combat", "battle"]),
-    ("stealth", ["stealth", "hidden"]),
-    ("explore", ["explor", "jungle", "wondrous", "mysterious"]),
-]
-
 def get_theme_key(theme_str):
     """
     Normalizes and maps a theme string (from UI or LLM) to a canonical key
+    via the theme registry (themes.json: keywords, aliases, fuzzy matches)
     Example: "Boss-Combat" -> "bosscombat"
     """
-    if not theme_str:
-        return None
-    s = str(theme_str).lower()
-    s = s.replace("_", " ").replace("-", " ")
-    s = re.sub(r'([a-z])([A-Z])', r'\1 \2', s)
-    for key, keywords in THEME_KEYWORD_MAP:
-        for keyword in keywords:
-            if keyword in s:
-                return key
-    return None
-
-def extract_llm_json_and_reasoning(text):
+    return resolve_theme(theme_str)
+
+# Speculative prefetch limits: LLM calls per session, and how long a click waits
+# for an in-flight prefetch of the chosen theme before doing the work itself
+PREFETCH_MAX_LLM_CALLS = 50
+PREFETCH_WAIT_SECONDS = 5.0
+
+@st.cache_resource
+def get_response_cache():
     """
-    Parses out a JSON structure and extra reasoning text from an LLM explanation.
-    Used when the LLM doesn't provide properly structured output up front.
+    One LLM response cache per server process, persisted to disk across restarts.
     """
-    stack = []
-    start = None
-    for i, c in enumerate(text):
-        if c == '{':
-            if not stack:
-                start = i
-            stack.append(c)
-        elif c == '}':
-            if stack:
-                stack.pop()
-                if not stack and start is not None:
-                    try:
-                        json_str = text[start:i+1]
-                        obj = json.loads(json_str)
-                        reasoning_raw = text[i+1:].strip(" \n:;")
-                        reasoning = reasoning_raw.split('"""')[0].strip()
-                        reasoning = re.split(r'[\n\r][\s]*[),]+[\n\r]', reasoning)[0].strip()
-                        return obj, reasoning
-                    except Exception as e:
-                        st.warning(f"Error parsing LLM JSON: {e}\n\n{text[start:i+1]}")
-                    break
-    return {}, ""
+    cache = ResponseCache(disk_path=".llm_response_cache.sqlite")
+    get_telemetry().register_cache("llm_responses", cache)
+    return cache
+
+@st.cache_resource
+def get_advisor():
+    """
+    One long-lived advisor (and LLM client) per server process, shared by all reruns.
+    """
+    return AsyncLLMAdvisor(cache=get_response_cache())
+
+@st.cache_resource
+def get_history_store():
+    """
+    Persistent transition history shared by all sessions (paginated queries for the table).
+    """
+    return HistoryStore(".transition_history.sqlite")
 
 # --- Streamlit session state: persist critical variables across reruns ---
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "history" not in st.session_state:
     st.session_state.history = []
 if "status" not in st.session_state:
@@ -110,8 +106,21 @@ if "llm_reasoning" not in st.session_state:
 st.title("🚀🎶 Live Soundtrack Crossfader: Instantly Blend Game Audio Themes!")
 st.markdown("")
 
-# Theme choices to present in the UI
-themes = ["explore", "stealth", "combat", "bosscombat"]
+# Theme choices to present in the UI (only those with stems in the catalog)
+catalog_themes = set(get_catalog("audio_clips").themes())
+themes = [t for t in theme_names() if t in catalog_themes]
+
+if "prefetcher" not in st.session_state:
+    # Per-session speculative warmer for the likely next transitions
+    st.session_state.prefetcher = TransitionPrefetcher(
+        advisor=get_advisor(), max_workers=2, top_n=2,
+        max_llm_calls=PREFETCH_MAX_LLM_CALLS, themes=themes
+    )
+
+# After a transition the next theme is what is playing: advance the current-theme selector
+# (a widget's value can only be set before it is created, hence on the following rerun)
+if "pending_current_theme" in st.session_state:
+    st.session_state.current_theme_select = st.session_state.pop("pending_current_theme")
 
 # Theme selectors for UI (Current and Next)
 col1, col2 = st.columns([1, 1], gap="large")
@@ -127,6 +136,11 @@ with col2:
     )
     normalized_next_theme = get_theme_key(next_theme)
 
+# Prefetch keys come from the same current theme the click handler uses; re-warm when the
+# user picks a different current theme than the prefetched work assumed
+if st.session_state.get("history") and st.session_state.prefetcher.current_theme != current_theme:
+    st.session_state.prefetcher.prefetch(st.session_state.history, current_theme)
+
 st.write("")  # For spacing
 
 # Display transition/play controls (side-by-side for clarity)
@@ -139,41 +153,55 @@ with colb2:
     st.write("")
 
 # ------------------- Transition Button Handler ------------------------
+llm_events = None  # Remaining advisor stream events (explanation), drained after the mixer renders
 if clicked:
-    with st.spinner("🚧 Generating next theme, please wait..."):
+    telemetry = get_telemetry()
+    with st.spinner("🚧 Generating next theme, please wait..."), telemetry.span("transition"):
         # Step 1: Pull out currently active stems (for outgoing/current theme)
-        current_intent = generate_mix_intent_from_folder(current_theme, base_dir="audio_clips/")
-        current_stem_dicts = [
-            {"filename": f"{current_theme}/{os.path.basename(stem.file_path)}",
-            "targetgain": stem.target_gain,
-            "fadeduration": stem.fade_duration}
-            for stem in current_intent.stem_intents
-        ]
+        with telemetry.span("transition.folder_scan"):
+            current_intent = generate_mix_intent_from_folder(current_theme, base_dir="audio_clips/")
+            current_stem_dicts = stem_dicts_from_mix_intent(current_intent)
         st.session_state.current_stem_dicts = current_stem_dicts
 
-        # Step 2: Use LLMAdvisor to recommend next set of stems (for incoming/next theme)
-        advisor = LLMAdvisor()
-        llm_output = advisor.recommend(
+        # Step 2: Use the shared advisor to recommend next set of stems (for incoming/next theme)
+        # (falls back to a local default plan if the LLM is too slow or fails)
+        # If this transition was prefetched, join that work: the advisor's cache then
+        # answers instantly. Other speculative work is dropped.
+        advisor = get_advisor()
+        prefetcher = st.session_state.prefetcher
+        with telemetry.span("transition.prefetch_wait"):
+            prefetcher.cancel(keep=next_theme)
+            prefetcher.wait(next_theme, timeout=PREFETCH_WAIT_SECONDS)
+        # Streamed: the intent arrives as soon as its JSON block is parsed, so scheduling
+        # and the mixer's preload start while the explanation is still being generated
+        llm_events = advisor.recommend_stream_sync(
             session_log=st.session_state.get("history", []),
             current_state=current_stem_dicts,
             next_theme=next_theme,
             user_query=None
         )
-        intent_dict = llm_output.get("next_intent", {})
-        reasoning = ""
-        # Try fallback JSON reasoning extraction if needed
-        if not intent_dict or not intent_dict.get("activestems"):
-            intent_dict, reasoning = extract_llm_json_and_reasoning(llm_output.get("explanation", ""))
-        else:
-            reasoning = llm_output.get("explanation", "")
+        intent_dict, reasoning = {}, ""
+        with telemetry.span("transition.advisor"):
+            for event in llm_events:
+                if event["type"] == "intent":
+                    intent_dict = event["next_intent"]
+                    break  # The only intent event (the fallback's if the LLM gave none)
+                elif event["type"] == "explanation":
+                    reasoning += event["text"]
+                elif event["type"] == "done":
+                    intent_dict = event["result"].get("next_intent", intent_dict)
+                    reasoning = event["result"].get("explanation", reasoning)
+                    llm_events = None
+                    break
         st.session_state.llm_reasoning = reasoning
 
         # Step 3: Error handling and output validation
-        error_msg = None
-        if not intent_dict or not intent_dict.get("activestems"):
-            error_msg = "🛑 No valid music stems found from the model. Please try a different theme or re-run the transition."
-        elif any(val == '?' or val is None for val in intent_dict.get("targetgains", {}).values()):
-            error_msg = "⚠️ Some target gain values were not generated. Please check your input or retry."
+        with telemetry.span("transition.validate"):
+            error_msg = None
+            if not intent_dict or not intent_dict.get("activestems"):
+                error_msg = "🛑 No valid music stems found from the model. Please try a different theme or re-run the transition."
+            elif any(val == '?' or val is None for val in intent_dict.get("targetgains", {}).values()):
+                error_msg = "⚠️ Some target gain values were not generated. Please check your input or retry."
 
         if error_msg:
             st.warning(error_msg)
@@ -191,26 +219,60 @@ if clicked:
                 })
             st.session_state.next_stem_dicts = stems_out
 
+            # Step 5: Align the crossfade to the next bar of the outgoing stems and snap fades
+            # to whole bars (binary search over precomputed beat grids; no audio analysis here)
+            start_offset = 0
+            try:
+                with telemetry.span("transition.schedule"):
+                    schedule = schedule_transition(st.session_state.current_stem_dicts, stems_out,
+                                                   base_dir="audio_clips", boundary="bar")
+            except (TypeError, ValueError):
+                schedule = None  # Non-numeric fades from the model: play unscheduled
+            if schedule:
+                st.session_state.current_stem_dicts = schedule["current_stems"]
+                st.session_state.next_stem_dicts = stems_out = schedule["next_stems"]
+                start_offset = schedule["start_offset"]
+
             fade_sec = stems_out[0]['fadeduration'] if stems_out else "?"
+            if isinstance(fade_sec, float):
+                fade_sec = round(fade_sec, 2)
             st.session_state.status = f"✅ Transition: {current_theme} → {next_theme} Now Mixing..."
             st.session_state.show_details = True
 
-            # Log all transition data for history view
-            st.session_state.history.append({
+            # Log all transition data: session log for the LLM, persistent store for history view
+            entry = {
                 "timestamp": time.time(),
                 "from_theme": current_theme,
                 "from_stem_dicts": list(st.session_state.current_stem_dicts),
                 "to_theme": next_theme,
                 "to_stem_dicts": list(st.session_state.next_stem_dicts),
                 "Transition": f"{current_theme} → {next_theme} | Crossfade over {fade_sec}s"
-            })
+            }
+            st.session_state.history.append(entry)
+            with telemetry.span("transition.history"):
+                get_history_store().append(st.session_state.session_id, entry)
+
+            # The mixer below picks up the new stems (and starts preloading them)
+            st.session_state.mix_start_offset = start_offset
 
-            # Actually perform the mix/crossfade if both valid stem sets exist
-            if st.session_state.current_stem_dicts and st.session_state.next_stem_dicts:
-                mix_and_transition(
-                    st.session_state.current_stem_dicts,
-                    st.session_state.next_stem_dicts
-                )
+            # While the user listens, warm the most likely next transitions from here; the
+            # current-theme selector follows on the next rerun, so the click keys match
+            st.session_state.pending_current_theme = next_theme
+            prefetcher.prefetch(st.session_state.history, next_theme)
+
+# ------------------- Stem Mixer (kept across reruns) ------------------------
+# One keyed component per session: its audio pool survives reruns, and it preloads
+# each new transition's stems before Play is pressed. Its timing reports feed telemetry.
+if st.session_state.current_stem_dicts and st.session_state.next_stem_dicts:
+    mixer_report = mix_and_transition(
+        st.session_state.current_stem_dicts,
+        st.session_state.next_stem_dicts,
+        start_offset=st.session_state.get("mix_start_offset", 0),
+        key="stem_mixer"
+    )
+    if mixer_report and mixer_report.get("report_id") != st.session_state.get("mixer_report_id"):
+        st.session_state.mixer_report_id = mixer_report.get("report_id")
+        record_mixer_report(mixer_report)
 
 # ------------------- Helper: Format stem display/details --------------------
 def stems_detail(stems, theme=None):
@@ -274,16 +336,51 @@ if st.session_state.show_details:
             )
     st.write("")
     llm_expl = st.session_state.get("llm_reasoning", "")
-    if llm_expl:
+    if llm_expl or llm_events is not None:
         st.markdown("<div style='margin-top:18px'></div>", unsafe_allow_html=True)
         st.markdown("#### 💡 LLM Reasoning/Explanation")
-        st.write(llm_expl)
+        reasoning_box = st.empty()
+        reasoning_box.write(llm_expl)
+        if llm_events is not None:
+            # The mix is already on screen and preloading; fill in the explanation as it streams
+            for event in llm_events:
+                if event["type"] == "explanation":
+                    llm_expl += event["text"]
+                    reasoning_box.write(llm_expl)
+                elif event["type"] == "done":
+                    llm_expl = event["result"].get("explanation", llm_expl)
+                    reasoning_box.write(llm_expl)
+            st.session_state.llm_reasoning = llm_expl
     st.markdown("---")
 
 # ------------------- Transition History Table ---------------------
-if st.session_state.history:
+# Only the visible page is queried from the history store and rendered
+HISTORY_PAGE_SIZE = 10
+HISTORY_WINDOWS = {"All time": None, "Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400}
+
+history_store = get_history_store()
+if history_store.count():
     st.markdown("### 📜 Transition History")
-    # Create a styled HTML table with all transition and stem/gain info
+    colh1, colh2, colh3 = st.columns([1, 2, 1])
+    with colh1:
+        scope = st.radio("Sessions", ["This session", "All sessions"], key="history_scope")
+    with colh2:
+        theme_filter = st.multiselect("Themes", themes, key="history_themes")
+    with colh3:
+        window = st.selectbox("Time window", list(HISTORY_WINDOWS), key="history_window")
+    filters = {
+        "session_id": st.session_state.session_id if scope == "This session" else None,
+        "themes": theme_filter or None,
+        "since": time.time() - HISTORY_WINDOWS[window] if HISTORY_WINDOWS[window] else None,
+    }
+    total = history_store.count(**filters)
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages}, {total} transitions)", min_value=1, max_value=pages,
+                           value=1, step=1, key="history_page")
+    page_entries = history_store.query(limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE,
+                                       **filters)
+
+    # Create a styled HTML table with the page's transition and stem/gain info
     style = """
     <style>
     table.history-table {border-collapse:collapse;width:100%;table-layout:fixed;}
@@ -301,15 +398,46 @@ if st.session_state.history:
     table.history-table td {background:#fff;}
     </style>
     """
-    table_html = style + "<table class='history-table'><thead><tr>" + \
-                 "<th>⏰ Time</th><th>🛤️ From Theme & Stems</th><th>🛤️ To Theme & Stems</th><th>🔄 Details</th></tr></thead><tbody>"
-
-    for entry in st.session_state.history:
+    rows = []
+    for entry in page_entries:
         dt = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry["timestamp"]))
         from_stems_str = stems_detail(entry.get("from_stem_dicts", []), entry.get("from_theme", ""))
         to_stems_str = stems_detail(entry.get("to_stem_dicts", []), entry.get("to_theme", ""))
         transition = entry.get("Transition", "")
-        table_html += f"<tr><td>{dt}</td><td>{from_stems_str}</td><td>{to_stems_str}</td><td>{transition}</td></tr>"
-    table_html += "</tbody></table>"
+        rows.append(f"<tr><td>{dt}</td><td>{from_stems_str}</td><td>{to_stems_str}</td><td>{transition}</td></tr>")
+    table_html = style + "<table class='history-table'><thead><tr>" + \
+                 "<th>⏰ Time</th><th>🛤️ From Theme & Stems</th><th>🛤️ To Theme & Stems</th><th>🔄 Details</th></tr></thead><tbody>" + \
+                 "".join(rows) + "</tbody></table>"
 
     st.markdown(table_html, unsafe_allow_html=True)
+
+# ------------------- Latency Debug Panel (optional) ---------------------
+# Per-stage latency percentiles, cache hit rates and the raw Prometheus export
+def format_ms(seconds):
+    """
+    Seconds -> milliseconds string for the latency table ("–" when there is no sample).
+    """
+    return "–" if seconds is None else f"{seconds * 1000:.1f}"
+
+if st.sidebar.checkbox("Show latency debug panel", key="show_debug_panel"):
+    telemetry = get_telemetry()
+    telemetry.register_cache("stems", get_default_store())
+    telemetry.register_cache("renders", get_default_render_cache())
+    with st.sidebar:
+        st.markdown("### ⏱️ Latency")
+        slo = telemetry.slo_report()
+        if slo["transitions"]:
+            st.metric(f"Transitions within {slo['slo_seconds']:g}s SLO", f"{slo['compliance']:.0%}",
+                      help=f"{slo['violations']} of {slo['transitions']} transitions were slower")
+        rows = "".join(
+            f"<tr><td>{row['stage']}</td><td>{row['count']}</td><td>{format_ms(row['last'])}</td>"
+            f"<td>{format_ms(row['p50'])}</td><td>{format_ms(row['p95'])}</td><td>{format_ms(row['p99'])}</td></tr>"
+            for row in telemetry.summary()
+        )
+        st.markdown("<table><thead><tr><th>Stage</th><th>n</th><th>last ms</th><th>p50</th><th>p95</th>"
+                    f"<th>p99</th></tr></thead><tbody>{rows}</tbody></table>", unsafe_allow_html=True)
+        for name, stats in telemetry.cache_stats().items():
+            rate = "–" if stats["hit_rate"] is None else f"{stats['hit_rate']:.0%}"
+            st.caption(f"Cache {name}: {rate} hits ({stats['hits']} hits / {stats['misses']} misses)")
+        with st.expander("Prometheus metrics"):
+            st.code(telemetry.render_prometheus(), language="text")
@@ -0,0 +1,155 @@
+# ---------------------------------------------------------------------------
+# history_store.py
+#
+# Step-by-step overview:
+# 1. Defines HistoryStore: an append-only SQLite log of transitions, kept across sessions
+#     - Each row stores the app's transition entry (from/to theme + stem dicts) and a
+#       SessionLogEntry-shaped record ({"event": ..., "intent": MusicalIntent fields})
+#     - Indexed by session, theme and time so queries never scan the whole history
+# 2. query(): one page of entries, filtered by session, theme and time window,
+#    newest first; page by offset (UI page numbers) or by before_id (keyset cursor)
+# 3. count()/transition_counts(): totals for pagination and cross-session analytics
+# ---------------------------------------------------------------------------
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HISTORY_PATH = ".transition_history.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transitions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    from_theme TEXT,
+    to_theme TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    log_entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_session ON transitions(session_id, id);
+CREATE INDEX IF NOT EXISTS transitions_time ON transitions(timestamp);
+CREATE INDEX IF NOT EXISTS transitions_from ON transitions(from_theme, timestamp);
+CREATE INDEX IF NOT EXISTS transitions_to ON transitions(to_theme, timestamp);
+"""
+
+def log_entry_from_transition(entry, event=None):
+    """
+    Builds a SessionLogEntry-shaped dict from an app history entry: the optional
+    triggering Event (None for manual UI transitions) and the resulting MusicalIntent.
+    """
+    stems = entry.get("to_stem_dicts", [])
+    names = [os.path.splitext(os.path.basename(stem["filename"]))[0] for stem in stems]
+    return {
+        "event": event.model_dump(mode="json") if event is not None else None,
+        "intent": {
+            "theme": entry.get("to_theme"),
+            "active_stems": names,
+            "target_gains": {name: stem.get("targetgain") for name, stem in zip(names, stems)},
+            "fade_durations": {name: stem.get("fadeduration") for name, stem in zip(names, stems)},
+            "timestamp": entry.get("timestamp"),
+        },
+    }
+
+class HistoryStore:
+    """
+    Persistent, append-only transition history shared by all sessions of the app.
+    Entries are returned as the same dicts the app appended, plus "id" and "session_id".
+    """
+    def __init__(self, db_path=DEFAULT_HISTORY_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, session_id, entry, event=None):
+        """
+        Appends one transition entry (dict with timestamp/from_theme/to_theme/...) and
+        returns its id.
+        """
+        timestamp = entry.get("timestamp") or time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO transitions (session_id, timestamp, from_theme, to_theme, entry, log_entry) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, timestamp, entry.get("from_theme"), entry["to_theme"],
+                 json.dumps(entry, default=str),
+                 json.dumps(log_entry_from_transition(entry, event), default=str)),
+            )
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def _where(self, session_id=None, themes=None, since=None, until=None, before_id=None):
+        """
+        Builds the WHERE clause and parameters shared by query() and count().
+        """
+        clauses, params = [], []
+        if session_id is not None:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if themes:
+            marks = ", ".join("?" * len(themes))
+            clauses.append(f"(from_theme IN ({marks}) OR to_theme IN ({marks}))")
+            params += list(themes) * 2
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, session_id=None, themes=None, since=None, until=None,
+              limit=20, offset=0, before_id=None, with_log_entry=False):
+        """
+        Returns up to `limit` matching entries, newest first.
+        Filters: session_id, themes (matches either side of the transition), and a
+        [since, until) epoch-seconds window. Page with offset, or pass the last id of
+        the previous page as before_id for constant-cost paging deep into the history.
+        """
+        where, params = self._where(session_id, themes, since, until, before_id)
+        columns = "id, session_id, entry" + (", log_entry" if with_log_entry else "")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM transitions{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        entries = []
+        for row in rows:
+            entry = json.loads(row[2])
+            entry["id"], entry["session_id"] = row[0], row[1]
+            if with_log_entry:
+                entry["log_entry"] = json.loads(row[3])
+            entries.append(entry)
+        return entries
+
+    def count(self, session_id=None, themes=None, since=None, until=None):
+        """
+        Number of entries matching the same filters as query().
+        """
+        where, params = self._where(session_id, themes, since, until)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM transitions{where}", params).fetchone()[0]
+
+    def transition_counts(self, session_id=None, since=None, until=None):
+        """
+        Returns {(from_theme, to_theme): count} over the matching history (analytics).
+        """
+        where, params = self._where(session_id, None, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT from_theme, to_theme, COUNT(*) FROM transitions{where} "
+                "GROUP BY from_theme, to_theme",
+                params,
+            ).fetchall()
+        return {(row[0], row[1]): row[2] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
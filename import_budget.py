@@ -0,0 +1,93 @@
+# ---------------------------------------------------------------------------
+# import_budget.py
+#
+# Step-by-step overview:
+# 1. Lists the headless core modules: schemas, intent/advisor logic, mixing/rendering,
+#    caches, scheduling and the batch/HTTP entry points (batch_runner,
+#    transition_service; everything except the Streamlit app and my_component.stem_mixer)
+# 2. Imports each one in a fresh interpreter with `python -X importtime` and reads
+#    its cumulative import time
+# 3. Fails if a module exceeds the budget, or if importing it pulled in a UI or
+#    heavy optional backend (Streamlit, Flask, pandas, the Gemini SDK, librosa, scipy,
+#    pyarrow) - those must only be imported on first use
+#
+# Usage:
+#   python import_budget.py                  # default budget, all core modules
+#   python import_budget.py --budget-ms 300 batch_runner stem_renderer
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CORE_MODULES = (
+    "theme_registry", "schemas", "session_log", "json_stream", "response_cache",
+    "stem_store", "stem_catalog", "stem_analysis", "render_cache", "stem_renderer",
+    "beat_scheduler", "llm_advisor", "intensity_engine", "prefetcher", "history_store",
+    "columnar", "telemetry", "batch_runner", "transition_service",
+)
+# Backends a core import must never load eagerly
+FORBIDDEN_MODULES = ("streamlit", "flask", "pandas", "google.genai", "librosa", "scipy", "pyarrow")
+DEFAULT_BUDGET_MS = 400.0
+
+_PROBE = (
+    "import json, sys; import {module}; "
+    "print(json.dumps(sorted(m for m in {forbidden!r} if m in sys.modules)))"
+)
+
+def measure_import(module, cwd=None):
+    """
+    Imports `module` in a fresh interpreter. Returns {"module", "ms", "forbidden"}, where
+    ms is the module's cumulative import time and forbidden lists loaded banned backends.
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    return {
+        "module": module,
+        "ms": cumulative_us / 1000.0 if cumulative_us is not None else None,
+        "forbidden": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+def check_imports(modules=CORE_MODULES, budget_ms=DEFAULT_BUDGET_MS):
+    """
+    Measures every module; returns (results, failures) where failures are messages.
+    """
+    results, failures = [], []
+    for module in modules:
+        result = measure_import(module)
+        results.append(result)
+        if result["forbidden"]:
+            failures.append(f"{module} imports {', '.join(result['forbidden'])} at load time")
+        if result["ms"] is not None and result["ms"] > budget_ms:
+            failures.append(f"{module} takes {result['ms']:.0f} ms to import (budget {budget_ms:.0f} ms)")
+    return results, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import time and lazy backends of the headless core.")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all core modules)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Maximum cumulative import time per module, in milliseconds")
+    args = parser.parse_args(argv)
+    results, failures = check_imports(args.modules or CORE_MODULES, args.budget_ms)
+    for result in results:
+        ms = "?" if result["ms"] is None else f"{result['ms']:.1f}"
+        print(f"{result['module']:20} {ms:>8} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
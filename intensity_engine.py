@@ -0,0 +1,160 @@
+# ---------------------------------------------------------------------------
+# intensity_engine.py
+#
+# Step-by-step overview:
+# 1. Defines the rule tables: stem -> musical role, gain range per role over
+#    intensity 0..100, per-flag gain multipliers, and fade time range
+# 2. Defines event_theme: maps a schemas.Event to the catalogued theme it should play
+#    (boss events prefer bosscombat, falling back to combat when it has no stems)
+# 3. Defines IntensityEngine: precomputes, per catalogued theme, a lookup table of
+#    gains for every intensity level (101 x stems) plus fade times, so turning an
+#    Event into a MusicalIntent is a table row lookup and one vector multiply
+#     - update() reports whether the theme changed, i.e. whether the LLM is needed
+# ---------------------------------------------------------------------------
+
+import numpy as np
+from schemas import MusicalIntent, local_now
+from stem_catalog import get_catalog
+
+# Musical role of each known stem (same roles the UI shows in STEM_FRIENDLY)
+STEM_ROLES = {
+    "synth": "melody",
+    "pad": "ambiance",
+    "drums": "rhythm",
+    "strings": "melody",
+    "bass": "bassline",
+    "chimes": "accent",
+}
+
+# (gain at intensity 0, gain at intensity 100) per role; unknown stems use "default"
+ROLE_GAIN_RANGE = {
+    "rhythm": (0.25, 1.0),
+    "bassline": (0.4, 0.9),
+    "melody": (0.7, 0.8),
+    "ambiance": (0.9, 0.35),
+    "accent": (0.1, 0.6),
+    "default": (0.6, 0.8),
+}
+
+# Per-flag gain multipliers by role, applied on top of the intensity curve
+FLAG_GAIN_SCALE = {
+    "low_health": {"melody": 0.6, "bassline": 1.15, "ambiance": 1.2},
+    "boss": {"rhythm": 1.15, "bassline": 1.1},
+    "hidden": {"rhythm": 0.5, "accent": 0.5},
+}
+
+# Fade time in seconds at intensity 0 and 100: calm music moves slowly, action reacts fast
+FADE_RANGE = (4.0, 0.5)
+INTENSITY_LEVELS = 101
+
+# Themes tried in order for events flagged "boss" (only those with stems are used)
+BOSS_THEMES = ("bosscombat", "combat")
+
+def event_theme(event, base_dir="audio_clips", catalog=None):
+    """
+    Maps a game event to the theme that should be playing for it, among the themes that
+    have stems in the catalog. Raises FileNotFoundError if none of the candidates do.
+    """
+    available = set((catalog or get_catalog(base_dir)).themes())
+    candidates = BOSS_THEMES if "boss" in event.flags else (event.state,)
+    if event.state in BOSS_THEMES:
+        candidates = BOSS_THEMES[BOSS_THEMES.index(event.state):]
+    for theme in candidates:
+        if theme in available:
+            return theme
+    raise FileNotFoundError(f"No stems for theme {' or '.join(candidates)} (event state {event.state!r})")
+
+class _ThemeTable:
+    """
+    Precomputed rule output for one theme: stem names, gain LUT and flag multipliers.
+    """
+    def __init__(self, stem_names):
+        self.stem_names = stem_names
+        roles = [STEM_ROLES.get(name, "default") for name in stem_names]
+        self.roles = roles
+        lo = np.array([ROLE_GAIN_RANGE.get(r, ROLE_GAIN_RANGE["default"])[0] for r in roles], dtype=np.float64)
+        hi = np.array([ROLE_GAIN_RANGE.get(r, ROLE_GAIN_RANGE["default"])[1] for r in roles], dtype=np.float64)
+        levels = np.linspace(0.0, 1.0, INTENSITY_LEVELS)[:, None]
+        self.gains = np.round(lo + (hi - lo) * levels, 3)            # (101, n_stems)
+        self._flag_scales = {}                                       # frozenset(flags) -> (n_stems,)
+
+    def flag_scale(self, flags):
+        """
+        Returns the combined multiplier vector for a set of flags (memoized per flag set).
+        """
+        scale = self._flag_scales.get(flags)
+        if scale is None:
+            scale = np.ones(len(self.stem_names))
+            for flag in flags:
+                rules = FLAG_GAIN_SCALE.get(flag)
+                if rules:
+                    scale = scale * np.array([rules.get(role, 1.0) for role in self.roles])
+            self._flag_scales[flags] = scale
+        return scale
+
+class IntensityEngine:
+    """
+    Rule-based, in-process mapping from Event (state, intensity, flags) to per-stem
+    target gains and fade times. No network calls: the LLM is only needed when
+    update() reports a theme change.
+    """
+    def __init__(self, base_dir="audio_clips", catalog=None):
+        self.catalog = catalog or get_catalog(base_dir)
+        self.fades = np.round(np.linspace(FADE_RANGE[0], FADE_RANGE[1], INTENSITY_LEVELS), 3).tolist()
+        self._tables = {}
+        self.current_theme = None
+
+    def table(self, theme):
+        """
+        Returns (building on first use) the lookup tables for a theme's catalogued stems.
+        """
+        table = self._tables.get(theme)
+        if table is None:
+            stem_names = [record.stem_name for record in self.catalog.stems(theme)]
+            if not stem_names:
+                raise FileNotFoundError(f"Theme folder not found: {theme}")
+            table = self._tables[theme] = _ThemeTable(stem_names)
+        return table
+
+    def intent_for(self, event, theme=None):
+        """
+        Returns the MusicalIntent for an event (theme defaults to event_theme(event)).
+        Built with model_construct: every value comes from pre-validated tables.
+        """
+        theme = theme or event_theme(event, catalog=self.catalog)
+        table = self.table(theme)
+        gains = table.gains[event.intensity]
+        if event.flags:
+            gains = np.round(np.minimum(gains * table.flag_scale(frozenset(event.flags)), 1.0), 3)
+        fade = self.fades[event.intensity]
+        names = table.stem_names
+        return MusicalIntent.model_construct(
+            theme=theme,
+            active_stems=list(names),
+            target_gains=dict(zip(names, gains.tolist())),
+            fade_durations=dict.fromkeys(names, fade),
+            timestamp=local_now(),
+        )
+
+    def update(self, event):
+        """
+        Follows one event. Returns (intent, theme_changed); theme_changed means a
+        theme-level decision (LLM consultation) is warranted.
+        """
+        theme = event_theme(event, catalog=self.catalog)
+        theme_changed = theme != self.current_theme
+        self.current_theme = theme
+        return self.intent_for(event, theme), theme_changed
+
+def intent_to_stem_dicts(intent):
+    """
+    Converts a MusicalIntent to the mixer's stem dicts (filename/targetgain/fadeduration).
+    """
+    return [
+        {
+            "filename": f"{intent.theme}/{name}.wav",
+            "targetgain": intent.target_gains.get(name, 0.0),
+            "fadeduration": intent.fade_durations.get(name, FADE_RANGE[0]),
+        }
+        for name in intent.active_stems
+    ]
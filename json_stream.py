@@ -0,0 +1,137 @@
+# ---------------------------------------------------------------------------
+# json_stream.py
+#
+# Step-by-step overview:
+# 1. Defines IncrementalJSONExtractor: consumes LLM text chunk by chunk and tracks
+#    brace depth plus string/escape state, so the first top-level JSON object is
+#    parsed the moment its closing brace arrives (no waiting for the full response)
+#     - Text after the object is collected as the explanation/reasoning
+#     - Braces and quotes inside JSON strings are handled correctly
+# 2. Defines extract_llm_json_and_reasoning: one-shot helper over the same extractor,
+#    used by LLMAdvisor._parse_response (single parser for the whole app)
+# ---------------------------------------------------------------------------
+
+import json
+import re
+
+# Characters that can change the scanner state; everything else is skipped in bulk
+_SPECIAL = re.compile(r'[{}"\\]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*")
+
+class IncrementalJSONExtractor:
+    """
+    Brace/string-aware scanner for the first top-level JSON object in streamed text.
+    Call feed() with each chunk; it returns the parsed object once, on the chunk where
+    the object closes. Afterwards, .intent holds the object and .explanation the rest.
+    Candidate objects that are not valid JSON (e.g. "{placeholder}" in prose) are skipped.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._scan_pos = 0       # absolute offset of the next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None       # absolute offset of the current candidate's "{"
+        self._end = None         # absolute offset just past the accepted object
+        self.intent = None
+
+    @property
+    def done(self):
+        return self.intent is not None
+
+    @property
+    def end(self):
+        """
+        Offset just past the accepted JSON object (None until one is found).
+        """
+        return self._end
+
+    @property
+    def text(self):
+        """
+        Everything fed so far.
+        """
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def explanation(self):
+        """
+        Text after the JSON object (minus a closing code fence), or all text if no object was found.
+        """
+        if self._end is None:
+            return self.text.strip()
+        rest = self.text[self._end:]
+        return _FENCE.sub("", rest, count=1).strip()
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of text. Returns the parsed object if it completed in this chunk, else None.
+        """
+        if not chunk:
+            return None
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        if self.done:
+            return None
+        return self._scan(chunk, offset)
+
+    def _scan(self, chunk, offset):
+        pos = self._scan_pos - offset
+        while pos < len(chunk):
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            if self._in_string:
+                match = _STRING_SPECIAL.search(chunk, pos)
+            else:
+                match = _SPECIAL.search(chunk, pos)
+            if match is None:
+                break
+            pos = match.start()
+            c = chunk[pos]
+            if self._in_string:
+                if c == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+            elif c == '"':
+                # Quotes only matter inside a candidate object; prose may contain stray quotes
+                self._in_string = self._depth > 0
+            elif c == "{":
+                if self._depth == 0:
+                    self._start = offset + pos
+                self._depth += 1
+            elif c == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    end = offset + pos + 1
+                    try:
+                        obj = json.loads(self.text[self._start:end])
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        self.intent = obj
+                        self._end = end
+                        self._scan_pos = end
+                        return obj
+                    self._start = None
+            pos += 1
+        self._scan_pos = offset + len(chunk)
+        return None
+
+def extract_llm_json_and_reasoning(text):
+    """
+    Parses out the first JSON object and the reasoning text that follows it.
+    Returns ({}, "") if the text contains no valid JSON object.
+    """
+    extractor = IncrementalJSONExtractor()
+    extractor.feed(text or "")
+    if not extractor.done:
+        return {}, ""
+    return extractor.intent, extractor.explanation
@@ -2,74 +2,169 @@
 # llm_advisor.py
 #
 # Step-by-step overview:
-# 1. Imports all required dependencies (LLM API, os, regex, schema classes)
-# 2. Defines generate_mix_intent_from_folder: loads stem info from directory, builds MixIntent
+# 1. Imports all required dependencies (os, regex, schema classes); the Gemini SDK
+#    (google.genai) is imported only when an LLM client is created
+# 2. Defines generate_mix_intent_from_folder: loads stem info from the stem catalog, builds MixIntent
+#    (loudness-normalized default gains when stem_analysis.py features exist;
+#    stem_dicts_from_mix_intent turns it into mixer/advisor stem dicts)
 # 3. Defines LLMAdvisor class for accessing and using the Gemini (Google) LLM
 #     - Initializes LLM client (API key required)
 #     - Builds prompt for new music intent based on previous session and current state
+#       (plus precomputed stem loudness/tempo features)
 #     - Calls the generative LLM model
-#     - Parses out next mix intent (with robust JSON fallback/explanation)
-# 4. Returns output for use by main Streamlit app and transition UI
+#     - Parses out next mix intent with the incremental JSON extractor (json_stream.py)
+#       and maps its theme label to the canonical name (theme_registry.py)
+#     - recommend_stream(): emits the intent as soon as the JSON block closes, then streams
+#       the explanation text
+#     - Optionally memoizes parsed responses in a ResponseCache (LRU/TTL/disk)
+#     - Each stage is timed and prompt/response sizes are recorded (telemetry.py)
+# 4. Defines plan_local_intent: deterministic, catalog-based fallback for the next intent
+# 5. Defines AsyncLLMAdvisor: one long-lived transport, bounded concurrency, per-call
+#    latency budget, and local-planner fallback on timeout/failure
+#     - Transports are injectable (GenaiTransport for Gemini, StubTransport /
+#       LocalPlannerTransport for tests and load tests)
+#     - recommend_sync()/recommend_stream_sync(): blocking wrappers for Streamlit
+# 6. Returns output for use by main Streamlit app and transition UI
 # ---------------------------------------------------------------------------
 
-from google import genai
+import asyncio
+import json
 import os
+import queue
 import re
-import json
+import threading
+import weakref
+from datetime import datetime
 from schemas import MixIntent, StemIntent
+from stem_catalog import get_catalog
+from stem_analysis import get_analysis
+from response_cache import make_cache_key
+from session_log import encode_session_log
+from json_stream import IncrementalJSONExtractor
+from theme_registry import resolve_theme
+from telemetry import get_telemetry, traced
 
 def generate_mix_intent_from_folder(theme: str,
                                    base_dir: str = "audio_clips",
                                    default_gain: float = 0.8,
-                                   default_fade: float = 2.0
+                                   default_fade: float = 2.0,
+                                   normalize: bool = True
                                    ) -> MixIntent:
     """
-    Scans the audio_clips/{theme}/ directory for .wav files,
+    Looks up the audio_clips/{theme}/ stems in the persistent stem catalog,
     generates default gain/fade, and returns a MixIntent object.
+    With normalize=True, stems that have precomputed analysis (stem_analysis.py) get
+    loudness-normalized gains instead of the flat default_gain.
     """
-    theme_dir = os.path.join(base_dir, theme)
-    if not os.path.exists(theme_dir):
-        raise FileNotFoundError(f"Theme folder not found: {theme_dir}")
+    catalog = get_catalog(base_dir)
+    records = catalog.stems(theme)
+    if not records:
+        raise FileNotFoundError(f"Theme folder not found: {os.path.join(base_dir, theme)}")
+    gains = get_analysis(base_dir).normalized_gains(theme, default_gain) if normalize else {}
 
     stem_intents = []
-    for fname in os.listdir(theme_dir):
-        if fname.endswith(".wav"):
-            stem_name = os.path.splitext(fname)[0]
-            file_path = os.path.join(theme_dir, fname)
-            stem_intents.append(
-                StemIntent(
-                    stem_name=stem_name,
-                    file_path=file_path,
-                    target_gain=default_gain,
-                    fade_duration=default_fade
-                )
+    for record in records:
+        stem_intents.append(
+            StemIntent(
+                stem_name=record.stem_name,
+                file_path=os.path.join(catalog.base_dir, record.path),
+                target_gain=gains.get(record.stem_name, default_gain),
+                fade_duration=default_fade
             )
+        )
     return MixIntent(theme=theme, stem_intents=stem_intents)
 
+def stem_dicts_from_mix_intent(mix: MixIntent) -> list:
+    """
+    Converts a MixIntent to the "theme/stem.wav" stem dicts the mixer and advisor use.
+    """
+    return [
+        {"filename": f"{mix.theme}/{os.path.basename(stem.file_path)}",
+         "targetgain": stem.target_gain,
+         "fadeduration": stem.fade_duration}
+        for stem in mix.stem_intents
+    ]
+
+def plan_local_intent(next_theme: str,
+                      base_dir: str = "audio_clips",
+                      default_gain: float = 0.8,
+                      default_fade: float = 2.0
+                      ) -> dict:
+    """
+    Deterministic local planner: builds a next intent in the same JSON shape the LLM
+    returns (theme/activestems/targetgains/fadedurations/timestamp), using every
+    catalogued stem of next_theme with the default gain and fade.
+    """
+    mix = generate_mix_intent_from_folder(next_theme, base_dir, default_gain, default_fade)
+    return {
+        "theme": mix.theme,
+        "activestems": [si.stem_name for si in mix.stem_intents],
+        "targetgains": {si.stem_name: si.target_gain for si in mix.stem_intents},
+        "fadedurations": {si.stem_name: si.fade_duration for si in mix.stem_intents},
+        "timestamp": datetime.now().isoformat(),
+    }
+
+def _response_text(response):
+    """
+    Pulls the generated text out of a Gemini response object.
+    """
+    try:
+        # Gemini returns .candidates, OpenAI returns .text or similar
+        candidates = getattr(response, "candidates", None)
+        if candidates:
+            parts = candidates[0]['content']['parts']
+            result = parts[0]['text'] if parts else str(response)
+        else:
+            result = getattr(response, "text", str(response))
+    except Exception:
+        result = getattr(response, "text", None) or str(response)
+    return result
+
 class LLMAdvisor:
     """
     Advisor class to interact with Gemini/Google LLM API for
     generating music transition intents and explanations.
     """
-    def __init__(self, model_name="gemini-2.5-flash"):
+    def __init__(self, model_name="gemini-2.5-flash", cache=None, base_dir="audio_clips"):
         # Load LLM API key from environment and initialize client
         self.model_name = model_name
+        self.cache = cache
+        self.base_dir = base_dir
         apikey = os.getenv("GOOGLE_API_KEY")
         if not apikey:
             raise ValueError("GOOGLE_API_KEY environment variable not set")
+        from google import genai  # Deferred: the SDK is slow to import and unused by headless paths
         self.client = genai.Client(api_key=apikey)
 
+    @traced("llm.recommend")
     def recommend(self, session_log, current_state, next_theme, user_query=None):
         """
         Recommend the next mix intent (stems, gains, fades) via LLM API, given session log and theme.
+        If a cache is configured, identical inputs are answered without calling the LLM.
         """
-        prompt = self._build_prompt(session_log, current_state, next_theme, user_query)
+        encoded_log = encode_session_log(session_log)  # Shared by the cache key and the prompt
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(current_state, next_theme, user_query, session_log, self.model_name,
+                                 encoded_log)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        prompt = self._build_prompt(session_log, current_state, next_theme, user_query, encoded_log)
         response = self._call_llm_api(prompt)
-        return self._parse_response(response)
+        result = self._parse_response(response)
+        # Only successful parses are worth replaying
+        if key is not None and result.get("next_intent"):
+            self.cache.put(key, result)
+        return result
 
-    def _build_prompt(self, session_log, current_state, next_theme, user_query):
+    @traced("llm.prompt_build")
+    def _build_prompt(self, session_log, current_state, next_theme, user_query, encoded_log=None):
         """
         Construct LLM prompt with schema and complete context.
+        The session log is compacted (recent transitions + summary) to a bounded JSON string
+        (encoded_log: an already computed encode_session_log(session_log)).
+        Precomputed stem loudness/tempo features are included when available.
         Always asks for valid JSON first, then reasoning/explanation.
         """
         schema_description = '''Respond in two parts:
@@ -83,11 +178,15 @@ class LLMAdvisor:
 2. A detailed explanation of your reasoning for the choice, in plain text (not markdown).
 Always put the JSON block first, then the explanation.
 '''
+        if encoded_log is None:
+            encoded_log = encode_session_log(session_log)
+        current_theme = current_state[0]['filename'].split('/')[0] if current_state else '[unknown]'
         prompt = (
-            f"Session log: {session_log}\n"
+            f"Session log: {encoded_log}\n"
             f"Current state: {current_state}\n"
-            f"Current theme: {current_state[0]['filename'].split('/')[0] if current_state else '[unknown]'}\n"
+            f"Current theme: {current_theme}\n"
             f"Next theme: {next_theme}\n"
+            f"{self._features_line(current_theme, next_theme)}"
             f"{schema_description}\n"
             f"Transition the music mix from the current theme to the provided NEXT_THEME ('{next_theme}').\n"
             f"Given that the user requests to transition, generate all stem info for the NEXT_THEME ONLY.\n"
@@ -95,8 +194,22 @@ Always put the JSON block first, then the explanation.
         )
         if user_query:
             prompt += f"\nUser question: {user_query}"
+        get_telemetry().observe("llm_prompt_chars", len(prompt))
         return prompt
 
+    def _features_line(self, current_theme, next_theme):
+        """
+        Prompt line with measured per-stem loudness (LUFS), peak and tempo, or "" if the
+        stems have not been analyzed.
+        """
+        analysis = get_analysis(self.base_dir)
+        features = {theme: analysis.prompt_features(theme) for theme in (current_theme, next_theme)}
+        features = {theme: stems for theme, stems in features.items() if stems}
+        if not features:
+            return ""
+        return f"Stem features (LUFS/peak dBFS/BPM): {json.dumps(features, separators=(',', ':'))}\n"
+
+    @traced("llm.call")
     def _call_llm_api(self, prompt):
         """
         Calls the Gemini/Google LLM model using the prompt (API key must be set).
@@ -105,50 +218,363 @@ Always put the JSON block first, then the explanation.
             model=self.model_name,
             contents=prompt
         )
-        try:
-            # Gemini returns .candidates, OpenAI returns .text or similar
-            candidates = getattr(response, "candidates", None)
-            if candidates:
-                parts = candidates[0]['content']['parts']
-                result = parts[0]['text'] if parts else str(response)
-            else:
-                result = getattr(response, "text", str(response))
-        except Exception:
-            result = str(response)
-        return result
+        return _response_text(response)
+
+    def _stream_llm_api(self, prompt):
+        """
+        Streams the Gemini/Google LLM response, yielding text chunks as they arrive.
+        """
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt
+        ):
+            yield getattr(chunk, "text", None) or ""
+
+    def recommend_stream(self, session_log, current_state, next_theme, user_query=None):
+        """
+        Streaming recommend(). Yields event dicts while the LLM response arrives:
+          {"type": "intent", "next_intent": {...}}  once: as soon as the JSON object closes,
+                                                    or {} at the end if there was none
+          {"type": "explanation", "text": "..."}    explanation text as it streams in
+          {"type": "done", "result": {...}}         final result, same shape as recommend()
+        """
+        encoded_log = encode_session_log(session_log)  # Shared by the cache key and the prompt
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(current_state, next_theme, user_query, session_log, self.model_name,
+                                 encoded_log)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from _result_events(cached)
+                return
+        prompt = self._build_prompt(session_log, current_state, next_theme, user_query, encoded_log)
+        extractor = IncrementalJSONExtractor()
+        for chunk in self._stream_llm_api(prompt):
+            yield from _chunk_events(extractor, chunk)
+        get_telemetry().observe("llm_response_chars", len(extractor.text))
+        result = _result_from_extractor(extractor)
+        if key is not None and result.get("next_intent"):
+            self.cache.put(key, result)
+        if not extractor.done:
+            yield {"type": "intent", "next_intent": {}}
+        yield {"type": "done", "result": result}
 
+    @traced("llm.parse")
     def _parse_response(self, response):
         """
         Attempts to parse the LLM's response into two fields:
-          - next_intent (JSON for new musical stem plan)
-          - explanation (freeform text)
-        Handles fallback for malformed output/JSON blocks.
+          - next_intent (first JSON object found in the text)
+          - explanation (freeform text after it, or the whole response if no JSON was found)
         """
-        result = {"next_intent": {}, "explanation": ""}
+        get_telemetry().observe("llm_response_chars", len(response or ""))
+        extractor = IncrementalJSONExtractor()
+        extractor.feed(response or "")
+        return _result_from_extractor(extractor)
+
+def _canonical_intent(intent):
+    """
+    Maps the model's free-form "theme" label ("Boss Fight", "stelth") to its canonical
+    registry name; unrecognized labels are left as returned.
+    """
+    if isinstance(intent, dict) and isinstance(intent.get("theme"), str):
+        intent["theme"] = resolve_theme(intent["theme"]) or intent["theme"]
+    return intent
+
+def _result_from_extractor(extractor):
+    """
+    Builds the recommend() result dict from a fed IncrementalJSONExtractor.
+    """
+    return {"next_intent": _canonical_intent(extractor.intent) or {}, "explanation": extractor.explanation}
+
+def _chunk_events(extractor, chunk, require_stems=False):
+    """
+    Feeds one streamed chunk and yields the resulting stream events. With require_stems,
+    an intent without "activestems" and the explanation after it are not emitted (the
+    caller replaces them with a fallback).
+    """
+    if extractor.done:
+        if chunk and (not require_stems or extractor.intent.get("activestems")):
+            yield {"type": "explanation", "text": chunk}
+        return
+    intent = extractor.feed(chunk)
+    if intent is not None and (not require_stems or intent.get("activestems")):
+        yield {"type": "intent", "next_intent": _canonical_intent(intent)}
+        tail = extractor.text[extractor.end:]
+        if tail:
+            yield {"type": "explanation", "text": tail}
+
+def _result_events(result):
+    """
+    Replays a complete result (cached or fallback) as stream events.
+    """
+    yield {"type": "intent", "next_intent": result.get("next_intent", {})}
+    if result.get("explanation"):
+        yield {"type": "explanation", "text": result["explanation"]}
+    yield {"type": "done", "result": result}
+
+class GenaiTransport:
+    """
+    Async transport that sends a prompt to Gemini through one long-lived genai client.
+    """
+    def __init__(self, model_name="gemini-2.5-flash"):
+        self.model_name = model_name
+        apikey = os.getenv("GOOGLE_API_KEY")
+        if not apikey:
+            raise ValueError("GOOGLE_API_KEY environment variable not set")
+        from google import genai
+        self.client = genai.Client(api_key=apikey)
+
+    async def __call__(self, prompt):
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=prompt
+        )
+        return _response_text(response)
+
+    async def stream(self, prompt):
+        """
+        Yields response text chunks as Gemini streams them.
+        """
+        chunks = await self.client.aio.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt
+        )
+        async for chunk in chunks:
+            yield getattr(chunk, "text", None) or ""
+
+class StubTransport:
+    """
+    Local stand-in for the LLM: returns a canned response after a configurable delay.
+    Used for tests, benchmarks and load tests without network access.
+    """
+    def __init__(self, response_text, delay=0.0, chunk_size=64):
+        self.response_text = response_text
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _text(self, prompt):
+        return self.response_text
+
+    async def __call__(self, prompt):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._text(prompt)
+
+    async def stream(self, prompt):
+        """
+        Yields the canned response in chunk_size pieces, spreading the delay across them.
+        """
+        self.calls += 1
+        text = self._text(prompt)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for piece in pieces:
+            if self.delay:
+                await asyncio.sleep(self.delay / len(pieces))
+            yield piece
+
+class LocalPlannerTransport(StubTransport):
+    """
+    StubTransport that answers any prompt with a well-formed response for the prompt's
+    "Next theme:", built by plan_local_intent. Lets load tests exercise the full
+    pipeline for every theme without network access.
+    """
+    def __init__(self, base_dir="audio_clips", delay=0.0, chunk_size=64):
+        super().__init__("", delay, chunk_size)
+        self.base_dir = base_dir
+
+    def _text(self, prompt):
+        match = re.search(r"^Next theme: (.+)$", prompt, re.MULTILINE)
+        theme = match.group(1).strip() if match else ""
+        intent = plan_local_intent(theme, self.base_dir)
+        return json.dumps(intent) + f"\nLocal planner response for '{theme}'."
+
+class AsyncLLMAdvisor(LLMAdvisor):
+    """
+    asyncio variant of LLMAdvisor meant to be created once and reused.
+    - At most max_concurrency LLM requests are in flight at a time
+    - Each call (including waiting for a slot) must finish within timeout seconds
+    - On timeout, transport errors or an unparseable answer, the next intent comes
+      from plan_local_intent instead, so a valid intent is always returned
+    Results carry a "source" key: "llm", "cache" or "fallback".
+    """
+    def __init__(self, model_name="gemini-2.5-flash", transport=None, cache=None,
+                 max_concurrency=4, timeout=5.0, base_dir="audio_clips"):
+        self.model_name = model_name
+        self.transport = transport or GenaiTransport(model_name)
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.base_dir = base_dir
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> semaphore
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _semaphore(self):
+        """
+        Returns the concurrency limiter for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @traced("llm.call")
+    async def _call_llm_api_async(self, prompt):
+        async with self._semaphore():
+            return await self.transport(prompt)
+
+    def _fallback(self, next_theme, reason):
+        """
+        Builds a result from the local planner, recording why the LLM was skipped.
+        """
+        return {
+            "next_intent": plan_local_intent(next_theme, self.base_dir),
+            "explanation": f"Local planner used ({reason}): default gains and fades for '{next_theme}'.",
+            "source": "fallback",
+        }
+
+    @traced("llm.recommend")
+    async def recommend(self, session_log, current_state, next_theme, user_query=None):
+        """
+        Async recommend(): cache lookup, then a budgeted LLM call, then local fallback.
+        """
+        encoded_log = encode_session_log(session_log)  # Shared by the cache key and the prompt
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(current_state, next_theme, user_query, session_log, self.model_name,
+                                 encoded_log)
+            cached = self.cache.get(key)
+            if cached is not None:
+                cached["source"] = "cache"
+                return cached
+        prompt = self._build_prompt(session_log, current_state, next_theme, user_query, encoded_log)
         try:
-            # Match JSON object at top of response, then treat rest as explanation
-            match = re.match(r"\s*({[\s\S]+?})\s*([\s\S]+)", response)
-            if match:
-                intent_json = match.group(1)
-                explanation = match.group(2)
-                intent = json.loads(intent_json)
-                result["next_intent"] = intent
-                result["explanation"] = explanation
-            else:
-                # --- Robust fallback: Find any JSON block in full LLM text ---
-                explanation = response
-                json_regex = re.findall(r'``````', response)
-                if not json_regex:
-                    json_regex = re.findall(r'({[\s\S]+?})', response)
-                if json_regex:
-                    try:
-                        intent = json.loads(json_regex[0])
-                        result["next_intent"] = intent
-                        result["explanation"] = explanation
-                    except Exception as e:
-                        result["explanation"] = f"Failed to parse JSON: {e}\nRaw response: {response}"
-                else:
-                    result["explanation"] = response
+            response = await asyncio.wait_for(self._call_llm_api_async(prompt), self.timeout)
+        except asyncio.TimeoutError:
+            return self._fallback(next_theme, f"LLM exceeded {self.timeout}s budget")
         except Exception as e:
-            result["explanation"] = f"Failed to parse: {e}\nRaw response: {response}"
+            return self._fallback(next_theme, f"LLM call failed: {e}")
+        result = self._parse_response(response)
+        if not result.get("next_intent", {}).get("activestems"):
+            fallback = self._fallback(next_theme, "LLM response had no usable intent")
+            fallback["explanation"] += f"\nRaw response: {response}"
+            return fallback
+        if key is not None:
+            self.cache.put(key, result)
+        result["source"] = "llm"
         return result
+
+    async def recommend_stream(self, session_log, current_state, next_theme, user_query=None):
+        """
+        Async streaming recommend(); yields the same events as LLMAdvisor.recommend_stream.
+        The latency budget covers the time until the intent is emitted; the explanation
+        may keep streaming afterwards. A streamed intent without stems (and the text after
+        it) is held back and the fallback's events are emitted instead, so consumers see
+        exactly one intent event. Requires a transport with a stream() method.
+        """
+        encoded_log = encode_session_log(session_log)  # Shared by the cache key and the prompt
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(current_state, next_theme, user_query, session_log, self.model_name,
+                                 encoded_log)
+            cached = self.cache.get(key)
+            if cached is not None:
+                cached["source"] = "cache"
+                for event in _result_events(cached):
+                    yield event
+                return
+        prompt = self._build_prompt(session_log, current_state, next_theme, user_query, encoded_log)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        extractor = IncrementalJSONExtractor()
+        semaphore = self._semaphore()
+        failure = None
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            failure = f"LLM exceeded {self.timeout}s budget"
+        if failure is None:
+            chunks = None
+            try:
+                chunks = self.transport.stream(prompt).__aiter__()
+                while True:
+                    budget = None if extractor.done else deadline - loop.time()
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), budget)
+                    except StopAsyncIteration:
+                        break
+                    for event in _chunk_events(extractor, chunk, require_stems=True):
+                        yield event
+            except asyncio.TimeoutError:
+                failure = f"LLM exceeded {self.timeout}s budget"
+            except Exception as e:
+                failure = f"LLM call failed: {e}"
+            finally:
+                get_telemetry().observe("llm_response_chars", len(extractor.text))
+                semaphore.release()
+                if chunks is not None and hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+        if not extractor.done or not extractor.intent.get("activestems"):
+            for event in _result_events(self._fallback(next_theme, failure or "LLM response had no usable intent")):
+                yield event
+            return
+        result = _result_from_extractor(extractor)
+        if key is not None:
+            self.cache.put(key, result)
+        result["source"] = "llm"
+        yield {"type": "done", "result": result}
+
+    def _background_loop(self):
+        """
+        Lazily starts one daemon thread running an event loop for synchronous callers.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-advisor-loop", daemon=True).start()
+            return self._loop
+
+    def recommend_sync(self, session_log, current_state, next_theme, user_query=None):
+        """
+        Blocking wrapper around recommend() for non-async callers such as Streamlit.
+        All calls share one background event loop, so the transport's client is reused.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.recommend(session_log, current_state, next_theme, user_query),
+            self._background_loop()
+        )
+        result = future.result()
+        get_telemetry().inc("llm_results_total", source=result.get("source", "llm"))
+        return result
+
+    def recommend_stream_sync(self, session_log, current_state, next_theme, user_query=None):
+        """
+        Blocking iterator over recommend_stream() events for non-async callers such as
+        Streamlit: the intent event is yielded as soon as it is parsed, so mixing can start
+        while the explanation is still streaming. The stream runs on the shared background
+        loop to completion (and fills the cache) even if the caller stops iterating early.
+        """
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for event in self.recommend_stream(session_log, current_state, next_theme, user_query):
+                    if event["type"] == "done":
+                        get_telemetry().inc("llm_results_total", source=event["result"].get("source", "llm"))
+                    events.put(event)
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(None)
+
+        asyncio.run_coroutine_threadsafe(pump(), self._background_loop())
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
@@ -0,0 +1,139 @@
+# ---------------------------------------------------------------------------
+# load_test.py
+#
+# Step-by-step overview:
+# 1. Starts transition_service in-process with a stubbed LLM (LocalPlannerTransport),
+#    or targets an already running server (e.g. gunicorn) with --url
+# 2. Simulates N concurrent game clients: each creates a session, then performs a
+#    sequence of transitions between random themes and fetches each render
+# 3. Reports request counts, errors, throughput and latency percentiles as JSON
+#
+# Usage:
+#   python load_test.py --clients 32 --transitions 10 --stub-delay 0.3
+#   python load_test.py --url http://127.0.0.1:8000 --clients 64
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from batch_runner import latency_summary
+
+def _request(url, payload=None):
+    """
+    Sends a GET (or a JSON POST if payload is given); returns (status, body bytes).
+    """
+    data = None
+    headers = {}
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def run_client(base_url, themes, transitions, seed, fetch_audio=True):
+    """
+    One simulated game client. Returns (transition latencies, render latencies, errors).
+    """
+    rng = random.Random(seed)
+    theme = rng.choice(themes)
+    status, body = _request(f"{base_url}/sessions", {"theme": theme})
+    if status != 201:
+        return [], [], 1
+    session_id = json.loads(body)["session_id"]
+    transition_times = []
+    render_times = []
+    errors = 0
+    for _ in range(transitions):
+        next_theme = rng.choice([t for t in themes if t != theme] or themes)
+        start = time.perf_counter()
+        status, body = _request(f"{base_url}/sessions/{session_id}/transition",
+                                {"next_theme": next_theme})
+        transition_times.append(time.perf_counter() - start)
+        if status != 200:
+            errors += 1
+            continue
+        theme = next_theme
+        render_url = json.loads(body).get("render_url")
+        if fetch_audio and render_url:
+            start = time.perf_counter()
+            status, _ = _request(f"{base_url}{render_url}")
+            render_times.append(time.perf_counter() - start)
+            errors += status != 200
+    return transition_times, render_times, errors
+
+def _start_local_server(base_dir, stub_delay, state_dir):
+    """
+    Serves create_app() on a random local port from a background thread.
+    """
+    from werkzeug.serving import make_server
+    from transition_service import create_app
+    server = make_server("127.0.0.1", 0, create_app(base_dir, state_dir, stub_delay=stub_delay),
+                         threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run_load_test(url=None, clients=16, transitions=5, base_dir="audio_clips",
+                  stub_delay=0.2, fetch_audio=True, seed=0):
+    """
+    Runs the simulated clients concurrently and returns a summary dict.
+    """
+    server = None
+    state_dir = None
+    if url is None:
+        state_dir = tempfile.TemporaryDirectory(prefix="transition_service_")
+        server, url = _start_local_server(base_dir, stub_delay, state_dir.name)
+    start = time.perf_counter()
+    try:
+        themes = json.loads(_request(f"{url}/themes")[1])["themes"]
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(
+                lambda i: run_client(url, themes, transitions, seed + i, fetch_audio),
+                range(clients),
+            ))
+    finally:
+        if server is not None:
+            server.shutdown()
+            state_dir.cleanup()
+    elapsed = time.perf_counter() - start
+    transition_times = [t for result in results for t in result[0]]
+    render_times = [t for result in results for t in result[1]]
+    return {
+        "url": url,
+        "clients": clients,
+        "transitions": len(transition_times),
+        "errors": sum(result[2] for result in results),
+        "elapsed_s": elapsed,
+        "transitions_per_s": len(transition_times) / elapsed if elapsed else None,
+        "transition_latency_s": latency_summary(transition_times),
+        "render_fetch_latency_s": latency_summary(render_times),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the transition service with simulated clients.")
+    parser.add_argument("--url", help="Base URL of a running service (default: start one in-process)")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent simulated clients")
+    parser.add_argument("--transitions", type=int, default=5, help="Transitions per client")
+    parser.add_argument("--base-dir", default="audio_clips", help="Stem root directory (in-process server only)")
+    parser.add_argument("--stub-delay", type=float, default=0.2,
+                        help="Simulated LLM latency in seconds (in-process server only)")
+    parser.add_argument("--no-audio", action="store_true", help="Skip fetching rendered WAVs")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for theme choices")
+    args = parser.parse_args(argv)
+    summary = run_load_test(args.url, args.clients, args.transitions, args.base_dir,
+                            args.stub_delay, not args.no_audio, args.seed)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
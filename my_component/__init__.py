@@ -1,25 +1,33 @@
 import os
-import streamlit.components.v1 as components
 
 # Set this to True for production (static build), False for dev (npm run start)
 _RELEASE = True
 
-if not _RELEASE:
-    # For development: use live Vite server (`npm run start` must be running!)
-    _component_func = components.declare_component(
-        "my_component",
-        url="http://localhost:3001",
-    )
-else:
-    # For production: use static build directory
-    parent_dir = os.path.dirname(os.path.abspath(__file__))
-    build_dir = os.path.join(parent_dir, "frontend", "build")
-    print("COMPONENT BUILD DIR:", build_dir)
-    _component_func = components.declare_component(
-        "my_component",
-        path=build_dir
-    )
+_component_func = None
+
+def _declare():
+    """
+    Declares the component on first use, so importing the package (e.g. for
+    my_component.stem_mixer) does not import Streamlit or register anything.
+    """
+    global _component_func
+    if _component_func is None:
+        import streamlit.components.v1 as components
+        if not _RELEASE:
+            # For development: use live Vite server (`npm run start` must be running!)
+            _component_func = components.declare_component(
+                "my_component",
+                url="http://localhost:3001",
+            )
+        else:
+            # For production: use static build directory
+            parent_dir = os.path.dirname(os.path.abspath(__file__))
+            build_dir = os.path.join(parent_dir, "frontend", "build")
+            _component_func = components.declare_component(
+                "my_component",
+                path=build_dir
+            )
+    return _component_func
 
 def my_component(name, key=None):
-    print("my_component called with:", name)
-    return _component_func(name=name, key=key, default=0)
+    return _declare()(name=name, key=key, default=0)
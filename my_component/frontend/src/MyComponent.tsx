@@ -5,8 +5,14 @@
 // 1. Imports React, Howler.js (audio playback), Streamlit Component connector.
 // 2. Declares strong types for stems and internal state.
 // 3. Main class: Handles play button logic, parses stems from props, triggers fade out/in
-//    for current/next theme stems using Howler.js.
-// 4. UI: Displays a "Play Mix" button with Streamlit-style looks,
+//    for current/next theme stems using Howler.js, delayed to the beat-synchronous
+//    start offset from the server (Howler's public fade(), started by a timer that
+//    is cleared when a new mix starts or the component unmounts).
+// 4. StemPool: keyed, size-bounded LRU of loaded Howl instances (decoded buffers).
+//    Stems are preloaded as soon as new current/next stems arrive, reused on every
+//    play, and explicitly unloaded on eviction. Load timings (fetch/decode) and
+//    click-to-sound latency are reported to Python via Streamlit.setComponentValue.
+// 5. UI: Displays a "Play Mix" button with Streamlit-style looks,
 //    and animated visual indicator ("Playing...") while active.
 // ---------------------------------------------------------------------------
 
@@ -21,8 +27,135 @@ type Stem = {
   filename: string;
   targetgain: number;
   fadeduration: number;
+  sources?: string[]; // content-hashed compressed variants (Opus first, WAV fallback)
 };
 
+// Howler tries sources in order; fall back to the raw WAV if no manifest was built
+const stemSources = (stem: Stem): string[] =>
+  (stem.sources && stem.sources.length ? stem.sources : [stem.filename]).map((src) => "/" + src);
+
+// Beat-synchronous schedule from beat_scheduler.py: fades start start_offset samples
+// after playback begins (0 = immediately)
+type Schedule = {
+  start_offset: number;
+  sample_rate: number;
+};
+
+// Holds one playing sound at `from`, then ramps it to `to` over `seconds`, starting
+// `delay` seconds from now. Uses only Howler's public API (volume/fade), which ramps
+// the gain on the audio clock under Web Audio; returns the timer so it can be cleared.
+const scheduleFade = (sound: Howl, id: number, from: number, to: number, delay: number,
+                      seconds: number): number => {
+  sound.volume(from, id);
+  return window.setTimeout(() => sound.fade(from, to, seconds * 1000, id), delay * 1000);
+};
+
+// ---------------------------------------------------------------------------
+// StemPool: loaded Howl instances keyed by their source list, least recently used
+// first. With Web Audio a loaded Howl holds the decoded AudioBuffer, so replaying
+// it costs no fetch or decode. At most maxSize entries are kept (more only while
+// pinned, i.e. part of the mix currently on screen); evicted entries are unloaded,
+// which also drops Howler's buffer cache for that URL, so memory stays bounded.
+// ---------------------------------------------------------------------------
+const POOL_MAX_SOUNDS = 16;
+
+// Per-stem load timing reported to Python (milliseconds)
+type LoadTiming = {
+  filename: string;
+  load_ms: number;     // Howl creation -> "load" event (fetch + decode)
+  fetch_ms: number | null;  // network part, from the Resource Timing API when available
+  decode_ms: number | null; // load_ms - fetch_ms
+  error?: string;
+};
+
+type PoolEntry = {
+  howl: Howl;
+  ready: Promise<LoadTiming>;
+  loaded: boolean;
+};
+
+const stemKey = (stem: Stem): string => stemSources(stem).join("|");
+
+// Network time for a stem, if the browser recorded it. Howler only fetches the first
+// source it can play, so the first source with a timing entry is the one that loaded.
+const fetchMs = (sources: string[]): number | null => {
+  for (const src of sources) {
+    const url = new URL(src, window.location.href).href;
+    const entries = performance.getEntriesByName(url) as PerformanceResourceTiming[];
+    const last = entries[entries.length - 1];
+    if (last) return last.responseEnd - last.startTime;
+  }
+  return null;
+};
+
+class StemPool {
+  private entries = new Map<string, PoolEntry>();
+  private pinned = new Set<string>();
+
+  constructor(private maxSize: number) {}
+
+  // Returns the pooled entry for a stem, creating (and starting to load) it if needed
+  acquire(stem: Stem): PoolEntry {
+    const key = stemKey(stem);
+    let entry = this.entries.get(key);
+    if (entry) {
+      this.entries.delete(key); // re-insert as most recently used
+    } else {
+      const started = performance.now();
+      const howl = new Howl({ src: stemSources(stem), preload: true });
+      const created = { howl, loaded: false } as PoolEntry;
+      created.ready = new Promise<LoadTiming>((resolve) => {
+        howl.once("load", () => {
+          created.loaded = true;
+          const load_ms = performance.now() - started;
+          const fetch_ms = fetchMs(stemSources(stem));
+          const decode_ms = fetch_ms === null ? null : Math.max(0, load_ms - fetch_ms);
+          resolve({ filename: stem.filename, load_ms, fetch_ms, decode_ms });
+        });
+        howl.once("loaderror", (_id: number, error: unknown) => {
+          // Drop failed players so the next preload retries instead of reusing them
+          if (this.entries.get(key) === created) this.entries.delete(key);
+          howl.unload();
+          resolve({ filename: stem.filename, load_ms: performance.now() - started,
+                    fetch_ms: null, decode_ms: null, error: String(error) });
+        });
+      });
+      entry = created;
+    }
+    this.entries.set(key, entry);
+    this.evict();
+    return entry;
+  }
+
+  // Loads every stem of the upcoming mix; resolves with the timings of new loads only
+  preload(stems: Stem[]): Promise<LoadTiming[]> {
+    this.pinned = new Set(stems.map(stemKey));
+    const fresh = stems
+      .filter((stem) => !this.entries.has(stemKey(stem)))
+      .map((stem) => this.acquire(stem).ready);
+    stems.forEach((stem) => this.acquire(stem)); // mark all as most recently used
+    return Promise.all(fresh);
+  }
+
+  // Unloads least recently used, unpinned entries beyond maxSize
+  private evict() {
+    for (const [key, entry] of this.entries) {
+      if (this.entries.size <= this.maxSize) break;
+      if (this.pinned.has(key)) continue;
+      entry.howl.unload();
+      this.entries.delete(key);
+    }
+  }
+
+  unloadAll() {
+    this.entries.forEach((entry) => entry.howl.unload());
+    this.entries.clear();
+    this.pinned.clear();
+  }
+}
+
+const parseStems = (json?: string): Stem[] => (json ? JSON.parse(json) : []);
+
 // Internal UI state for play/fade indicator
 type State = {
   isPlaying: boolean;
@@ -33,6 +166,11 @@ type State = {
 // Main Stem Mixer Component
 // ---------------------------------------------------------------------------
 class MyComponent extends StreamlitComponentBase<State> {
+  private pool = new StemPool(POOL_MAX_SOUNDS);
+  private reportId = Date.now(); // unique across remounts, so Python can de-duplicate
+  private playing: Howl[] = [];
+  private fadeTimers: number[] = []; // pending scheduleFade starts of the current mix
+
   constructor(props: any) {
     super(props);
     this.state = {
@@ -41,49 +179,102 @@ class MyComponent extends StreamlitComponentBase<State> {
     };
   }
 
+  componentDidMount() {
+    super.componentDidMount();
+    this.preloadMix();
+  }
+
+  componentDidUpdate(prevProps: any) {
+    super.componentDidUpdate();
+    if (prevProps.args.current_stems !== this.props.args.current_stems ||
+        prevProps.args.next_stems !== this.props.args.next_stems) {
+      this.preloadMix();
+    }
+  }
+
+  componentWillUnmount() {
+    this.clearFades();
+    this.pool.unloadAll();
+  }
+
+  // Cancels fades that have not started yet, so a stale mix cannot ramp a reused player
+  clearFades = () => {
+    this.fadeTimers.forEach((timer) => window.clearTimeout(timer));
+    this.fadeTimers = [];
+  };
+
+  // Sends a timing report to Python (mix_and_transition's return value)
+  report = (type: string, data: object) => {
+    this.reportId += 1;
+    Streamlit.setComponentValue({ type, report_id: this.reportId, ...data });
+  };
+
+  // Starts fetching and decoding the new mix's stems before the user clicks Play
+  preloadMix = () => {
+    const stems = [...parseStems(this.props.args.current_stems), ...parseStems(this.props.args.next_stems)];
+    if (!stems.length) return;
+    const started = performance.now();
+    this.pool.preload(stems).then((timings) => {
+      if (timings.length) {
+        this.report("preload", { timings, total_ms: performance.now() - started });
+      }
+    });
+  };
+
   /**
    * When Play Mix is clicked:
-   *  - Fades out all current stems (theme 1)
-   *  - Fades in all next stems (theme 2)
-   *  - Keeps UI indicator active for max fade duration (shows animated soundwaves)
+   *  - Starts all stems together (next stems silent)
+   *  - At the scheduled bar/phrase boundary, fades out all current stems (theme 1)
+   *    and fades in all next stems (theme 2)
+   *  - Keeps UI indicator active until the last fade ends (shows animated soundwaves)
    */
   playMix = () => {
+    const clickedAt = performance.now();
     // Parse stems from incoming props (as JSON string)
-    const currentStems: Stem[] = this.props.args.current_stems
-      ? JSON.parse(this.props.args.current_stems)
-      : [];
-    const nextStems: Stem[] = this.props.args.next_stems
-      ? JSON.parse(this.props.args.next_stems)
-      : [];
+    const currentStems: Stem[] = parseStems(this.props.args.current_stems);
+    const nextStems: Stem[] = parseStems(this.props.args.next_stems);
+    const schedule: Schedule = this.props.args.schedule
+      ? JSON.parse(this.props.args.schedule)
+      : { start_offset: 0, sample_rate: 44100 };
+    const delay = schedule.start_offset / schedule.sample_rate; // seconds until the fades
     // Calculate max fade duration (keep UI indicator visible accordingly)
     let maxFade = 0;
     [...currentStems, ...nextStems].forEach((stem: Stem) => {
       if (stem.fadeduration * 1000 > maxFade) maxFade = stem.fadeduration * 1000;
     });
 
-    // Fade out current stems
-    currentStems.forEach((stem: Stem, idx: number) => {
-      const sound = new Howl({ src: ["/" + stem.filename] });
-      sound.volume(stem.targetgain);
-      sound.play();
-      sound.fade(stem.targetgain, 0, stem.fadeduration * 1000);
-      console.log("Fading out current stem:", stem.filename, "from gain", stem.targetgain, "in", stem.fadeduration, "sec");
-    });
+    // Pooled, usually already decoded players; a stem still loading joins when ready
+    const entries = [...currentStems, ...nextStems].map((stem) => this.pool.acquire(stem));
+    const preloaded = entries.every((entry) => entry.loaded);
+    Promise.all(entries.map((entry) => entry.ready)).then(() => {
+      // Stop the previous mix (and its pending fades) on the reused players first
+      this.clearFades();
+      this.playing.forEach((howl) => howl.stop());
+      this.playing = entries.map((entry) => entry.howl);
+
+      // Fade out current stems
+      currentStems.forEach((stem: Stem, idx: number) => {
+        const sound = entries[idx].howl;
+        const id = sound.play();
+        this.fadeTimers.push(scheduleFade(sound, id, stem.targetgain, 0, delay, stem.fadeduration));
+      });
+
+      // Fade in next stems
+      nextStems.forEach((stem: Stem, idx: number) => {
+        const sound = entries[currentStems.length + idx].howl;
+        const id = sound.play();
+        this.fadeTimers.push(scheduleFade(sound, id, 0, stem.targetgain, delay, stem.fadeduration));
+      });
 
-    // Fade in next stems
-    nextStems.forEach((stem: Stem, idx: number) => {
-      const sound = new Howl({ src: ["/" + stem.filename] });
-      sound.volume(0);
-      sound.play();
-      sound.fade(0, stem.targetgain, stem.fadeduration * 1000);
-      console.log("Fading in next stem:", stem.filename, "to gain", stem.targetgain, "in", stem.fadeduration, "sec");
+      this.report("play", { click_to_sound_ms: performance.now() - clickedAt, preloaded });
     });
 
-    // UI: Show "Playing..." for max fade duration, then revert
-    this.setState({ isPlaying: true, playDuration: maxFade || 3000 });
+    // UI: Show "Playing..." until the scheduled fades finish, then revert
+    const playDuration = delay * 1000 + (maxFade || 3000);
+    this.setState({ isPlaying: true, playDuration });
     setTimeout(() => {
       this.setState({ isPlaying: false });
-    }, maxFade || 3000);
+    }, playDuration);
   };
 
   // ---------------------------------------------------------------------------
@@ -91,9 +282,7 @@ class MyComponent extends StreamlitComponentBase<State> {
   // ---------------------------------------------------------------------------
   render = () => {
     // Parse stems for display (in case you want to render details)
-    const stems: Stem[] = this.props.args.current_stems
-      ? JSON.parse(this.props.args.current_stems)
-      : [];
+    const stems: Stem[] = parseStems(this.props.args.current_stems);
 
     // Streamlit-style button for visual consistency
     const streamlitButtonStyle: React.CSSProperties = {
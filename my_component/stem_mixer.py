@@ -2,15 +2,27 @@
 # stem_mixer.py
 #
 # Step-by-step overview:
-# 1. Imports Streamlit and component modules, as well as json and os for serialization and file paths.
+# 1. Imports Streamlit's component API, as well as json and os for serialization and file paths.
 # 2. Declares the custom component (frontend React bundle) for visual mixing/crossfade interface.
 # 3. Defines mix_and_transition() function that serializes the stems and displays the mixer UI.
+#    Optionally renders the crossfade server-side (stem_renderer) to a WAV file as well,
+#    reusing the shared rendered-transition cache (render_cache) when possible.
+#    If an asset manifest exists (asset_pipeline.py), each stem also carries compressed,
+#    content-hashed "sources" for the frontend to load instead of the raw WAV.
+#    A beat-synchronous start offset (beat_scheduler.py) is passed to both paths.
+#    Render, manifest loading and the component call are timed as telemetry spans.
+# 4. Defines record_mixer_report(): the component preloads stems into a pooled buffer
+#    cache and reports browser load/decode and click-to-sound timings as its value;
+#    these are recorded as "browser.*" telemetry stages.
 # ---------------------------------------------------------------------------
 
-import streamlit as st
 import streamlit.components.v1 as components
 import json
 import os
+from stem_renderer import render_transition
+from render_cache import get_default_render_cache
+from asset_pipeline import load_manifest, stem_sources
+from telemetry import get_telemetry
 
 _parent_dir = os.path.dirname(os.path.abspath(__file__))
 component = components.declare_component(
@@ -18,13 +30,60 @@ component = components.declare_component(
     path=os.path.join(_parent_dir, "frontend", "build")
 )
 
-def mix_and_transition(current_stems, next_stems):
+def _with_sources(stems, manifest):
+    """
+    Adds the manifest's ordered "sources" list (Opus first, WAV fallback) to each stem dict.
+    """
+    if not manifest:
+        return stems
+    return [dict(stem, sources=stem_sources(manifest, stem["filename"])) for stem in stems]
+
+def mix_and_transition(current_stems, next_stems, render_path=None, base_dir="audio_clips", manifest=None,
+                       start_offset=0, sample_rate=44100, key=None):
     """
     Show the frontend stem mixer/transition UI.
     Accepts two lists of stems (current, next), serializes to JSON and passes to frontend.
-    Returns any output or input events from the component (if present).
+    If render_path is given, the crossfade is also rendered on the server to that WAV file.
+    The asset manifest (loaded from base_dir if not given) maps stems to compressed variants.
+    start_offset (samples at sample_rate, from beat_scheduler) delays the fades to a musical
+    boundary; the server render and the browser use the same integer.
+    Pass a stable key to keep one component (and its preloaded audio pool) across reruns.
+    Returns the component's latest timing report (see record_mixer_report), or None.
+    """
+    telemetry = get_telemetry()
+    if render_path:
+        with telemetry.span("mix.render"):
+            render_transition(current_stems, next_stems, base_dir=base_dir, output_path=render_path,
+                              cache=get_default_render_cache(), start_offset=start_offset)
+    with telemetry.span("mix.assets"):
+        manifest = manifest or load_manifest(base_dir)
+        current_json = json.dumps(_with_sources(current_stems, manifest))
+        next_json = json.dumps(_with_sources(next_stems, manifest))
+    with telemetry.span("mix.component"):
+        return component(
+            current_stems=current_json,
+            next_stems=next_json,
+            schedule=json.dumps({"start_offset": int(start_offset), "sample_rate": sample_rate}),
+            key=key,
+            default=None
+        )
+
+def record_mixer_report(report):
+    """
+    Records one component timing report in telemetry:
+      {"type": "preload", "timings": [{"filename", "load_ms", "fetch_ms", "decode_ms"}, ...]}
+      {"type": "play", "click_to_sound_ms": ..., "preloaded": bool}
     """
-    return component(
-        current_stems=json.dumps(current_stems),
-        next_stems=json.dumps(next_stems)
-    )
+    telemetry = get_telemetry()
+    if report.get("type") == "preload":
+        for timing in report.get("timings", []):
+            if timing.get("error"):
+                telemetry.inc("browser_stem_load_errors_total")
+                continue
+            telemetry.record_span("browser.stem_load", timing["load_ms"] / 1000.0)
+            if timing.get("fetch_ms") is not None:
+                telemetry.record_span("browser.stem_fetch", timing["fetch_ms"] / 1000.0)
+                telemetry.record_span("browser.stem_decode", timing["decode_ms"] / 1000.0)
+    elif report.get("type") == "play":
+        telemetry.record_span("browser.click_to_sound", report["click_to_sound_ms"] / 1000.0)
+        telemetry.inc("browser_plays_total", preloaded=str(bool(report.get("preloaded"))).lower())
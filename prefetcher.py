@@ -0,0 +1,142 @@
+# ---------------------------------------------------------------------------
+# prefetcher.py
+#
+# Step-by-step overview:
+# 1. Defines predict_next_themes: ranks likely next themes from the from_theme ->
+#    to_theme pairs already recorded in the session history
+# 2. Defines TransitionPrefetcher: after each transition, warms the top-N candidates
+#    on a small thread pool while the app is idle
+#     - Decoded stems are loaded into the StemStore
+#     - The LLM intent is requested with exactly the inputs the click handler will use,
+#       so the advisor's ResponseCache answers the real click instantly
+#     - Work is cancellable per theme (each task has its own stop flag), concurrency is
+#       bounded by the pool size, and LLM calls are capped by an optional budget
+# ---------------------------------------------------------------------------
+
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from llm_advisor import generate_mix_intent_from_folder, stem_dicts_from_mix_intent
+from stem_catalog import get_catalog
+from stem_store import get_default_store
+
+def predict_next_themes(history, current_theme, top_n=2, themes=None):
+    """
+    Returns up to top_n themes most likely to follow current_theme.
+    Ranked by how often current_theme -> X occurred (most recent first on ties), then
+    by overall popularity of X as a destination. Never returns current_theme itself.
+    """
+    from_here = Counter()
+    overall = Counter()
+    last_seen = {}
+    for i, entry in enumerate(history or []):
+        to_theme = entry.get("to_theme")
+        overall[to_theme] += 1
+        last_seen[to_theme] = i
+        if entry.get("from_theme") == current_theme:
+            from_here[to_theme] += 1
+    candidates = set(from_here) | set(overall) | set(themes or [])
+    candidates.discard(current_theme)
+    candidates.discard(None)
+    if themes is not None:
+        candidates &= set(themes)
+    ranked = sorted(
+        candidates,
+        key=lambda t: (-from_here[t], -overall[t], -last_seen.get(t, -1), t),
+    )
+    return ranked[:top_n]
+
+class TransitionPrefetcher:
+    """
+    Background warmer for the most likely next transitions.
+    Call prefetch() right after a transition; on the next click call wait(theme) to
+    join any in-flight work for that theme before running the normal pipeline.
+    """
+    def __init__(self, advisor=None, store=None, base_dir="audio_clips",
+                 max_workers=2, top_n=2, max_llm_calls=None, themes=None):
+        self.advisor = advisor
+        self.themes = themes                # Candidate themes (default: every catalogued theme)
+        self.store = store or get_default_store()
+        self.base_dir = base_dir
+        self.top_n = top_n
+        self.max_llm_calls = max_llm_calls
+        self.llm_calls = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._futures = {}                  # theme -> (Future, stop flag)
+        self._lock = threading.Lock()
+        self.current_theme = None           # Theme the scheduled work transitions from
+
+    def prefetch(self, history, current_theme):
+        """
+        Cancels previous work and schedules warming for the predicted next themes.
+        Returns the list of themes scheduled.
+        """
+        self.cancel()
+        self.current_theme = current_theme
+        candidates = self.themes or get_catalog(self.base_dir).themes()
+        themes = predict_next_themes(history, current_theme, self.top_n, candidates)
+        # Snapshot the inputs now: the click handler will pass the same ones
+        history = list(history or [])
+        try:
+            current_stems = stem_dicts_from_mix_intent(
+                generate_mix_intent_from_folder(current_theme, base_dir=self.base_dir)
+            )
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            for theme in themes:
+                cancelled = threading.Event()
+                future = self._executor.submit(self._warm, theme, history, current_stems, cancelled)
+                self._futures[theme] = (future, cancelled)
+        return themes
+
+    def _take_llm_budget(self):
+        with self._lock:
+            if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+                return False
+            self.llm_calls += 1
+            return True
+
+    def _warm(self, theme, history, current_stems, cancelled):
+        """
+        Worker: load the theme's stems, then (budget permitting) fetch its LLM intent.
+        """
+        for record in get_catalog(self.base_dir).stems(theme):
+            if cancelled.is_set():
+                return None
+            self.store.get(f"{self.base_dir}/{record.path}")
+        if self.advisor is None or cancelled.is_set() or not self._take_llm_budget():
+            return None
+        recommend = getattr(self.advisor, "recommend_sync", self.advisor.recommend)
+        return recommend(history, current_stems, theme)
+
+    def wait(self, theme, timeout=None):
+        """
+        Waits for in-flight prefetch work for theme and returns its result (or None).
+        """
+        with self._lock:
+            future, _ = self._futures.get(theme, (None, None))
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        except Exception:
+            return None  # Prefetching is best effort; the click path will retry
+
+    def cancel(self, keep=None):
+        """
+        Stops scheduled work (except for theme `keep`): pending tasks are dropped and
+        running ones stop before their next step (stem load or LLM call).
+        """
+        with self._lock:
+            for theme, (future, cancelled) in list(self._futures.items()):
+                if theme != keep:
+                    cancelled.set()
+                    future.cancel()
+                    del self._futures[theme]
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
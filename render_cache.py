@@ -0,0 +1,185 @@
+# ---------------------------------------------------------------------------
+# render_cache.py
+#
+# Step-by-step overview:
+# 1. Defines transition_key: a content address for a rendered crossfade, built from
+#    each stem's content hash plus quantized targetgain/fadeduration values
+#    (so the same audio in two theme folders, or 0.801 vs 0.8 gain, hits one entry)
+# 2. Defines RenderCache: a size-capped on-disk LRU of rendered mixes (.npy files)
+#     - Writes are atomic (temp file + os.replace)
+#     - A cross-process file lock (fcntl) serializes writes/eviction between workers
+#     - Reads touch the file's mtime, which is the LRU clock
+# 3. Provides get_default_render_cache() for render_transition callers
+# ---------------------------------------------------------------------------
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+from stem_catalog import get_catalog
+from stem_store import content_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_CACHE_DIR = ".render_cache"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+GAIN_QUANTUM = 0.01
+FADE_QUANTUM = 0.05
+
+def _quantize(value, quantum):
+    return int(round(float(value) / quantum))
+
+def _stem_hash(base_dir, filename):
+    """
+    Content hash for a stem, from the catalog when indexed, else by hashing the file.
+    """
+    record = get_catalog(base_dir).get(filename)
+    if record is not None:
+        return record.content_hash
+    return content_hash(os.path.join(base_dir, filename))
+
+def transition_key(current_stems, next_stems, base_dir="audio_clips", duration=None,
+                   sample_rate=44100, channels=2, start_offset=0, tempo_plan=None,
+                   position_frames=0):
+    """
+    Returns the hex cache key for one transition render.
+    tempo_plan is TempoMatcher.plan()'s per-next-stem stretch list (time_stretch.py);
+    position_frames is where the current stems resume (render_transition()).
+    """
+    def describe(stems):
+        return [
+            [_stem_hash(base_dir, stem["filename"]),
+             _quantize(stem["targetgain"], GAIN_QUANTUM),
+             _quantize(stem["fadeduration"], FADE_QUANTUM)]
+            for stem in stems
+        ]
+    payload = {
+        "current": describe(current_stems),
+        "next": describe(next_stems),
+        "duration": duration,
+        "format": [sample_rate, channels],
+    }
+    if start_offset:
+        payload["start_offset"] = int(start_offset)  # Unscheduled renders keep their old keys
+    if position_frames:
+        payload["position"] = int(position_frames)
+    if tempo_plan and any(tempo_plan):
+        payload["tempo"] = [[entry["source"], entry["target"], entry["method"]] if entry else None
+                            for entry in tempo_plan]
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class RenderCache:
+    """
+    Content-addressed disk cache of rendered transitions, shared by any number of
+    processes pointing at the same directory. Total size is capped at max_bytes by
+    evicting the least recently used renders.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self._thread_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Exclusive lock across threads (threading.Lock) and processes (flock on .lock).
+        """
+        with self._thread_lock:
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Returns the cached float32 (frames, channels) mix for key, or None.
+        """
+        path = self._path(key)
+        try:
+            mix = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return mix
+
+    def put(self, key, mix):
+        """
+        Atomically stores a rendered mix, then evicts old renders over the size cap.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(mix, dtype=np.float32))
+            with self._locked():
+                os.replace(tmp_path, self._path(key))
+                self._evict()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self):
+        """
+        Deletes least recently used renders until the cache fits max_bytes (lock must be held).
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_render_cache():
+    """
+    Returns the process-wide RenderCache (in .render_cache/), creating it on first use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RenderCache()
+        return _default_cache
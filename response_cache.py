@@ -0,0 +1,146 @@
+# ---------------------------------------------------------------------------
+# response_cache.py
+#
+# Step-by-step overview:
+# 1. Defines make_cache_key: a canonical SHA-256 over the LLM prompt inputs
+#    (current_state, next_theme, user_query, compacted session_log, model name)
+# 2. Defines ResponseCache: memoizes parsed LLMAdvisor.recommend results
+#     - In-memory LRU bounded by entry count
+#     - Per-entry TTL (expired entries count as misses)
+#     - Optional SQLite disk tier that survives restarts and is shared between processes
+#     - hit/miss/eviction counters exposed through stats()
+# ---------------------------------------------------------------------------
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from session_log import encode_session_log
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 24 * 60 * 60.0
+
+def make_cache_key(current_state, next_theme, user_query=None, session_log=None, model_name=None,
+                   encoded_log=None):
+    """
+    Returns a stable hex digest for one recommend() call.
+    Inputs are serialized as canonical JSON (sorted keys, no whitespace) before hashing;
+    the session log is hashed in the same compacted form that goes into the prompt
+    (pass encoded_log, the encode_session_log() result, to avoid encoding it twice).
+    """
+    payload = {
+        "model": model_name,
+        "current_state": current_state or [],
+        "next_theme": next_theme,
+        "user_query": user_query,
+        "session_log": encoded_log if encoded_log is not None else encode_session_log(session_log),
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    LRU + TTL cache for parsed LLM responses, with an optional on-disk SQLite tier.
+    Values must be JSON-serializable (recommend() returns plain dicts).
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._memory = OrderedDict()    # key -> (stored_at, value)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._conn = None
+        if disk_path:
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False, timeout=10.0)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            if ttl:
+                self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def _expired(self, stored_at):
+        return bool(self.ttl) and time.time() - stored_at > self.ttl
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss or expired entry.
+        """
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if not self._expired(item[0]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(item[1])
+                del self._memory[key]
+                self.expirations += 1
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, stored_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Stores value under key in memory and, if configured, on disk.
+        """
+        encoded = json.dumps(value, default=str)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, encoded)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, encoded, stored_at)
+                )
+                self._conn.commit()
+
+    def _remember(self, key, stored_at, encoded):
+        """
+        Inserts into the in-memory LRU, evicting the least recently used entries over max_entries.
+        """
+        self._memory[key] = (stored_at, encoded)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns hit/miss/eviction counters and the current in-memory size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """
+        Empties both the memory and disk tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
@@ -3,7 +3,8 @@
 #
 # Step-by-step overview:
 # 1. Import required modules for type schemas, data validation
-# 2. Define timestamp for current time (not used in classes themselves)
+# 2. Define local_now() for intent/log timestamps (computed per call, not at import)
+#    Theme names come from the theme registry (themes.json), not a hand-kept list
 # 3. Define all core data classes (Event, MusicalIntent, StemIntent, MixIntent, SessionLogEntry)
 #    using pydantic for validation and serialization.
 # 4. Each class matches core app concepts: state event, mix configuration,
@@ -11,20 +12,39 @@
 # 5. Adds helper .to_dict for MixIntent to assist with explicit dict serialization
 # ---------------------------------------------------------------------------
 
-from pydantic import BaseModel, Field
-from typing import Literal, Set, List, Dict
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Set, List, Dict
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from theme_registry import theme_names
 
-# Current timestamp in local (Pacific) timezone, used for logging/intent
-timestamp = datetime.now(ZoneInfo("America/Los_Angeles"))
+LOCAL_TIMEZONE = "America/Los_Angeles"
+
+def local_now():
+    """
+    Current time in the local (Pacific) timezone, used for logging/intent timestamps.
+    """
+    return datetime.now(ZoneInfo(LOCAL_TIMEZONE))
+
+def _known_theme(value):
+    """
+    Accepts only the registry's canonical theme names (checked at validation time, so
+    importing the schemas does not load the registry).
+    """
+    names = theme_names()
+    if value not in names:
+        raise ValueError(f"theme must be one of {', '.join(names)}")
+    return value
+
+# Valid theme labels (the registry's canonical names)
+ThemeName = Annotated[str, AfterValidator(_known_theme)]
 
 class Event(BaseModel):
     """
     Represents a game event/state, with context (explore, combat, etc),
     intensity (0-100), and arbitrary flags (such as boss, low_health).
     """
-    state: Literal['explore', 'combat', 'stealth', 'bosscombat'] = Field(..., description="Game context/state")
+    state: ThemeName = Field(..., description="Game context/state")
     intensity: int = Field(..., ge=0, le=100, description="Intensity 0-100")
     flags: Set[str] = Field(default_factory=set, description="Event flags (e.g., low_health, boss)")
 
@@ -33,7 +53,7 @@ class MusicalIntent(BaseModel):
     Describes the musical configuration for a given theme:
     - Theme label, active stems, gains, fades, timestamp.
     """
-    theme: Literal['explore', 'combat', 'stealth', 'bosscombat']
+    theme: ThemeName
     active_stems: List[str]
     target_gains: Dict[str, float]
     fade_durations: Dict[str, float]
@@ -54,7 +74,7 @@ class MixIntent(BaseModel):
     Bundles a group of StemIntents for a whole mix/theme.
     Provides a to_dict helper for easy serialization.
     """
-    theme: Literal['explore', 'combat', 'stealth', 'bosscombat']
+    theme: ThemeName
     stem_intents: List[StemIntent]
 
     def to_dict(self):
@@ -0,0 +1,128 @@
+# ---------------------------------------------------------------------------
+# session_log.py
+#
+# Step-by-step overview:
+# 1. Defines compact_transition: reduces one history entry (from demo2_st.py) to
+#    its themes and per-stem [gain, fade] pairs
+# 2. Defines summarize_transitions: folds many entries into theme-transition counts
+#    and average gains per stem
+# 3. Defines compact_session_log: keeps the last K transitions verbatim, summarizes
+#    the rest, and shrinks further until the result fits a character budget
+# 4. Defines encode_session_log: stable, minimal JSON (sorted keys, no whitespace)
+#    used in LLM prompts and cache keys instead of a Python repr
+# ---------------------------------------------------------------------------
+
+import json
+import os
+
+DEFAULT_KEEP_LAST = 3
+DEFAULT_MAX_CHARS = 2000
+
+def _stem_name(filename):
+    """
+    "combat/drums.wav" -> "drums"
+    """
+    return os.path.splitext(os.path.basename(str(filename or "")))[0]
+
+def _round(value):
+    try:
+        return round(float(value), 3)
+    except (TypeError, ValueError):
+        return None
+
+def compact_transition(entry):
+    """
+    Compacts a history entry to {"from", "to", "stems": {stem: [gain, fade]}}.
+    Only the incoming stems are kept: the outgoing ones are the previous entry's incoming stems.
+    """
+    return {
+        "from": entry.get("from_theme"),
+        "to": entry.get("to_theme"),
+        "stems": {
+            _stem_name(stem.get("filename")): [_round(stem.get("targetgain")), _round(stem.get("fadeduration"))]
+            for stem in entry.get("to_stem_dicts", [])
+        },
+    }
+
+def summarize_transitions(entries):
+    """
+    Folds history entries into {"count", "transitions": {"a>b": n}, "avg_gains": {"theme/stem": g}}.
+    """
+    transitions = {}
+    gain_sums = {}
+    for entry in entries:
+        pair = f"{entry.get('from_theme')}>{entry.get('to_theme')}"
+        transitions[pair] = transitions.get(pair, 0) + 1
+        for stem in entry.get("to_stem_dicts", []):
+            gain = _round(stem.get("targetgain"))
+            if gain is None:
+                continue
+            key = f"{entry.get('to_theme')}/{_stem_name(stem.get('filename'))}"
+            total, count = gain_sums.get(key, (0.0, 0))
+            gain_sums[key] = (total + gain, count + 1)
+    return {
+        "count": len(entries),
+        "transitions": transitions,
+        "avg_gains": {key: round(total / count, 3) for key, (total, count) in gain_sums.items()},
+    }
+
+def _encode(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def _compact(entries, split):
+    compacted = {"recent": [compact_transition(entry) for entry in entries[split:]]}
+    if split:
+        compacted["summary"] = summarize_transitions(entries[:split])
+    return compacted
+
+def _fits(obj, max_chars):
+    return len(_encode(obj)) <= max_chars
+
+def compact_session_log(session_log, keep_last=DEFAULT_KEEP_LAST, max_chars=DEFAULT_MAX_CHARS):
+    """
+    Returns {"summary": ..., "recent": [...]} for a session log.
+    The last keep_last transitions are kept (compacted) and older ones are summarized.
+    If the encoding is still longer than max_chars, the fewest recent entries are folded
+    into the summary, then per-stem averages and the rarest transition pairs are dropped.
+    Both cutoffs are found by binary search, so long logs cost O(n log n), not O(n^2).
+    """
+    entries = [entry for entry in (session_log or []) if isinstance(entry, dict)]
+    if not entries:
+        return {}
+    lo = max(len(entries) - keep_last, 0)
+    compacted = _compact(entries, lo)
+    if not _fits(compacted, max_chars):
+        # Smallest split that fits (folding entries in only shrinks "recent")
+        hi = len(entries)
+        best = _compact(entries, hi)
+        if _fits(best, max_chars):
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                candidate = _compact(entries, mid)
+                if _fits(candidate, max_chars):
+                    hi, best = mid, candidate
+                else:
+                    lo = mid
+        compacted = best
+
+    summary = compacted.get("summary")
+    if summary and not _fits(compacted, max_chars):
+        summary.pop("avg_gains", None)
+        pairs = sorted(summary["transitions"].items(), key=lambda item: (-item[1], item[0]))
+        # Largest number of most frequent pairs that fits
+        lo, hi = 0, len(pairs)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            summary["transitions"] = dict(pairs[:mid])
+            if _fits(compacted, max_chars):
+                lo = mid
+            else:
+                hi = mid - 1
+        summary["transitions"] = dict(pairs[:lo])
+    return compacted
+
+def encode_session_log(session_log, keep_last=DEFAULT_KEEP_LAST, max_chars=DEFAULT_MAX_CHARS):
+    """
+    Stable, minimal JSON encoding of the compacted session log.
+    """
+    return _encode(compact_session_log(session_log, keep_last, max_chars))
@@ -0,0 +1,297 @@
+# ---------------------------------------------------------------------------
+# stem_analysis.py
+#
+# Step-by-step overview:
+# 1. Defines analyze_stem: measures one stem once, offline
+#     - RMS and sample peak (dBFS)
+#     - Integrated loudness (LUFS, ITU-R BS.1770 K-weighting with gating)
+#     - Tempo and beat times (librosa), plus downbeats assuming 4/4: the beat phase
+#       with the strongest onsets is taken as beat one of each bar
+# 2. Defines AnalysisIndex: a JSON sidecar next to the stem catalog
+#    (audio_clips/.stem_analysis.json) keyed by content hash
+#     - refresh() analyzes only stems whose hash is not indexed yet, on a process pool,
+#       and drops entries for content that no longer exists
+#     - Identical stems in several themes are analyzed once
+# 3. Provides lookups for the click path that never touch audio or librosa:
+#     - normalized_gains(): loudness-normalized default gains for a theme
+#     - prompt_features(): compact per-stem loudness/tempo summary for LLM prompts
+#     - beat_grid(): cached beat/downbeat time arrays for the beat scheduler
+#
+# Usage:
+#   python stem_analysis.py [--base-dir audio_clips] [--workers 4]
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from stem_catalog import get_catalog
+from stem_store import load_wav
+
+ANALYSIS_FILENAME = ".stem_analysis.json"
+ANALYSIS_VERSION = 1
+SILENCE_DB = -120.0
+# Stems at TARGET_LUFS keep the default gain; others are scaled toward it (within gain bounds)
+TARGET_LUFS = -20.0
+MIN_NORMALIZED_GAIN = 0.05
+MAX_NORMALIZED_GAIN = 1.0
+
+def _db(value):
+    return 20.0 * math.log10(value) if value > 0 else SILENCE_DB
+
+def _biquad(b, a):
+    a0 = a[0]
+    return np.array(b) / a0, np.array(a) / a0
+
+def _k_weighting_filters(sample_rate):
+    """
+    Returns the two BS.1770 K-weighting biquads (high shelf, high pass) for sample_rate.
+    """
+    # Stage 1: +4 dB high shelf around 1.68 kHz (head diffraction)
+    gain_db, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    a = 10.0 ** (gain_db / 40.0)
+    w0 = 2.0 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2.0 * q)
+    cos_w0 = math.cos(w0)
+    shelf = _biquad(
+        [a * ((a + 1) + (a - 1) * cos_w0 + 2 * math.sqrt(a) * alpha),
+         -2 * a * ((a - 1) + (a + 1) * cos_w0),
+         a * ((a + 1) + (a - 1) * cos_w0 - 2 * math.sqrt(a) * alpha)],
+        [(a + 1) - (a - 1) * cos_w0 + 2 * math.sqrt(a) * alpha,
+         2 * ((a - 1) - (a + 1) * cos_w0),
+         (a + 1) - (a - 1) * cos_w0 - 2 * math.sqrt(a) * alpha],
+    )
+    # Stage 2: high pass around 38 Hz (RLB weighting)
+    q, fc = 0.5003270373238773, 38.13547087602444
+    w0 = 2.0 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2.0 * q)
+    cos_w0 = math.cos(w0)
+    high_pass = _biquad(
+        [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2],
+        [1 + alpha, -2 * cos_w0, 1 - alpha],
+    )
+    return shelf, high_pass
+
+def integrated_loudness(samples, sample_rate):
+    """
+    BS.1770 integrated loudness (LUFS) of float32 (frames, channels) audio, with the
+    -70 LUFS absolute gate and -10 LU relative gate over 400 ms blocks (75% overlap).
+    """
+    from scipy.signal import lfilter
+    weighted = samples.astype(np.float64)
+    for b, a in _k_weighting_filters(sample_rate):
+        weighted = lfilter(b, a, weighted, axis=0)
+    block = int(round(0.4 * sample_rate))
+    step = block // 4
+    if len(weighted) < block:
+        return SILENCE_DB
+    # Mean square per block and channel, from a cumulative sum (one pass over the audio)
+    squared = np.concatenate([np.zeros((1, weighted.shape[1])), np.cumsum(weighted ** 2, axis=0)])
+    starts = np.arange(0, len(weighted) - block + 1, step)
+    block_power = ((squared[starts + block] - squared[starts]) / block).sum(axis=1)
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10.0 * np.log10(block_power)
+    gated = block_power[block_loudness > -70.0]
+    if not len(gated):
+        return SILENCE_DB
+    relative_gate = -0.691 + 10.0 * math.log10(gated.mean()) - 10.0
+    gated = block_power[(block_loudness > -70.0) & (block_loudness > relative_gate)]
+    return -0.691 + 10.0 * math.log10(gated.mean())
+
+def _downbeats(onset_envelope, beat_frames, frame_times, beats_per_bar=4):
+    """
+    Picks every beats_per_bar-th beat, starting at the phase with the strongest onsets.
+    """
+    if len(beat_frames) < beats_per_bar:
+        return frame_times[beat_frames].tolist()
+    strength = onset_envelope[beat_frames]
+    phase = int(np.argmax([strength[p::beats_per_bar].mean() for p in range(beats_per_bar)]))
+    return frame_times[beat_frames[phase::beats_per_bar]].tolist()
+
+def analyze_stem(path):
+    """
+    Measures one WAV file. Returns a JSON-serializable feature dict
+    (rms_db, peak_db, lufs, tempo, beats, downbeats, duration, sample_rate).
+    """
+    import librosa
+    samples, sample_rate = load_wav(path)
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    rms = float(np.sqrt(np.mean(np.square(mono, dtype=np.float64)))) if len(mono) else 0.0
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+
+    hop_length = 512
+    onset_envelope = librosa.onset.onset_strength(y=mono, sr=sample_rate, hop_length=hop_length)
+    tempo, beat_frames = librosa.beat.beat_track(
+        onset_envelope=onset_envelope, sr=sample_rate, hop_length=hop_length
+    )
+    frame_times = librosa.frames_to_time(np.arange(len(onset_envelope)), sr=sample_rate,
+                                         hop_length=hop_length)
+    beat_frames = np.asarray(beat_frames, dtype=np.int64)
+    return {
+        "rms_db": round(_db(rms), 2),
+        "peak_db": round(_db(peak), 2),
+        "lufs": round(integrated_loudness(samples, sample_rate), 2),
+        "tempo": round(float(np.atleast_1d(tempo)[0]), 2),
+        "beats": [round(t, 4) for t in frame_times[beat_frames].tolist()],
+        "downbeats": [round(t, 4) for t in _downbeats(onset_envelope, beat_frames, frame_times)],
+        "duration": round(len(samples) / float(sample_rate), 4),
+        "sample_rate": sample_rate,
+    }
+
+class AnalysisIndex:
+    """
+    Precomputed stem features, stored as base_dir/.stem_analysis.json and keyed by the
+    stem catalog's content hashes, so edited stems are re-analyzed and renamed or
+    duplicated ones are not.
+    """
+    def __init__(self, base_dir="audio_clips", path=None):
+        self.base_dir = os.path.normpath(base_dir)
+        self.path = path or os.path.join(self.base_dir, ANALYSIS_FILENAME)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._features = {}     # content hash -> feature dict
+        self._grids = {}        # (content hash, kind) -> read-only float64 array of seconds
+
+    def _load(self):
+        """
+        (Re)reads the sidecar when it changed on disk.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._features = data.get("stems", {}) if data.get("version") == ANALYSIS_VERSION else {}
+            self._grids = {}
+            self._mtime = mtime
+
+    def refresh(self, workers=None):
+        """
+        Analyzes every catalogued stem whose content hash is not indexed yet (on a process
+        pool), drops stale hashes and rewrites the sidecar atomically.
+        Returns counts of analyzed, kept and removed entries.
+        """
+        self._load()
+        catalog = get_catalog(self.base_dir, max_age=0)
+        wanted = {}
+        for theme in catalog.themes():
+            for record in catalog.stems(theme):
+                wanted.setdefault(record.content_hash, os.path.join(catalog.base_dir, record.path))
+        features = {h: f for h, f in self._features.items() if h in wanted}
+        todo = [h for h in wanted if h not in features]
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for content_hash, result in zip(todo, pool.map(analyze_stem, [wanted[h] for h in todo])):
+                    features[content_hash] = result
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": ANALYSIS_VERSION, "stems": features}, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        removed = len(self._features) - (len(features) - len(todo))
+        with self._lock:
+            self._features = features
+            self._mtime = os.stat(self.path).st_mtime_ns
+        return {"analyzed": len(todo), "kept": len(features) - len(todo), "removed": removed}
+
+    def get(self, rel_path):
+        """
+        Returns the feature dict for a stem path relative to base_dir
+        (e.g. "explore/drums.wav"), or None if it has not been analyzed.
+        """
+        record = get_catalog(self.base_dir).get(rel_path)
+        if record is None:
+            return None
+        self._load()
+        return self._features.get(record.content_hash)
+
+    def beat_grid(self, rel_path, kind="downbeats"):
+        """
+        Returns the sorted beat ("beats") or bar ("downbeats") times of a stem in seconds,
+        as a cached read-only NumPy array ready for np.searchsorted, or None if the stem
+        has not been analyzed.
+        """
+        record = get_catalog(self.base_dir).get(rel_path)
+        if record is None:
+            return None
+        self._load()
+        key = (record.content_hash, kind)
+        grid = self._grids.get(key)
+        if grid is None:
+            features = self._features.get(record.content_hash)
+            if features is None:
+                return None
+            grid = np.asarray(features[kind], dtype=np.float64)
+            grid.flags.writeable = False
+            self._grids[key] = grid
+        return grid
+
+    def theme_features(self, theme):
+        """
+        Returns {stem_name: feature dict} for the analyzed stems of one theme.
+        """
+        self._load()
+        return {
+            record.stem_name: self._features[record.content_hash]
+            for record in get_catalog(self.base_dir).stems(theme)
+            if record.content_hash in self._features
+        }
+
+    def normalized_gains(self, theme, default_gain=0.8, target_lufs=TARGET_LUFS):
+        """
+        Loudness-normalized default gains for a theme: a stem measured at target_lufs
+        gets default_gain, louder/quieter stems are scaled by their loudness difference
+        (clamped to the mixer's gain range). Stems without analysis are left out
+        (callers fall back to default_gain).
+        """
+        gains = {}
+        for name, f in self.theme_features(theme).items():
+            if f["lufs"] <= SILENCE_DB:
+                continue
+            gain = default_gain * 10.0 ** ((target_lufs - f["lufs"]) / 20.0)
+            gains[name] = round(min(MAX_NORMALIZED_GAIN, max(MIN_NORMALIZED_GAIN, gain)), 3)
+        return gains
+
+    def prompt_features(self, theme):
+        """
+        Compact per-stem summary for LLM prompts: {stem: {"lufs", "peak_db", "tempo"}}.
+        """
+        return {
+            name: {"lufs": round(f["lufs"], 1), "peak_db": round(f["peak_db"], 1),
+                   "tempo": round(f["tempo"])}
+            for name, f in self.theme_features(theme).items()
+        }
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_analysis(base_dir="audio_clips"):
+    """
+    Returns the shared AnalysisIndex for base_dir. Never analyzes audio; run
+    `python stem_analysis.py` (or refresh()) to build the sidecar.
+    """
+    key = os.path.normpath(base_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = AnalysisIndex(key)
+        return index
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute loudness/tempo/beat features for every stem.")
+    parser.add_argument("--base-dir", default="audio_clips", help="Stem root directory")
+    parser.add_argument("--workers", type=int, default=None, help="Analysis processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    result = get_analysis(args.base_dir).refresh(args.workers)
+    print(json.dumps(result))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# ---------------------------------------------------------------------------
+# stem_catalog.py
+#
+# Step-by-step overview:
+# 1. Defines StemRecord: everything we know about one stem file (path, size, mtime,
+#    content hash, sample rate, channels, frame count, duration)
+# 2. Defines StemCatalog: a SQLite-backed index of audio_clips/<theme>/*.wav
+#     - refresh() stats files and only re-reads headers/hashes for new or changed ones
+#     - themes()/stems() answer lookups from the index instead of listing directories
+# 3. Provides get_catalog(): one shared catalog per base directory, refreshed at most
+#    once per refresh interval so UI clicks never pay for a directory walk
+# ---------------------------------------------------------------------------
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from stem_store import content_hash, read_wav_info
+
+CATALOG_FILENAME = ".stem_catalog.sqlite"
+DEFAULT_REFRESH_INTERVAL = 30.0
+
+# One indexed stem; path is relative to the catalog's base directory ("explore/drums.wav")
+StemRecord = namedtuple(
+    "StemRecord",
+    ["path", "theme", "stem_name", "size", "mtime_ns", "content_hash",
+     "sample_rate", "channels", "frames", "duration"],
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stems (
+    path TEXT PRIMARY KEY,
+    theme TEXT NOT NULL,
+    stem_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    channels INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stems_theme ON stems(theme);
+CREATE INDEX IF NOT EXISTS stems_hash ON stems(content_hash);
+"""
+
+class StemCatalog:
+    """
+    Persistent index of every stem under base_dir/<theme>/*.wav.
+    The index lives in a SQLite file (base_dir/.stem_catalog.sqlite by default) and is
+    refreshed incrementally: files whose size and mtime are unchanged are never re-read.
+    """
+    def __init__(self, base_dir="audio_clips", db_path=None):
+        self.base_dir = os.path.normpath(base_dir)
+        self.db_path = db_path or os.path.join(self.base_dir, CATALOG_FILENAME)
+        self._lock = threading.RLock()
+        try:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError:
+            # Read-only asset trees still get an (unpersisted) index
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        self.last_refresh = 0.0
+
+    def _scan(self):
+        """
+        Lists (relative path, theme, stem name, stat) for every .wav one level below base_dir.
+        Hidden and underscore-prefixed folders (e.g. _assets build output) are not themes.
+        """
+        found = []
+        if not os.path.isdir(self.base_dir):
+            return found
+        for theme_entry in os.scandir(self.base_dir):
+            if not theme_entry.is_dir() or theme_entry.name.startswith((".", "_")):
+                continue
+            for entry in os.scandir(theme_entry.path):
+                if entry.is_file() and entry.name.endswith(".wav"):
+                    rel_path = f"{theme_entry.name}/{entry.name}"
+                    stem_name = os.path.splitext(entry.name)[0]
+                    found.append((rel_path, theme_entry.name, stem_name, entry.stat()))
+        return found
+
+    def refresh(self):
+        """
+        Brings the index up to date with the files on disk.
+        New or modified files (by size/mtime) are re-hashed and their WAV headers re-parsed;
+        deleted files, and changed files that can no longer be read, are dropped.
+        Returns counts of added/updated/removed/unchanged stems.
+        """
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        with self._lock:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in self._conn.execute("SELECT path, size, mtime_ns FROM stems")
+            }
+            seen = set()
+            for rel_path, theme, stem_name, st in self._scan():
+                seen.add(rel_path)
+                previous = known.get(rel_path)
+                if previous == (st.st_size, st.st_mtime_ns):
+                    counts["unchanged"] += 1
+                    continue
+                full_path = os.path.join(self.base_dir, rel_path)
+                try:
+                    info = read_wav_info(full_path)
+                    digest = content_hash(full_path)
+                except (OSError, ValueError):
+                    # Not a readable PCM WAV: leave it out of the index, and drop a stale
+                    # row so its old content hash no longer stands for this path
+                    if previous:
+                        self._conn.execute("DELETE FROM stems WHERE path = ?", (rel_path,))
+                        counts["removed"] += 1
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO stems VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rel_path, theme, stem_name, st.st_size, st.st_mtime_ns,
+                     digest, info.sample_rate, info.channels,
+                     info.frames, info.frames / float(info.sample_rate)),
+                )
+                counts["updated" if previous else "added"] += 1
+            for rel_path in set(known) - seen:
+                self._conn.execute("DELETE FROM stems WHERE path = ?", (rel_path,))
+                counts["removed"] += 1
+            self._conn.commit()
+            self.last_refresh = time.time()
+        return counts
+
+    def refresh_if_stale(self, max_age=DEFAULT_REFRESH_INTERVAL):
+        """
+        Refreshes the index only if the last refresh is older than max_age seconds.
+        """
+        if time.time() - self.last_refresh >= max_age:
+            return self.refresh()
+        return None
+
+    def themes(self):
+        """
+        Returns the sorted list of theme folders that contain at least one stem.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT theme FROM stems ORDER BY theme").fetchall()
+        return [row[0] for row in rows]
+
+    def stems(self, theme):
+        """
+        Returns the StemRecords for one theme, sorted by stem name.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM stems WHERE theme = ? ORDER BY stem_name", (theme,)
+            ).fetchall()
+        return [StemRecord(*row) for row in rows]
+
+    def get(self, rel_path):
+        """
+        Returns the StemRecord for a path relative to base_dir (e.g. "explore/drums.wav"), or None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM stems WHERE path = ?", (rel_path,)).fetchone()
+        return StemRecord(*row) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(base_dir="audio_clips", max_age=DEFAULT_REFRESH_INTERVAL):
+    """
+    Returns the shared StemCatalog for base_dir, refreshing it if it is older than max_age seconds.
+    """
+    key = os.path.normpath(base_dir)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = StemCatalog(key)
+    catalog.refresh_if_stale(max_age)
+    return catalog
@@ -0,0 +1,338 @@
+# ---------------------------------------------------------------------------
+# stem_renderer.py
+#
+# Step-by-step overview:
+# 1. Imports NumPy for vectorized DSP, the stdlib wave module for WAV output and
+#    stem_store for decoded, format-normalized, deduplicated stem buffers
+# 2. Defines write_wav to quantize float32 (frames x channels) mixes to 16-bit PCM
+# 3. Defines build_envelopes: computes every stem's gain ramp in one vectorized pass
+# 4. Defines render_transition: stacks current/next stems into one tensor and mixes
+#    them down with a single matrix operation (no per-stem Python loop)
+#     - Checks an optional RenderCache first, so repeated transitions are a file read
+#     - An optional stretcher (time_stretch.TempoMatcher) tempo-matches the next stems
+#       to the current ones for the length of the fade window
+# 5. Defines measure_throughput: renders a transition and reports samples/second
+#    so server-side render speed can be tracked without relying on client playback
+# 6. Defines iter_transition_blocks: a constant-memory generator that reads every stem
+#    in fixed-size blocks, applies that block's gain ramps and yields mixed PCM blocks
+# 7. Defines stream_transition_wav + make_transition_wsgi_app: a streamed WAV response
+#    (WSGI iterable / HTTP chunked) so playback starts after the first block;
+#    wav_bytes() encodes an already rendered mix as an in-memory WAV
+# ---------------------------------------------------------------------------
+
+import json
+import os
+import struct
+import time
+import wave
+import numpy as np
+from stem_store import (CANONICAL_SAMPLE_RATE, convert_format, decode_pcm, get_default_store,
+                        read_pcm, read_wav_info)
+from render_cache import transition_key
+
+DEFAULT_SAMPLE_RATE = CANONICAL_SAMPLE_RATE
+DEFAULT_BLOCK_FRAMES = 8192
+
+def write_wav(path, samples, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Writes a float32 (frames, channels) buffer to a 16-bit PCM WAV file.
+    Samples are clipped to [-1.0, 1.0] before quantization.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(samples.shape[1])
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+    return path
+
+def build_envelopes(start_gains, end_gains, fade_durations, n_frames, sample_rate, offset=0,
+                    start_offset=0):
+    """
+    Computes linear gain ramps for all stems at once.
+    Returns a float32 matrix shaped (n_stems, n_frames): each row holds its start gain
+    until frame start_offset, ramps to its end gain over its fade duration, then holds
+    the end gain. offset is the frame index of the first column (for block-wise rendering).
+    """
+    start = np.asarray(start_gains, dtype=np.float32)[:, None]
+    end = np.asarray(end_gains, dtype=np.float32)[:, None]
+    fade_frames = np.maximum(np.asarray(fade_durations, dtype=np.float32) * sample_rate, 1.0)[:, None]
+    t = np.arange(offset - start_offset, offset - start_offset + n_frames, dtype=np.float32)[None, :]
+    progress = np.clip(t / fade_frames, 0.0, 1.0)
+    return start + (end - start) * progress
+
+def _stack_stems(buffers, n_frames, channels):
+    """
+    Packs decoded stems into one zero-padded tensor shaped (n_stems, n_frames, channels).
+    """
+    stacked = np.zeros((len(buffers), n_frames, channels), dtype=np.float32)
+    for i, buf in enumerate(buffers):
+        length = min(len(buf), n_frames)
+        stacked[i, :length, :] = buf[:length]
+    return stacked
+
+def _crossfade_gains(gains, n_current):
+    """
+    Start/end gains for a crossfade: current stems go gain -> 0, next stems 0 -> gain.
+    """
+    start_gains = gains[:n_current] + [0.0] * (len(gains) - n_current)
+    end_gains = [0.0] * n_current + gains[n_current:]
+    return start_gains, end_gains
+
+def render_transition(current_stems, next_stems,
+                      base_dir="audio_clips",
+                      duration=None,
+                      output_path=None,
+                      store=None,
+                      cache=None,
+                      start_offset=0,
+                      stretcher=None,
+                      tempo_plan=None,
+                      position_frames=0):
+    """
+    Renders the crossfade between two lists of stem dicts (filename/targetgain/fadeduration)
+    into a single PCM buffer on the server.
+    Current stems fade from their target gain to silence, next stems fade in from silence
+    to their target gain, mirroring what the browser mixer does with Howler.js.
+    Stems are loaded through a StemStore (the process-wide one by default), so they are
+    already in the store's canonical sample rate and channel layout.
+    If a RenderCache is given, a previously rendered identical transition (same stem
+    content, quantized gains/fades) is returned from it and new renders are stored in it.
+    start_offset delays the start of every fade by that many frames (beat_scheduler.py);
+    position_frames is the outgoing stems' playback position, so they continue from it
+    (next stems always start at their beginning) and the fades land where it was scheduled.
+    If a stretcher is given, next stems are played at the current stems' tempo until
+    their fade completes (tempo_plan: a precomputed stretcher.plan() result).
+    Returns a float32 array shaped (frames, channels), or writes a 16-bit WAV and returns
+    its path if output_path is given.
+    """
+    stems = list(current_stems) + list(next_stems)
+    if not stems:
+        raise ValueError("No stems to render")
+
+    store = store or get_default_store()
+    sample_rate = store.sample_rate
+    channels = store.channels
+    if stretcher is None:
+        tempo_plan = None  # Without a stretcher the plan changes nothing, so keep it out of the key
+    elif tempo_plan is None:
+        tempo_plan = stretcher.plan(current_stems, next_stems, base_dir, sample_rate, channels)
+    key = None
+    if cache is not None:
+        key = transition_key(current_stems, next_stems, base_dir, duration, sample_rate, channels,
+                             start_offset, tempo_plan, position_frames)
+        mix = cache.get(key)
+        if mix is not None:
+            return write_wav(output_path, mix, sample_rate) if output_path else mix
+
+    buffers = [store.get(os.path.join(base_dir, stem["filename"])) for stem in stems]
+    if position_frames:
+        for i in range(len(current_stems)):
+            buffers[i] = buffers[i][position_frames:]
+    gains = [float(stem["targetgain"]) for stem in stems]
+    fades = [float(stem["fadeduration"]) for stem in stems]
+    if tempo_plan:
+        n_current = len(current_stems)
+        for i, entry in enumerate(tempo_plan):
+            if entry is not None:
+                window = start_offset + int(round(fades[n_current + i] * sample_rate))
+                buffers[n_current + i] = stretcher.apply(buffers[n_current + i], entry, window, sample_rate)
+
+    if duration is None:
+        n_frames = max(len(buf) for buf in buffers)
+    else:
+        n_frames = int(round(duration * sample_rate))
+
+    start_gains, end_gains = _crossfade_gains(gains, len(current_stems))
+
+    envelopes = build_envelopes(start_gains, end_gains, fades, n_frames, sample_rate,
+                                start_offset=start_offset)
+    stacked = _stack_stems(buffers, n_frames, channels)
+    # Mixdown: sum over stems of envelope[s, f] * audio[s, f, c], as one contraction
+    mix = np.einsum("sf,sfc->fc", envelopes, stacked, optimize=True)
+    if key is not None:
+        cache.put(key, mix)
+
+    if output_path:
+        return write_wav(output_path, mix, sample_rate)
+    return mix
+
+def measure_throughput(current_stems, next_stems, base_dir="audio_clips", repeats=3):
+    """
+    Renders the same transition several times and returns a dict with the best
+    wall-clock time and the resulting throughput in output samples per second.
+    """
+    best = float("inf")
+    frames = 0
+    for _ in range(max(1, repeats)):
+        started = time.perf_counter()
+        mix = render_transition(current_stems, next_stems, base_dir=base_dir)
+        best = min(best, time.perf_counter() - started)
+        frames = len(mix)
+    return {
+        "frames": frames,
+        "seconds": best,
+        "samples_per_second": frames / best if best > 0 else float("inf"),
+    }
+
+class _BlockReader:
+    """
+    Reads one WAV stem block by block in the output sample rate/channel layout.
+    Only the frames needed for the requested block are read from disk.
+    """
+    def __init__(self, path, sample_rate, channels):
+        self.info = read_wav_info(path)
+        self.file = open(path, "rb")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.ratio = self.info.sample_rate / float(sample_rate)
+        self.n_frames = int(round(self.info.frames / self.ratio))
+
+    def read(self, start, n):
+        """
+        Returns float32 (n, channels) output frames [start, start + n), zero-padded past the end.
+        """
+        out = np.zeros((n, self.channels), dtype=np.float32)
+        count = min(n, self.n_frames - start)
+        if count <= 0:
+            return out
+        if self.ratio == 1.0:
+            block = decode_pcm(read_pcm(self.file, self.info, start, count), self.info)
+        else:
+            positions = (start + np.arange(count, dtype=np.float64)) * self.ratio
+            first = int(positions[0])
+            raw = decode_pcm(read_pcm(self.file, self.info, first, int(positions[-1]) - first + 2), self.info)
+            idx = np.minimum(positions.astype(np.int64) - first, len(raw) - 1)
+            nxt = np.minimum(idx + 1, len(raw) - 1)
+            frac = (positions - positions.astype(np.int64)).astype(np.float32)[:, None]
+            block = raw[idx] * (1.0 - frac) + raw[nxt] * frac
+        block = convert_format(block, self.sample_rate, self.sample_rate, self.channels)
+        out[:len(block)] = block[:count]
+        return out
+
+    def close(self):
+        self.file.close()
+
+def iter_transition_blocks(current_stems, next_stems,
+                           base_dir="audio_clips",
+                           duration=None,
+                           block_frames=DEFAULT_BLOCK_FRAMES,
+                           sample_rate=DEFAULT_SAMPLE_RATE,
+                           channels=2,
+                           start_offset=0):
+    """
+    Generator version of render_transition with constant memory use.
+    Reads every stem in block_frames chunks, applies each block's slice of the gain
+    envelopes and yields mixed float32 (frames, channels) blocks. Peak memory is
+    about block_frames x stems x channels samples, independent of stem length.
+    """
+    stems = list(current_stems) + list(next_stems)
+    if not stems:
+        raise ValueError("No stems to render")
+    gains = [float(stem["targetgain"]) for stem in stems]
+    fades = [float(stem["fadeduration"]) for stem in stems]
+    start_gains, end_gains = _crossfade_gains(gains, len(current_stems))
+
+    readers = []
+    try:
+        for stem in stems:
+            readers.append(_BlockReader(os.path.join(base_dir, stem["filename"]), sample_rate, channels))
+        if duration is None:
+            n_frames = max(reader.n_frames for reader in readers)
+        else:
+            n_frames = int(round(duration * sample_rate))
+        stacked = np.zeros((len(readers), block_frames, channels), dtype=np.float32)
+        for offset in range(0, n_frames, block_frames):
+            n = min(block_frames, n_frames - offset)
+            for i, reader in enumerate(readers):
+                stacked[i, :n] = reader.read(offset, n)
+            envelopes = build_envelopes(start_gains, end_gains, fades, n, sample_rate, offset,
+                                        start_offset)
+            yield np.einsum("sf,sfc->fc", envelopes, stacked[:, :n], optimize=True)
+    finally:
+        for reader in readers:
+            reader.close()
+
+def transition_frame_count(current_stems, next_stems, base_dir="audio_clips",
+                           duration=None, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Output length in frames of a transition, from WAV headers only.
+    """
+    if duration is not None:
+        return int(round(duration * sample_rate))
+    frames = 0
+    for stem in list(current_stems) + list(next_stems):
+        info = read_wav_info(os.path.join(base_dir, stem["filename"]))
+        frames = max(frames, int(round(info.frames * sample_rate / float(info.sample_rate))))
+    return frames
+
+def _wav_header(n_frames, sample_rate, channels, sampwidth=2):
+    """
+    44-byte PCM WAV header for a stream whose length is known in advance.
+    """
+    data_size = n_frames * channels * sampwidth
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * sampwidth, channels * sampwidth, sampwidth * 8,
+        b"data", data_size,
+    )
+
+def wav_bytes(samples, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Returns a float32 (frames, channels) buffer as an in-memory 16-bit PCM WAV file.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    return _wav_header(len(samples), sample_rate, samples.shape[1]) + pcm.tobytes()
+
+def stream_transition_wav(current_stems, next_stems,
+                          base_dir="audio_clips",
+                          duration=None,
+                          block_frames=DEFAULT_BLOCK_FRAMES,
+                          sample_rate=DEFAULT_SAMPLE_RATE,
+                          channels=2,
+                          start_offset=0):
+    """
+    Yields a complete 16-bit WAV file as bytes: the header first, then one PCM chunk per block.
+    """
+    n_frames = transition_frame_count(current_stems, next_stems, base_dir, duration, sample_rate)
+    yield _wav_header(n_frames, sample_rate, channels)
+    for block in iter_transition_blocks(current_stems, next_stems, base_dir, duration,
+                                        block_frames, sample_rate, channels, start_offset):
+        yield (np.clip(block, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+def make_transition_wsgi_app(base_dir="audio_clips", block_frames=DEFAULT_BLOCK_FRAMES):
+    """
+    Returns a WSGI app that renders a transition as a streamed WAV response.
+    POST a JSON body {"current_stems": [...], "next_stems": [...], "duration": optional,
+    "start_offset": optional frames before the fades begin}.
+    The response body is an iterable of blocks, so servers send it chunked and clients
+    can start playback after the first block arrives.
+    """
+    def app(environ, start_response):
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            body = json.loads(environ["wsgi.input"].read(length) or b"{}")
+            current_stems = body.get("current_stems", [])
+            next_stems = body.get("next_stems", [])
+            if not current_stems and not next_stems:
+                raise ValueError("No stems to render")
+            chunks = stream_transition_wav(current_stems, next_stems, base_dir,
+                                           body.get("duration"), block_frames,
+                                           start_offset=int(body.get("start_offset") or 0))
+            header = next(chunks)  # Validates stem files before committing to a 200
+        except (ValueError, KeyError, OSError) as e:
+            start_response("400 Bad Request", [("Content-Type", "text/plain; charset=utf-8")])
+            return [str(e).encode("utf-8")]
+        start_response("200 OK", [("Content-Type", "audio/wav")])
+
+        def body_iter():
+            yield header
+            yield from chunks
+        return body_iter()
+    return app
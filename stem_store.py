@@ -0,0 +1,321 @@
+# ---------------------------------------------------------------------------
+# stem_store.py
+#
+# Step-by-step overview:
+# 1. Parses RIFF/WAVE headers directly so PCM data can be memory-mapped in place
+#    (np.memmap over the data chunk, no read/copy of the file), or read block by block
+# 2. Decodes 8/16/24/32-bit integer and 32-bit float PCM to float32 (frames x channels)
+# 3. Converts sample rate (linear interpolation) and channel layout to one canonical format
+# 4. Defines StemStore: a byte-budgeted LRU cache of canonical float32 stems keyed by
+#    content hash, so identical files in different theme folders share a single buffer
+#     - With shared_dir set, decoded stems are also written once as .npy files and
+#       memory-mapped, so several worker processes share one copy via the page cache
+# 5. Provides get_default_store() for a process-wide shared store
+# ---------------------------------------------------------------------------
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+CANONICAL_SAMPLE_RATE = 44100
+CANONICAL_CHANNELS = 2
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Header fields for a WAV file, plus where its PCM payload lives on disk
+WavInfo = namedtuple(
+    "WavInfo",
+    ["sample_rate", "channels", "sampwidth", "frames", "is_float", "data_offset", "data_size"],
+)
+
+def read_wav_info(path):
+    """
+    Parses the RIFF chunk list of a WAV file without reading the audio payload.
+    Returns a WavInfo with format fields and the byte offset/size of the data chunk.
+    """
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError(f"Not a RIFF/WAVE file: {path}")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"WAV data chunk precedes fmt chunk: {path}")
+                format_tag, channels, sample_rate, bits = fmt
+                if format_tag not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_IEEE_FLOAT):
+                    raise ValueError(f"Unsupported WAV format tag {format_tag:#x}: {path}")
+                sampwidth = bits // 8
+                data_offset = f.tell()
+                # Some writers leave the size at 0/0xFFFFFFFF for streamed files
+                data_size = min(chunk_size, os.path.getsize(path) - data_offset)
+                frames = data_size // (sampwidth * channels)
+                return WavInfo(sample_rate, channels, sampwidth, frames,
+                               format_tag == _WAVE_FORMAT_IEEE_FLOAT, data_offset, data_size)
+            else:
+                f.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size % 2:
+                f.seek(1, os.SEEK_CUR)
+    raise ValueError(f"WAV file has no data chunk: {path}")
+
+def _pcm_layout(info, frames):
+    """
+    Returns (dtype, shape) of the raw PCM array for a number of frames.
+    24-bit samples are kept as (frames, channels, 3) uint8 for decode_pcm.
+    """
+    if info.sampwidth == 3:
+        return np.uint8, (frames, info.channels, 3)
+    if info.sampwidth == 4:
+        return ("<f4" if info.is_float else "<i4"), (frames, info.channels)
+    if info.sampwidth in (1, 2):
+        return (np.uint8 if info.sampwidth == 1 else "<i2"), (frames, info.channels)
+    raise ValueError(f"Unsupported sample width: {info.sampwidth} bytes")
+
+def map_pcm(path, info=None):
+    """
+    Memory-maps the PCM payload of a WAV file read-only.
+    Returns (mapped, info): mapped is shaped (frames, channels) for 8/16/32-bit samples
+    and (frames, channels, 3) uint8 for 24-bit samples. No audio bytes are copied.
+    """
+    info = info or read_wav_info(path)
+    if info.frames == 0:
+        return np.zeros((0, info.channels), dtype=np.float32), info
+    dtype, shape = _pcm_layout(info, info.frames)
+    mapped = np.memmap(path, dtype=dtype, mode="r", offset=info.data_offset, shape=shape)
+    return mapped, info
+
+def read_pcm(f, info, start, frames):
+    """
+    Reads up to `frames` raw PCM frames starting at frame `start` from an open binary file.
+    Returns an array in the same layout as map_pcm (pass it to decode_pcm). Unlike
+    map_pcm this never keeps file pages mapped, so memory stays bounded by the block size.
+    """
+    start = max(0, min(start, info.frames))
+    frames = max(0, min(frames, info.frames - start))
+    frame_bytes = info.sampwidth * info.channels
+    f.seek(info.data_offset + start * frame_bytes)
+    raw = f.read(frames * frame_bytes)
+    dtype, shape = _pcm_layout(info, len(raw) // frame_bytes)
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+def decode_pcm(mapped, info):
+    """
+    Converts a (slice of a) mapped PCM array to float32 (frames, channels) in [-1.0, 1.0].
+    Float WAV data that is already float32 is returned as-is (still memory-mapped).
+    """
+    if info.sampwidth == 3:
+        b = mapped.astype(np.int32)
+        ints = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        return ints.astype(np.float32) / float(1 << 23)
+    if info.is_float:
+        return mapped.view(np.float32) if mapped.dtype == np.dtype("<f4") else mapped.astype(np.float32)
+    if info.sampwidth == 1:
+        return (mapped.astype(np.float32) - 128.0) / 128.0
+    if info.sampwidth == 2:
+        return mapped.astype(np.float32) / 32768.0
+    return mapped.astype(np.float32) / float(1 << 31)
+
+def convert_format(samples, src_rate, dst_rate=CANONICAL_SAMPLE_RATE, dst_channels=CANONICAL_CHANNELS):
+    """
+    Converts float32 (frames, channels) audio to the given sample rate and channel count.
+    Resampling is linear interpolation; mono is duplicated to every channel and
+    multi-channel audio is averaged down to mono, or truncated/padded otherwise.
+    Returns the input unchanged when no conversion is needed.
+    """
+    channels = samples.shape[1]
+    if channels != dst_channels:
+        if channels == 1:
+            samples = np.repeat(samples, dst_channels, axis=1)
+        elif dst_channels == 1:
+            samples = samples.mean(axis=1, keepdims=True, dtype=np.float32)
+        elif channels > dst_channels:
+            samples = samples[:, :dst_channels]
+        else:
+            pad = np.zeros((len(samples), dst_channels - channels), dtype=np.float32)
+            samples = np.concatenate([samples, pad], axis=1)
+    if src_rate != dst_rate and len(samples) > 1:
+        n_out = int(round(len(samples) * dst_rate / src_rate))
+        positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+        idx = np.minimum(positions.astype(np.int64), len(samples) - 2)
+        frac = (positions - idx).astype(np.float32)[:, None]
+        samples = samples[idx] * (1.0 - frac) + samples[idx + 1] * frac
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_wav(path):
+    """
+    Reads a WAV file and returns (samples, sample_rate), where samples is a
+    float32 array shaped (frames, channels) in the file's native format.
+    """
+    mapped, info = map_pcm(path)
+    return decode_pcm(mapped, info), info.sample_rate
+
+class StemStore:
+    """
+    Byte-budgeted LRU cache of decoded stems in one canonical float32 format.
+    Buffers are keyed by content hash, so the same audio stored under several
+    theme folders is decoded and held in memory only once. Returned arrays are
+    read-only and safe to share between callers.
+    If shared_dir is given, decoded buffers are persisted there as .npy files and
+    memory-mapped instead of held privately, so processes (e.g. gunicorn workers)
+    using the same shared_dir decode each stem once and share its pages.
+    """
+    def __init__(self,
+                 sample_rate=CANONICAL_SAMPLE_RATE,
+                 channels=CANONICAL_CHANNELS,
+                 max_bytes=DEFAULT_MAX_BYTES,
+                 shared_dir=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+        self._buffers = OrderedDict()   # content hash -> read-only float32 array
+        self._hashes = {}               # realpath -> (size, mtime_ns, content hash)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def content_hash(self, path):
+        """
+        Returns the content hash for a file, re-hashing only when its size or mtime changed.
+        """
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        with self._lock:
+            cached = self._hashes.get(real)
+            if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                return cached[2]
+        digest = content_hash(real)
+        with self._lock:
+            self._hashes[real] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def get(self, path):
+        """
+        Returns the canonical float32 (frames, channels) buffer for a WAV file,
+        decoding and converting it on first use only.
+        """
+        key = self.content_hash(path)
+        with self._lock:
+            buf = self._buffers.get(key)
+            if buf is not None:
+                self._buffers.move_to_end(key)
+                self.hits += 1
+                return buf
+            self.misses += 1
+        if self.shared_dir:
+            buf = self._load_shared(key, path)
+        else:
+            buf = self._decode(path)
+        buf.flags.writeable = False
+        self._insert(key, buf)
+        return buf
+
+    def _decode(self, path):
+        mapped, info = map_pcm(path)
+        return convert_format(decode_pcm(mapped, info), info.sample_rate, self.sample_rate, self.channels)
+
+    def _load_shared(self, key, path):
+        """
+        Memory-maps the decoded stem from shared_dir, decoding and publishing it first
+        (atomically, via temp file + os.replace) if no process has done so yet.
+        """
+        shared_path = os.path.join(self.shared_dir, f"{key}.{self.sample_rate}x{self.channels}.npy")
+        try:
+            return np.load(shared_path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+        buf = self._decode(path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.shared_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, buf)
+            os.replace(tmp_path, shared_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return np.load(shared_path, mmap_mode="r")
+
+    def _insert(self, key, buf):
+        """
+        Adds a buffer under its content hash and evicts least-recently-used
+        buffers until the store fits its byte budget again.
+        """
+        with self._lock:
+            if key in self._buffers:
+                return
+            if buf.nbytes > self.max_bytes:
+                return  # Larger than the whole budget: hand it out uncached
+            self._buffers[key] = buf
+            self._bytes += buf.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._buffers.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns cache counters and current memory usage as a dict.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._buffers),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        """
+        Drops every cached buffer (hash memo is kept).
+        """
+        with self._lock:
+            self._buffers.clear()
+            self._bytes = 0
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_default_store():
+    """
+    Returns the process-wide StemStore, creating it on first use.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = StemStore()
+        return _default_store
@@ -0,0 +1,297 @@
+# ---------------------------------------------------------------------------
+# telemetry.py
+#
+# Step-by-step overview:
+# 1. Defines Histogram: fixed cumulative buckets (Prometheus-style) plus a bounded window
+#    of recent samples for p50/p95/p99
+# 2. Defines Telemetry: process-wide, thread-safe metrics registry
+#     - span(stage): context manager timing one pipeline stage into
+#       transition_stage_seconds{stage="..."}; traced(stage) is the decorator form
+#       (sync and async functions)
+#     - observe()/inc(): size histograms (prompt/response characters) and counters
+#     - register_cache(): exports hits/misses/hit ratio of any cache with stats()
+#     - slo_report(): share of transitions within TRANSITION_SLO_SECONDS; slower ones
+#       are counted in transition_slo_violations_total
+# 3. render_prometheus(): Prometheus text exposition format (served by the transition
+#    service at /metrics); summary(): per-stage rows for the Streamlit debug panel
+# 4. Provides get_telemetry() for the process-wide instance
+# ---------------------------------------------------------------------------
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUANTILES = (0.5, 0.95, 0.99)
+RECENT_SAMPLES = 2048
+# End-to-end latency objective for one transition (button click to mixer update)
+TRANSITION_SLO_SECONDS = float(os.getenv("TRANSITION_SLO_SECONDS", "3.0"))
+
+STAGE_METRIC = "transition_stage_seconds"
+SLO_STAGE = "transition"
+
+class Histogram:
+    """
+    One labelled histogram series: cumulative bucket counts, sum and count for export,
+    and the most recent samples for quantiles.
+    """
+    def __init__(self, buckets, window=RECENT_SAMPLES):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self, qs=QUANTILES):
+        """
+        {q: value} over the recent window, or {} before the first sample.
+        """
+        if not self.recent:
+            return {}
+        values = np.quantile(np.fromiter(self.recent, dtype=np.float64), qs)
+        return dict(zip(qs, values.tolist()))
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Telemetry:
+    """
+    Metrics registry for the transition pipeline. All methods are thread-safe.
+    """
+    def __init__(self, slo_seconds=TRANSITION_SLO_SECONDS):
+        self.slo_seconds = slo_seconds
+        self._lock = threading.Lock()
+        self._histograms = {}   # name -> {"help", "buckets", "series": {labels: Histogram}}
+        self._counters = {}     # name -> {"help", "series": {labels: value}}
+        self._caches = {}       # name -> object with stats() -> {"hits", "misses", ...}
+        self.last_spans = {}    # stage -> seconds of its most recent run
+        self.describe(STAGE_METRIC, "Latency of transition pipeline stages.", LATENCY_BUCKETS)
+        self.describe("llm_prompt_chars", "Size of prompts sent to the LLM.", SIZE_BUCKETS)
+        self.describe("llm_response_chars", "Size of LLM responses.", SIZE_BUCKETS)
+        self.describe("llm_results_total", "Advisor results by source (llm, cache, fallback).")
+        self.describe("transition_slo_violations_total", "Transitions slower than the latency SLO.")
+
+    def describe(self, name, help_text, buckets=None):
+        """
+        Declares a histogram (buckets given) or a counter with its help text.
+        """
+        with self._lock:
+            if buckets is not None:
+                self._histograms.setdefault(name, {"help": help_text, "buckets": tuple(buckets), "series": {}})
+            else:
+                self._counters.setdefault(name, {"help": help_text, "series": {}})
+
+    def observe(self, name, value, **labels):
+        """
+        Records one sample in a histogram (declared on first use with latency buckets).
+        """
+        with self._lock:
+            metric = self._histograms.setdefault(name, {"help": name, "buckets": LATENCY_BUCKETS, "series": {}})
+            key = _label_key(labels)
+            series = metric["series"].get(key)
+            if series is None:
+                series = metric["series"][key] = Histogram(metric["buckets"])
+            series.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Adds to a counter (declared on first use).
+        """
+        with self._lock:
+            metric = self._counters.setdefault(name, {"help": name, "series": {}})
+            key = _label_key(labels)
+            metric["series"][key] = metric["series"].get(key, 0) + value
+
+    def register_cache(self, name, cache):
+        """
+        Exports cache.stats() hits/misses as cache_hits_total/cache_misses_total{cache=name}.
+        """
+        with self._lock:
+            self._caches[name] = cache
+
+    def record_span(self, stage, seconds):
+        self.observe(STAGE_METRIC, seconds, stage=stage)
+        self.last_spans[stage] = seconds
+        if stage == SLO_STAGE and seconds > self.slo_seconds:
+            self.inc("transition_slo_violations_total")
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Times the enclosed block as one run of `stage` (recorded even if it raises).
+        Yields a dict whose "seconds" is filled in on exit.
+        """
+        timing = {"stage": stage, "seconds": None}
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing["seconds"] = time.perf_counter() - start
+            self.record_span(stage, timing["seconds"])
+
+    def slo_report(self):
+        """
+        {"slo_seconds", "transitions", "violations", "compliance"} for whole transitions.
+        """
+        with self._lock:
+            series = self._histograms[STAGE_METRIC]["series"].get(_label_key({"stage": SLO_STAGE}))
+            total = series.count if series else 0
+            violations = self._counters.get("transition_slo_violations_total", {"series": {}})["series"].get((), 0)
+        return {
+            "slo_seconds": self.slo_seconds,
+            "transitions": total,
+            "violations": violations,
+            "compliance": (total - violations) / total if total else None,
+        }
+
+    def cache_stats(self):
+        """
+        {cache name: {"hits", "misses", "hit_rate"}} for every registered cache.
+        """
+        with self._lock:
+            caches = dict(self._caches)
+        out = {}
+        for name, cache in caches.items():
+            stats = cache.stats()
+            hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+            out[name] = {"hits": hits, "misses": misses,
+                         "hit_rate": hits / (hits + misses) if hits + misses else None}
+        return out
+
+    def summary(self, name=STAGE_METRIC):
+        """
+        Rows of {"stage", "count", "last", "p50", "p95", "p99", "mean"} (seconds) for a
+        histogram keyed by a single label, sorted by stage.
+        """
+        with self._lock:
+            metric = self._histograms.get(name)
+            series = dict(metric["series"]) if metric else {}
+            rows = []
+            for key, hist in series.items():
+                label = dict(key).get("stage", ",".join(f"{k}={v}" for k, v in key))
+                q = hist.quantiles()
+                rows.append({
+                    "stage": label,
+                    "count": hist.count,
+                    "last": self.last_spans.get(label) if name == STAGE_METRIC else None,
+                    "p50": q.get(0.5),
+                    "p95": q.get(0.95),
+                    "p99": q.get(0.99),
+                    "mean": hist.sum / hist.count if hist.count else None,
+                })
+        return sorted(rows, key=lambda row: row["stage"])
+
+    def render_prometheus(self):
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        Histograms also export their recent-window quantiles as a <name>_recent summary.
+        """
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._histograms.items()):
+                if not metric["series"]:
+                    continue
+                lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} histogram"]
+                for key, hist in sorted(metric["series"].items()):
+                    cumulative = 0
+                    for bound, count in zip(list(metric["buckets"]) + [float("inf")], hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(float(bound)))])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(hist.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+                lines += [f"# HELP {name}_recent Quantiles of {name} over the last {RECENT_SAMPLES} samples.",
+                          f"# TYPE {name}_recent summary"]
+                for key, hist in sorted(metric["series"].items()):
+                    for q, value in hist.quantiles().items():
+                        lines.append(f"{name}_recent{_format_labels(key, [('quantile', q)])} {_format_value(value)}")
+                    lines.append(f"{name}_recent_sum{_format_labels(key)} {_format_value(float(sum(hist.recent)))}")
+                    lines.append(f"{name}_recent_count{_format_labels(key)} {len(hist.recent)}")
+            for name, metric in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} counter"]
+                for key, value in sorted(metric["series"].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                if not metric["series"]:
+                    lines.append(f"{name} 0")
+        lines += ["# HELP transition_slo_seconds Latency objective for one transition.",
+                  "# TYPE transition_slo_seconds gauge",
+                  f"transition_slo_seconds {_format_value(float(self.slo_seconds))}"]
+        caches = self.cache_stats()
+        if caches:
+            for metric, field, kind in (("cache_hits_total", "hits", "counter"),
+                                        ("cache_misses_total", "misses", "counter"),
+                                        ("cache_hit_ratio", "hit_rate", "gauge")):
+                lines += [f"# HELP {metric} Cache {field.replace('_', ' ')} (this process).", f"# TYPE {metric} {kind}"]
+                for name, stats in sorted(caches.items()):
+                    if stats[field] is not None:
+                        lines.append(f"{metric}{{cache=\"{name}\"}} {_format_value(stats[field])}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Drops all recorded samples and counts (declarations and caches are kept).
+        """
+        with self._lock:
+            for metric in self._histograms.values():
+                metric["series"].clear()
+            for metric in self._counters.values():
+                metric["series"].clear()
+            self.last_spans.clear()
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+def get_telemetry():
+    """
+    Returns the process-wide Telemetry, creating it on first use.
+    """
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
+
+def traced(stage):
+    """
+    Decorator: times every call of a function (or coroutine function) as `stage`.
+    """
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_telemetry().span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_telemetry().span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
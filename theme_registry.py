@@ -0,0 +1,248 @@
+# ---------------------------------------------------------------------------
+# theme_registry.py
+#
+# Step-by-step overview:
+# 1. Loads the theme vocabulary once: themes.json (name, priority, keywords, aliases;
+#    THEMES_CONFIG env var for another file), or, without a config, the theme folders
+#    discovered in the stem catalog
+#     - theme_names() is the single list of themes used by schemas.py and the apps;
+#       the registry is built on first use, never at import (see import_budget.py)
+# 2. Compiles every keyword into one Aho-Corasick automaton (KeywordMatcher), so a
+#    theme string is scanned in a single pass however many themes/keywords exist
+# 3. ThemeRegistry.resolve(): maps a messy theme string (UI, LLM output, client request)
+#    to its canonical name, memoized per input with an LRU cache
+#     - exact name/alias lookup (dict), then keyword scan (highest priority wins),
+#       then fuzzy match for misspellings (trigram shortlist + difflib ratio)
+# ---------------------------------------------------------------------------
+
+import difflib
+import functools
+import json
+import os
+import re
+import threading
+from collections import Counter, deque
+
+# THEMES_CONFIG overrides the bundled themes.json (set_registry() swaps it in-process)
+DEFAULT_CONFIG_PATH = (os.getenv("THEMES_CONFIG")
+                       or os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes.json"))
+DEFAULT_MEMO_SIZE = 4096
+FUZZY_CUTOFF = 0.85       # 0.75 let "actionable" through as "action" -> combat
+FUZZY_SHORTLIST = 8
+
+def normalize_theme_text(text):
+    """
+    Canonical form of a theme string: camelCase split, lowercase, "_"/"-" as spaces.
+    Example: "Boss-Combat" -> "boss combat", "stealthMode" -> "stealth mode"
+    """
+    s = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    s = s.lower().replace("_", " ").replace("-", " ")
+    return " ".join(s.split())
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over (keyword, value) pairs: finds every keyword occurring
+    in a text in one pass, in time linear in the text length plus the number of matches.
+    """
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword, value in patterns:
+            if keyword:
+                self._add(keyword, value)
+        self._build()
+
+    def _add(self, keyword, value):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(keyword), value))
+
+    def _build(self):
+        """
+        Breadth-first pass setting failure links and merging outputs along them.
+        """
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text):
+        """
+        Yields (start index, keyword length, value) for every keyword occurrence.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                yield i - length + 1, length, value
+
+class ThemeRegistry:
+    """
+    The theme vocabulary plus a compiled resolver from free text to canonical names.
+    themes: list of {"name", "priority" (higher wins keyword ties, default 0),
+                     "keywords" (substrings), "aliases" (whole strings)}, in display order.
+    """
+    def __init__(self, themes, memo_size=DEFAULT_MEMO_SIZE, fuzzy_cutoff=FUZZY_CUTOFF):
+        self.themes = [dict(theme) for theme in themes]
+        self.names = tuple(theme["name"] for theme in self.themes)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        # Keyword matches are ranked by (priority, earliest position) - lower rank wins
+        self._rank = {theme["name"]: (-theme.get("priority", 0), i) for i, theme in enumerate(self.themes)}
+
+        # Exact lookup table: name and aliases, with and without spaces
+        self._exact = {}
+        for theme in self.themes:
+            for text in [theme["name"]] + list(theme.get("aliases", [])):
+                key = normalize_theme_text(text)
+                self._exact.setdefault(key, theme["name"])
+                self._exact.setdefault(key.replace(" ", ""), theme["name"])
+        self._matcher = KeywordMatcher(
+            (normalize_theme_text(keyword), theme["name"])
+            for theme in self.themes for keyword in theme.get("keywords", [])
+        )
+        # Trigram index over the exact keys, so fuzzy matching only scores a shortlist
+        self._fuzzy_keys = list(self._exact)
+        self._trigram_index = {}
+        for idx, key in enumerate(self._fuzzy_keys):
+            for gram in _trigrams(key):
+                self._trigram_index.setdefault(gram, []).append(idx)
+
+        self.resolve = functools.lru_cache(maxsize=memo_size)(self._resolve)
+
+    @classmethod
+    def from_config(cls, path=DEFAULT_CONFIG_PATH, **kwargs):
+        """
+        Loads {"themes": [...]} from a JSON config file.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["themes"], **kwargs)
+
+    @classmethod
+    def from_catalog(cls, base_dir="audio_clips", config_path=None, **kwargs):
+        """
+        One theme per stem folder in the catalog. Folders listed in the config keep
+        their keywords/aliases/priority; others match on their own folder name.
+        """
+        from stem_catalog import get_catalog
+        configured = {}
+        if config_path and os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                configured = {theme["name"]: theme for theme in json.load(f)["themes"]}
+        themes = [configured.get(name, {"name": name, "keywords": [normalize_theme_text(name)]})
+                  for name in sorted(get_catalog(base_dir).themes())]
+        return cls(themes, **kwargs)
+
+    def _resolve(self, theme_str):
+        if not theme_str:
+            return None
+        text = normalize_theme_text(theme_str)
+        if not text:
+            return None
+        name = self._exact.get(text) or self._exact.get(text.replace(" ", ""))
+        if name is not None:
+            return name
+        best = None
+        for start, _, value in self._matcher.iter_matches(text):
+            rank = (self._rank[value], start)
+            if best is None or rank < best[0]:
+                best = (rank, value)
+        if best is not None:
+            return best[1]
+        return self._fuzzy(text)
+
+    def _fuzzy(self, text):
+        """
+        Closest name/alias by difflib ratio, scoring only the keys that share the most
+        trigrams with the text (misspelled LLM output such as "stelth" or "combatt").
+        """
+        shared = Counter()
+        for gram in _trigrams(text):
+            shared.update(self._trigram_index.get(gram, ()))
+        best_name, best_score = None, self.fuzzy_cutoff
+        for idx, _ in shared.most_common(FUZZY_SHORTLIST):
+            key = self._fuzzy_keys[idx]
+            score = difflib.SequenceMatcher(None, text, key).ratio()
+            if score >= best_score:
+                best_name, best_score = self._exact[key], score
+        return best_name
+
+    def theme(self, name):
+        """
+        Config entry for a canonical theme name, or None.
+        """
+        for theme in self.themes:
+            if theme["name"] == name:
+                return theme
+        return None
+
+    def stats(self):
+        info = self.resolve.cache_info()
+        return {"themes": len(self.names), "memo_hits": info.hits, "memo_misses": info.misses,
+                "memo_size": info.currsize}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """
+    Process-wide registry: themes.json if present, else discovered from audio_clips/.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if os.path.exists(DEFAULT_CONFIG_PATH):
+                _registry = ThemeRegistry.from_config(DEFAULT_CONFIG_PATH)
+            else:
+                _registry = ThemeRegistry.from_catalog()
+        return _registry
+
+def set_registry(registry):
+    """
+    Replaces the process-wide registry (e.g. benchmark.py's synthetic vocabulary) and
+    returns the previous one, so the caller can restore it. None reloads on next use.
+    """
+    global _registry
+    with _registry_lock:
+        previous, _registry = _registry, registry
+        return previous
+
+def resolve_theme(theme_str):
+    """
+    Canonical theme name for a messy theme string, or None.
+    Example: "Boss-Combat" -> "bosscombat"
+    """
+    return get_registry().resolve(theme_str)
+
+def theme_names():
+    """
+    Canonical theme names, in display order.
+    """
+    return get_registry().names
+
+def __getattr__(name):
+    # THEME_NAMES stays importable, but only loads the registry when first accessed
+    if name == "THEME_NAMES":
+        return theme_names()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
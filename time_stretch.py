@@ -0,0 +1,250 @@
+# ---------------------------------------------------------------------------
+# time_stretch.py
+#
+# Step-by-step overview:
+# 1. reference_tempo(): the outgoing stems' tempo, from the stem_analysis index
+#    (the stem with the densest bar grid, as beat_scheduler.py uses for alignment)
+# 2. stretch_rate(): playback-speed factor that brings an incoming stem to that tempo,
+#    folded by octaves (63 vs 126 BPM needs no stretch) and capped at MAX_STRETCH
+# 3. stretch_head(): time-stretches the first STRETCH_SECONDS of a stem - phase vocoder
+#    (librosa, pitch-preserving) when installed, else linear resampling
+#     - splice(): uses the stretched audio for the fade window only, then continues
+#       the original stem from the matching source position (short crossfaded seam)
+# 4. TempoMatcher: plan()/apply() hooks for render_transition; stretched heads are
+#    cached per (stem hash, source tempo, target tempo) in a size-capped RenderCache
+# 5. precompute(): stretches every (incoming stem, outgoing theme tempo) pair that is
+#    not cached yet on a process pool, so renders never stretch per click
+#
+# Usage (after `python stem_analysis.py`):
+#   python time_stretch.py --workers 4 [--cache-dir .service_state/stretch]
+# ---------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from render_cache import RenderCache
+from stem_analysis import get_analysis
+from stem_catalog import get_catalog
+from stem_store import CANONICAL_CHANNELS, CANONICAL_SAMPLE_RATE, convert_format, load_wav
+
+DEFAULT_STRETCH_DIR = ".stretch_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+STRETCH_SECONDS = 16.0      # stretched head per stem; longer fade windows are clipped to it
+SEAM_FRAMES = 512           # crossfade from the stretched head back into the original stem
+MAX_STRETCH = 1.25          # larger tempo gaps (after octave folding) are left alone
+MIN_STRETCH = 0.005         # closer tempos are not worth stretching
+TEMPO_QUANTUM = 0.1         # BPM resolution of cache keys
+
+def default_method():
+    """
+    "phase_vocoder" (pitch-preserving) if librosa is installed, else "resample".
+    Only looks the package up; librosa itself is imported when a stretch runs.
+    """
+    return "phase_vocoder" if importlib.util.find_spec("librosa") is not None else "resample"
+
+def reference_tempo(current_stems, base_dir="audio_clips"):
+    """
+    Tempo (BPM) of the outgoing stems: the analyzed stem with the most downbeats, or None.
+    """
+    analysis = get_analysis(base_dir)
+    best = None
+    for stem in current_stems:
+        features = analysis.get(stem["filename"])
+        if features and features.get("tempo") and (best is None or len(features["downbeats"]) > len(best["downbeats"])):
+            best = features
+    return best["tempo"] if best else None
+
+def stretch_rate(source_tempo, target_tempo, max_stretch=MAX_STRETCH):
+    """
+    Playback-speed factor (> 1 = faster) taking source_tempo to target_tempo, folded
+    into [1/sqrt(2), sqrt(2)] by octaves. None if no stretch is needed or possible.
+    """
+    if not source_tempo or not target_tempo:
+        return None
+    rate = float(target_tempo) / float(source_tempo)
+    while rate > math.sqrt(2.0):
+        rate /= 2.0
+    while rate < 1.0 / math.sqrt(2.0):
+        rate *= 2.0
+    if abs(rate - 1.0) < MIN_STRETCH or not (1.0 / max_stretch <= rate <= max_stretch):
+        return None
+    return rate
+
+def stretch_key(stem_hash, source_tempo, target_tempo, method,
+                sample_rate=CANONICAL_SAMPLE_RATE, channels=CANONICAL_CHANNELS, seconds=STRETCH_SECONDS):
+    """
+    Cache key for one stretched stem head.
+    """
+    payload = {
+        "stem": stem_hash,
+        "tempo": [round(float(source_tempo) / TEMPO_QUANTUM), round(float(target_tempo) / TEMPO_QUANTUM)],
+        "method": method,
+        "format": [sample_rate, channels],
+        "seconds": seconds,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def stretch_head(samples, rate, out_frames, method="resample"):
+    """
+    Time-stretches the start of a float32 (frames, channels) stem by rate and returns
+    the first out_frames + SEAM_FRAMES output frames (fewer if the stem is shorter).
+    """
+    n_out = min(out_frames + SEAM_FRAMES, int(len(samples) / rate))
+    if n_out <= 0:
+        return np.zeros((0, samples.shape[1]), dtype=np.float32)
+    if method == "phase_vocoder":
+        import librosa
+        # A little extra source so the vocoder's edge effects fall outside n_out
+        source = np.ascontiguousarray(samples[:int(math.ceil(n_out * rate)) + 4096].T)
+        stretched = librosa.effects.time_stretch(source, rate=rate).T[:n_out]
+        if len(stretched) < n_out:
+            stretched = np.pad(stretched, ((0, n_out - len(stretched)), (0, 0)))
+    else:
+        positions = np.arange(n_out, dtype=np.float64) * rate
+        frames = np.arange(len(samples), dtype=np.float64)
+        stretched = np.column_stack([np.interp(positions, frames, samples[:, c]) for c in range(samples.shape[1])])
+    return np.ascontiguousarray(stretched, dtype=np.float32)
+
+def splice(samples, stretched, rate, window_frames):
+    """
+    Stretched audio for the first window_frames output frames, then the original stem
+    from the source position the stretch reached (linear crossfade over SEAM_FRAMES).
+    """
+    window = min(int(window_frames), len(stretched) - SEAM_FRAMES)
+    if window <= 0:
+        return samples
+    resume = int(round(window * rate))
+    seam = max(0, min(SEAM_FRAMES, len(stretched) - window, len(samples) - resume))
+    ramp = np.linspace(0.0, 1.0, seam, dtype=np.float32)[:, None]
+    joined = stretched[window:window + seam] * (1.0 - ramp) + samples[resume:resume + seam] * ramp
+    return np.concatenate([stretched[:window], joined, samples[resume + seam:]])
+
+def _stretch_job(job):
+    """
+    Process-pool worker: decodes one stem to the canonical format, stretches its head
+    and stores it in the shared cache directory.
+    """
+    path, key, rate, method, cache_dir, max_bytes, seconds = job
+    samples, source_rate = load_wav(path)
+    samples = convert_format(samples, source_rate)
+    cache = RenderCache(cache_dir, max_bytes)
+    cache.put(key, stretch_head(samples, rate, int(seconds * CANONICAL_SAMPLE_RATE), method))
+    return key
+
+class TempoMatcher:
+    """
+    Tempo-matches incoming stems to the outgoing theme for render_transition(stretcher=...).
+    With compute_on_miss=False (production), stems whose stretch is not precomputed are
+    rendered unstretched instead of stretching on the request path.
+    """
+    def __init__(self, cache_dir=DEFAULT_STRETCH_DIR, max_bytes=DEFAULT_MAX_BYTES, method=None,
+                 compute_on_miss=True, seconds=STRETCH_SECONDS):
+        self.cache = RenderCache(cache_dir, max_bytes)
+        self.method = method or default_method()
+        self.compute_on_miss = compute_on_miss
+        self.seconds = seconds
+        self.skipped = 0
+
+    def plan(self, current_stems, next_stems, base_dir="audio_clips",
+             sample_rate=CANONICAL_SAMPLE_RATE, channels=CANONICAL_CHANNELS):
+        """
+        One entry per next stem: {"key", "rate", "source", "target", "method"} if it should
+        be stretched, else None. Returns None when nothing is stretched.
+        """
+        target = reference_tempo(current_stems, base_dir)
+        if target is None:
+            return None
+        analysis = get_analysis(base_dir)
+        catalog = get_catalog(base_dir)
+        plan = []
+        for stem in next_stems:
+            features = analysis.get(stem["filename"])
+            record = catalog.get(stem["filename"])
+            rate = stretch_rate(features.get("tempo") if features else None, target)
+            entry = None
+            if rate is not None and record is not None:
+                entry = {
+                    "key": stretch_key(record.content_hash, features["tempo"], target, self.method,
+                                       sample_rate, channels, self.seconds),
+                    "rate": rate,
+                    "source": round(features["tempo"], 1),
+                    "target": round(target, 1),
+                    "method": self.method,
+                }
+                if not self.compute_on_miss and entry["key"] not in self.cache:
+                    self.skipped += 1
+                    entry = None
+            plan.append(entry)
+        return plan if any(plan) else None
+
+    def apply(self, samples, entry, window_frames, sample_rate=CANONICAL_SAMPLE_RATE):
+        """
+        Returns the stem with its first window_frames tempo-matched (see splice()).
+        """
+        stretched = self.cache.get(entry["key"])
+        if stretched is None:
+            stretched = stretch_head(samples, entry["rate"], int(self.seconds * sample_rate), entry["method"])
+            self.cache.put(entry["key"], stretched)
+        return splice(samples, stretched, entry["rate"], window_frames)
+
+    def stats(self):
+        return dict(self.cache.stats(), skipped=self.skipped)
+
+def precompute(base_dir="audio_clips", cache_dir=DEFAULT_STRETCH_DIR, max_bytes=DEFAULT_MAX_BYTES,
+               workers=None, method=None, seconds=STRETCH_SECONDS):
+    """
+    Stretches every incoming stem to every other theme's tempo on a process pool,
+    skipping cached results. Returns counts of stretched and already cached heads, and of
+    (stem, theme) pairs skipped (tempo already matches, too far apart, or not analyzed).
+    """
+    method = method or default_method()
+    catalog = get_catalog(base_dir, max_age=0)
+    analysis = get_analysis(base_dir)
+    cache = RenderCache(cache_dir, max_bytes)
+    themes = catalog.themes()
+    targets = {theme: reference_tempo([{"filename": r.path} for r in catalog.stems(theme)], base_dir)
+               for theme in themes}
+    wanted, skipped = {}, 0
+    for outgoing in themes:
+        for incoming in themes:
+            if incoming == outgoing:
+                continue
+            for record in catalog.stems(incoming):
+                features = analysis.get(record.path)
+                rate = stretch_rate(features.get("tempo") if features else None, targets[outgoing])
+                if rate is None:
+                    skipped += 1
+                    continue
+                key = stretch_key(record.content_hash, features["tempo"], targets[outgoing], method,
+                                  seconds=seconds)
+                wanted[key] = (os.path.join(catalog.base_dir, record.path), key, rate, method,
+                               cache_dir, max_bytes, seconds)
+    jobs = {key: job for key, job in wanted.items() if key not in cache}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_stretch_job, jobs.values()))
+    return {"stretched": len(jobs), "cached": len(wanted) - len(jobs), "skipped": skipped}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute tempo-matched stem heads for crossfades.")
+    parser.add_argument("--base-dir", default="audio_clips", help="Stem root directory")
+    parser.add_argument("--cache-dir", default=DEFAULT_STRETCH_DIR, help="Stretch cache directory")
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Stretch cache size cap in MB")
+    parser.add_argument("--workers", type=int, default=None, help="Stretch processes (default: CPU count)")
+    parser.add_argument("--method", choices=["phase_vocoder", "resample"], default=None,
+                        help="Stretch algorithm (default: phase_vocoder if librosa is installed)")
+    args = parser.parse_args(argv)
+    result = precompute(args.base_dir, args.cache_dir, args.max_mb * 1024 * 1024, args.workers, args.method)
+    print(json.dumps(result))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
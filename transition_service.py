@@ -0,0 +1,329 @@
+# ---------------------------------------------------------------------------
+# transition_service.py
+#
+# Step-by-step overview:
+# 1. Defines SessionStore: per-client session state (current theme + transition history)
+#    in SQLite, so any worker process can serve any client's next request
+# 2. Defines validate_intent: the Streamlit app's checks on LLM output, plus stems that
+#    exist in the catalog and numeric gains/fades
+# 3. Defines create_app(): a Flask app exposing the demo's transition pipeline over HTTP
+#     - GET  /themes                         -> themes that have stems
+#     - POST /sessions                       -> new session (optional starting theme)
+#     - GET  /sessions/<id>                  -> session state and history
+#     - POST /sessions/<id>/transition       -> intent from folder, advisor recommendation,
+#                                               validation, beat-aligned schedule, render;
+#                                               returns stems, start offset + render URL
+#     - GET  /renders/<key>.wav              -> rendered transition as a 16-bit WAV
+#     - GET  /healthz                        -> cache statistics for this worker
+#     - GET  /metrics                        -> stage latency histograms, LLM sizes, cache
+#                                               hit rates (Prometheus text, this worker)
+# 4. Everything expensive is shared between workers through the filesystem:
+#     - decoded stems: StemStore(shared_dir=...) memory-maps one .npy per stem
+#     - LLM intents: ResponseCache with an SQLite disk tier
+#     - renders: RenderCache (content-addressed, locked .npy files)
+#     - tempo-matched stem heads: TempoMatcher's RenderCache under stretch/, filled
+#       ahead of time by `python time_stretch.py --cache-dir .service_state/stretch`;
+#       stems without a precomputed stretch are rendered at their own tempo
+#
+# Usage (one process per core, all sharing the caches under .service_state/):
+#   gunicorn -w 4 -b 0.0.0.0:8000 'transition_service:create_app()'
+# Stubbed LLM (no network, e.g. for load tests):
+#   gunicorn -w 4 -b 0.0.0.0:8000 'transition_service:create_app(stub_delay=0.3)'
+# ---------------------------------------------------------------------------
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from llm_advisor import (AsyncLLMAdvisor, LocalPlannerTransport,
+                         generate_mix_intent_from_folder, stem_dicts_from_mix_intent)
+from batch_runner import stem_dicts_from_intent
+from beat_scheduler import BOUNDARIES, fade_on_grid, schedule_transition
+from render_cache import RenderCache, transition_key
+from response_cache import ResponseCache
+from stem_catalog import get_catalog
+from stem_renderer import render_transition, wav_bytes
+from stem_store import StemStore
+from theme_registry import resolve_theme, theme_names
+from telemetry import get_telemetry, traced
+from time_stretch import TempoMatcher
+
+DEFAULT_STATE_DIR = ".service_state"
+
+_SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    current_theme TEXT,
+    history TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class SessionStore:
+    """
+    SQLite-backed per-client session state, safe to share between worker processes.
+    History entries have the same shape as the Streamlit app's st.session_state.history.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SESSION_SCHEMA)
+
+    def create(self, current_theme=None):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?)",
+                (session_id, current_theme, "[]", time.time()),
+            )
+            self._conn.commit()
+        return session_id
+
+    def get(self, session_id):
+        """
+        Returns {"session_id", "current_theme", "history"} or None for an unknown id.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT current_theme, history FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"session_id": session_id, "current_theme": row[0], "history": json.loads(row[1])}
+
+    def append_transition(self, session_id, entry):
+        """
+        Appends one history entry and moves the session to entry["to_theme"], atomically
+        with respect to other workers writing the same session.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT history FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                history = json.loads(row[0]) if row else []
+                history.append(entry)
+                self._conn.execute(
+                    "UPDATE sessions SET current_theme = ?, history = ?, updated_at = ? WHERE id = ?",
+                    (entry["to_theme"], json.dumps(history), time.time(), session_id),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+def _is_number(value):
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+def validate_intent(intent_dict, available_stems=None):
+    """
+    Returns an error message for an unusable next intent, or None if it can be rendered.
+    available_stems: stem names the next theme has in the catalog (None skips that check).
+    """
+    if not intent_dict or not intent_dict.get("activestems"):
+        return "No valid music stems found from the model."
+    gains = intent_dict.get("targetgains", {})
+    fades = intent_dict.get("fadedurations", {})
+    if any(val == '?' or val is None for val in gains.values()):
+        return "Some target gain values were not generated."
+    if available_stems is not None:
+        missing = [name for name in intent_dict["activestems"] if name not in available_stems]
+        if missing:
+            return f"Stems not available for this theme: {', '.join(map(str, missing))}"
+    for name in intent_dict["activestems"]:
+        for values, label in ((gains, "target gain"), (fades, "fade duration")):
+            if name in values and not _is_number(values[name]):
+                return f"Non-numeric {label} for stem {name}: {values[name]!r}"
+    return None
+
+def create_app(base_dir="audio_clips", state_dir=DEFAULT_STATE_DIR, advisor=None,
+               stub_delay=None, render=True):
+    """
+    Builds the transition service. Call once per worker process; all state that matters
+    across requests lives under state_dir and is shared by every worker pointed at it.
+    Pass an advisor to inject one, or stub_delay (seconds) to answer with the local
+    planner instead of calling Gemini.
+    """
+    # Flask is only needed once an app is built, not to import the module (import_budget.py)
+    from flask import Flask, Response, abort, jsonify, request
+
+    os.makedirs(state_dir, exist_ok=True)
+    sessions = SessionStore(os.path.join(state_dir, "sessions.sqlite"))
+    response_cache = ResponseCache(disk_path=os.path.join(state_dir, "llm_responses.sqlite"))
+    store = StemStore(shared_dir=os.path.join(state_dir, "stems"))
+    render_cache = RenderCache(os.path.join(state_dir, "renders"))
+    stretcher = TempoMatcher(os.path.join(state_dir, "stretch"), compute_on_miss=False)
+    telemetry = get_telemetry()
+    telemetry.register_cache("stems", store)
+    telemetry.register_cache("llm_responses", response_cache)
+    telemetry.register_cache("renders", render_cache)
+    telemetry.register_cache("stretch", stretcher)
+    if advisor is None:
+        transport = None
+        if stub_delay is not None:
+            transport = LocalPlannerTransport(base_dir, delay=stub_delay)
+        advisor = AsyncLLMAdvisor(transport=transport, cache=response_cache, base_dir=base_dir)
+
+    app = Flask(__name__)
+
+    def available_themes():
+        catalog_themes = set(get_catalog(base_dir).themes())
+        # Themes clients may request: the schema's themes, as in the Streamlit app
+        return [t for t in theme_names() if t in catalog_themes]
+
+    def known_theme(theme):
+        return theme in available_themes()
+
+    def canonical_theme(theme):
+        # Clients may send aliases or loose spellings ("Boss-Combat", "sneak")
+        return resolve_theme(theme) or theme
+
+    @app.get("/themes")
+    def list_themes():
+        return jsonify(themes=available_themes())
+
+    @app.post("/sessions")
+    def create_session():
+        body = request.get_json(silent=True) or {}
+        theme = body.get("theme")
+        if theme is not None:
+            theme = canonical_theme(theme)
+        if theme is not None and not known_theme(theme):
+            return jsonify(error=f"Unknown theme: {theme}"), 404
+        session_id = sessions.create(theme)
+        return jsonify(session_id=session_id, current_theme=theme), 201
+
+    @app.get("/sessions/<session_id>")
+    def get_session(session_id):
+        state = sessions.get(session_id)
+        if state is None:
+            abort(404)
+        return jsonify(state)
+
+    @app.post("/sessions/<session_id>/transition")
+    @traced("transition")
+    def transition(session_id):
+        state = sessions.get(session_id)
+        if state is None:
+            abort(404)
+        body = request.get_json(silent=True) or {}
+        current_theme = canonical_theme(body.get("current_theme") or state["current_theme"])
+        if not body.get("next_theme"):
+            return jsonify(error="next_theme is required"), 400
+        next_theme = canonical_theme(body.get("next_theme"))
+        for theme in (current_theme, next_theme):
+            if not known_theme(theme):
+                return jsonify(error=f"Unknown theme: {theme}"), 404
+
+        # Step 1: currently active stems (outgoing theme)
+        with telemetry.span("transition.folder_scan"):
+            current_stem_dicts = stem_dicts_from_mix_intent(
+                generate_mix_intent_from_folder(current_theme, base_dir=base_dir)
+            )
+        # Step 2: advisor recommendation for the incoming theme (cache / LLM / fallback)
+        with telemetry.span("transition.advisor"):
+            llm_output = advisor.recommend_sync(
+                session_log=state["history"],
+                current_state=current_stem_dicts,
+                next_theme=next_theme,
+                user_query=body.get("user_query"),
+            )
+        intent_dict = llm_output.get("next_intent", {})
+        # Step 3: validation (stems must exist, gains/fades must be numbers) before anything
+        # is scheduled, rendered or written to the session
+        available_stems = {record.stem_name for record in get_catalog(base_dir).stems(next_theme)}
+        error_msg = validate_intent(intent_dict, available_stems)
+        if error_msg:
+            return jsonify(error=error_msg, source=llm_output.get("source")), 422
+        # Step 4: next stems, render, then history
+        next_stem_dicts = [
+            dict(stem, targetgain=float(stem["targetgain"]), fadeduration=float(stem["fadeduration"]))
+            for stem in stem_dicts_from_intent(intent_dict, next_theme)
+        ]
+        boundary = body.get("boundary", "bar")
+        if boundary not in BOUNDARIES:
+            return jsonify(error=f"Unknown boundary: {boundary}"), 400
+        position = body.get("position") or 0.0
+        if not _is_number(position):
+            return jsonify(error=f"Invalid position: {position!r}"), 400
+        with telemetry.span("transition.schedule"):
+            schedule = schedule_transition(current_stem_dicts, next_stem_dicts, base_dir,
+                                           position=float(position),
+                                           boundary=boundary, sample_rate=store.sample_rate)
+        current_stem_dicts = schedule["current_stems"]
+        next_stem_dicts = schedule["next_stems"]
+        start_offset = schedule["start_offset"]
+        fade_sec = round(next_stem_dicts[0]["fadeduration"], 2)
+        result = {
+            "from_theme": current_theme,
+            "to_theme": next_theme,
+            "current_stems": current_stem_dicts,
+            "next_stems": next_stem_dicts,
+            "start_offset": start_offset,
+            "sample_rate": store.sample_rate,
+            "explanation": llm_output.get("explanation", ""),
+            "source": llm_output.get("source"),
+        }
+        if render:
+            # Identical transitions (same stem content, quantized gains/fades) render once
+            # The WAV starts at the client's position (outgoing stems continue from there),
+            # so its fades begin start_offset frames in, on the same boundary as the JSON
+            position_frames = schedule["position_frames"]
+            if not fade_on_grid(schedule, base_dir):
+                return jsonify(error="Scheduled fade is not on the reference stem's grid"), 500
+            tempo_plan = stretcher.plan(current_stem_dicts, next_stem_dicts, base_dir,
+                                        store.sample_rate, store.channels)
+            key = transition_key(current_stem_dicts, next_stem_dicts, base_dir,
+                                 None, store.sample_rate, store.channels, start_offset, tempo_plan,
+                                 position_frames)
+            with telemetry.span("transition.render"):
+                render_transition(current_stem_dicts, next_stem_dicts, base_dir,
+                                  store=store, cache=render_cache, start_offset=start_offset,
+                                  stretcher=stretcher, tempo_plan=tempo_plan,
+                                  position_frames=position_frames)
+            result["render_url"] = f"/renders/{key}.wav"
+        # Only a transition that was fully produced moves the session to the next theme
+        with telemetry.span("transition.history"):
+            sessions.append_transition(session_id, {
+                "timestamp": time.time(),
+                "from_theme": current_theme,
+                "from_stem_dicts": current_stem_dicts,
+                "to_theme": next_theme,
+                "to_stem_dicts": next_stem_dicts,
+                "Transition": f"{current_theme} → {next_theme} | Crossfade over {fade_sec}s",
+            })
+        return jsonify(result)
+
+    @app.get("/renders/<key>.wav")
+    def get_render(key):
+        mix = render_cache.get(key) if key.isalnum() else None
+        if mix is None:
+            abort(404)
+        return Response(wav_bytes(mix, store.sample_rate), mimetype="audio/wav",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+    @app.get("/healthz")
+    def healthz():
+        return jsonify(
+            pid=os.getpid(),
+            stem_store=store.stats(),
+            response_cache=response_cache.stats(),
+            render_cache=render_cache.stats(),
+            stretch_cache=stretcher.stats(),
+            slo=telemetry.slo_report(),
+        )
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(telemetry.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    return app